@@ -2,17 +2,26 @@ import os
 from PIL import Image, ImageDraw, ImageFont
 import argparse
 import concurrent.futures
+import functools
 import multiprocessing
 
+FONT_PATH = "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf"  # Adjust the path if needed
+FONT_SIZE = 36
+
+
+@functools.lru_cache(maxsize=None)
+def get_font(font_path=FONT_PATH, size=FONT_SIZE):
+    """Load a TrueType font once per process and reuse it for every label."""
+    return ImageFont.truetype(font_path, size)
+
 
 def add_label(image_path, step):
     """Add a label with the step number to the image."""
     image = Image.open(image_path)
     draw = ImageDraw.Draw(image)
 
-    # Load a larger, bold font
-    font_path = "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf"  # Adjust the path if needed
-    font = ImageFont.truetype(font_path, 36)  # Use a larger font size
+    # Larger, bold font, cached after the first call in this worker
+    font = get_font()
 
     # Prepare the label text
     label = f"Step {step}"
@@ -38,15 +47,33 @@ def add_label(image_path, step):
     return image
 
 
-def process_images(file_step_pairs):
-    images = []
-    for file, step in file_step_pairs:
-        image_with_label = add_label(file, step)
-        images.append(image_with_label)
-    return images
+def label_chunk(sample_group, start, file_step_pairs):
+    """Label a run of consecutive frames of one group in a worker process.
+
+    Frames are reduced to an adaptive palette here, as the GIF encoder would
+    do anyway, so a third of the bytes are pickled back to the parent.
+    """
+    frames = [
+        add_label(file, step).convert("P", palette=Image.Palette.ADAPTIVE)
+        for file, step in file_step_pairs
+    ]
+    return sample_group, start, frames
+
+
+def save_group_gif(images, output_file, sample_group, duration):
+    """Encode the labeled frames of one sample group as a GIF."""
+    output_path = f"{output_file}_group_{sample_group}.gif"
+    images[0].save(
+        output_path,
+        save_all=True,
+        append_images=images[1:],
+        duration=duration,
+        loop=0,
+    )
+    print(f"GIF saved for group {sample_group} as {output_path}")
 
 
-def create_gif(input_folder, output_file, duration=500):
+def create_gif(input_folder, output_file, duration=500, max_workers=None):
     # Dictionary to hold images for each sample group
     sample_groups = {}
 
@@ -64,25 +91,42 @@ def create_gif(input_folder, output_file, duration=500):
                 (os.path.join(input_folder, filename), step)
             )
 
-    # Process images using multithreading
-    max_cores = multiprocessing.cpu_count() - 1  # Use max cores minus 1
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_cores) as executor:
-        for sample_group, files in sample_groups.items():
-            # Process images in parallel
-            future = executor.submit(process_images, files)
-            images = future.result()
-
-            # Save the images as a GIF
-            images[0].save(
-                f"{output_file}_group_{sample_group}.gif",
-                save_all=True,
-                append_images=images[1:],
-                duration=duration,
-                loop=0,
-            )
-            print(
-                f"GIF saved for group {sample_group} as {output_file}_group_{sample_group}.gif"
-            )
+    if not sample_groups:
+        print(f"No training samples found in {input_folder}")
+        return
+
+    # Label frames in chunks across the whole pool, whatever the number of groups
+    if max_workers is None:
+        max_workers = max(1, multiprocessing.cpu_count() - 1)  # Use max cores minus 1
+    total = sum(len(files) for files in sample_groups.values())
+    chunk_size = max(1, total // (max_workers * 4))
+
+    frames = {group: [None] * len(files) for group, files in sample_groups.items()}
+    remaining = {group: len(files) for group, files in sample_groups.items()}
+
+    # GIFs are encoded on a separate thread so collecting other groups' frames never stalls
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=max_workers
+    ) as executor, concurrent.futures.ThreadPoolExecutor(max_workers=1) as encoder:
+        futures = [
+            executor.submit(label_chunk, sample_group, start, files[start : start + chunk_size])
+            for sample_group, files in sample_groups.items()
+            for start in range(0, len(files), chunk_size)
+        ]
+        encodes = []
+        for future in concurrent.futures.as_completed(futures):
+            sample_group, start, chunk = future.result()
+            frames[sample_group][start : start + len(chunk)] = chunk
+            remaining[sample_group] -= len(chunk)
+
+            if remaining[sample_group] == 0:
+                encodes.append(
+                    encoder.submit(
+                        save_group_gif, frames.pop(sample_group), output_file, sample_group, duration
+                    )
+                )
+        for encode in encodes:
+            encode.result()
 
 
 if __name__ == "__main__":
@@ -92,7 +136,13 @@ if __name__ == "__main__":
     parser.add_argument(
         "--duration", type=int, default=500, help="Duration per image in milliseconds."
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Number of worker processes (default: CPU count minus 1).",
+    )
 
     args = parser.parse_args()
 
-    create_gif(args.input_folder, args.output_file, args.duration)
+    create_gif(args.input_folder, args.output_file, args.duration, args.workers)
@@ -1,9 +1,37 @@
 import json
 import os
+import threading
 import openai
 from dotenv import load_dotenv
 from groq import Groq
 
+class _LimitedCompletions:
+    def __init__(self, completions, semaphore):
+        self._completions = completions
+        self._semaphore = semaphore
+
+    def create(self, *args, **kwargs):
+        with self._semaphore:
+            return self._completions.create(*args, **kwargs)
+
+
+class _LimitedChat:
+    def __init__(self, chat, semaphore):
+        self.completions = _LimitedCompletions(chat.completions, semaphore)
+
+
+class LimitedClient:
+    """Wraps an OpenAI-compatible client so at most max_in_flight chat requests run at once."""
+
+    def __init__(self, client, max_in_flight):
+        self._client = client
+        self.max_in_flight = max_in_flight
+        self.chat = _LimitedChat(client.chat, threading.BoundedSemaphore(max_in_flight))
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
 class Antares:
     def __init__(self, config_path="antares.json"):
         load_dotenv()
@@ -34,3 +62,7 @@ class Antares:
             return {}  # Return an empty dictionary or a default configuration
         with open(full_config_path, "r") as config_file:
             return json.load(config_file)
+
+    def limited(self, client, max_in_flight):
+        """Return client with a cap on concurrent chat completion requests."""
+        return LimitedClient(client, max_in_flight)
@@ -0,0 +1,224 @@
+import argparse
+import difflib
+import os
+import re
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from tqdm import tqdm
+
+
+# Temp files from atomic_write; never picked up as captions
+TEMP_PREFIX = ".tmp_"
+
+
+def prepend_op(text):
+    return lambda content: text + content
+
+
+def replace_op(old, new):
+    return lambda content: content.replace(old, new)
+
+
+def regex_op(pattern, repl):
+    compiled = re.compile(pattern)
+    return lambda content: compiled.sub(repl, content)
+
+
+def read_text(file_path, fix_encoding=False):
+    """Read a caption as UTF-8, falling back to latin-1 when fix_encoding is set."""
+    with open(file_path, "rb") as file:
+        data = file.read()
+    try:
+        return data.decode("utf-8"), False
+    except UnicodeDecodeError:
+        if not fix_encoding:
+            raise
+        # latin-1 can decode every byte sequence
+        return data.decode("latin-1"), True
+
+
+def atomic_write(file_path, content):
+    """Write content via a temp file in the same folder and rename it into place."""
+    directory = os.path.dirname(os.path.abspath(file_path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=TEMP_PREFIX, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8", newline="") as file:
+            file.write(content)
+        if os.path.exists(file_path):
+            os.chmod(temp_path, os.stat(file_path).st_mode & 0o7777)
+        os.replace(temp_path, file_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def apply_operations(content, operations):
+    for operation in operations:
+        content = operation(content)
+    return content
+
+
+def edit_file(file_path, operations, fix_encoding=False, dry_run=False):
+    """Apply all operations with one read and (at most) one atomic write.
+
+    Returns a dict with the path, whether it changed, and a unified diff when
+    running dry.
+    """
+    result = {"path": file_path, "changed": False, "diff": None, "error": None}
+    try:
+        original, reencoded = read_text(file_path, fix_encoding)
+        content = apply_operations(original, operations)
+        result["changed"] = content != original or reencoded
+
+        if result["changed"]:
+            if dry_run:
+                result["diff"] = "".join(
+                    difflib.unified_diff(
+                        original.splitlines(keepends=True),
+                        content.splitlines(keepends=True),
+                        fromfile=file_path,
+                        tofile=file_path,
+                    )
+                )
+                if reencoded and not result["diff"]:
+                    result["diff"] = f"{file_path}: re-encode to UTF-8\n"
+            else:
+                atomic_write(file_path, content)
+    except (OSError, UnicodeDecodeError, re.error) as e:
+        result["error"] = str(e)
+    return result
+
+
+def list_txt_files(folder_path, extension=".txt"):
+    with os.scandir(folder_path) as entries:
+        return sorted(
+            entry.path
+            for entry in entries
+            if entry.name.lower().endswith(extension)
+            and not entry.name.startswith(TEMP_PREFIX)
+            and entry.is_file()
+        )
+
+
+def read_folder(folder_path, fix_encoding=False, workers=None):
+    """Yield (path, content) for every .txt file, reading ahead on a thread pool."""
+    files = list_txt_files(folder_path)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        contents = executor.map(lambda path: read_text(path, fix_encoding)[0], files)
+        yield from zip(files, contents)
+
+
+def edit_folder(
+    folder_path,
+    operations,
+    fix_encoding=False,
+    dry_run=False,
+    workers=None,
+    show_progress=True,
+):
+    """Run edit_file over every .txt file in folder_path on a thread pool."""
+    files = list_txt_files(folder_path)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(
+            lambda path: edit_file(path, operations, fix_encoding, dry_run), files
+        )
+        if show_progress:
+            results = tqdm(results, total=len(files), desc="Editing captions")
+        return list(results)
+
+
+def print_summary(results, dry_run=False, max_diffs=20):
+    changed = [r for r in results if r["changed"] and not r["error"]]
+    errors = [r for r in results if r["error"]]
+
+    if dry_run:
+        for result in changed[:max_diffs]:
+            diff = result["diff"]
+            print(diff, end="" if diff.endswith("\n") else "\n")
+        if len(changed) > max_diffs:
+            print(f"... and {len(changed) - max_diffs} more changed files")
+
+    for result in errors:
+        print(f"Error in {os.path.basename(result['path'])}: {result['error']}")
+
+    verb = "Would change" if dry_run else "Changed"
+    print(f"{verb} {len(changed)} of {len(results)} files ({len(errors)} errors)")
+
+
+class _OperationAction(argparse.Action):
+    """Collect operations in the order they were given on the command line."""
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        operations = getattr(namespace, self.dest) or []
+        operations.append((option_string.lstrip("-"), values))
+        setattr(namespace, self.dest, operations)
+
+
+def build_operations(specs):
+    builders = {"prepend": prepend_op, "replace": replace_op, "regex": regex_op}
+    operations = []
+    for name, values in specs:
+        values = values if isinstance(values, list) else [values]
+        operations.append(builders[name](*values))
+    return operations
+
+
+def add_operation_arguments(parser):
+    """Add the --prepend/--replace/--regex/--fix-encoding options to a parser."""
+    parser.add_argument(
+        "--prepend", dest="operations", action=_OperationAction, metavar="TEXT",
+        help="Prepend TEXT to each caption",
+    )
+    parser.add_argument(
+        "--replace", dest="operations", action=_OperationAction, nargs=2,
+        metavar=("OLD", "NEW"), help="Replace OLD with NEW",
+    )
+    parser.add_argument(
+        "--regex", dest="operations", action=_OperationAction, nargs=2,
+        metavar=("PATTERN", "REPL"), help="Regex substitution",
+    )
+    parser.add_argument(
+        "--fix-encoding", action="store_true",
+        help="Read non-UTF-8 files as latin-1 and rewrite them as UTF-8",
+    )
+    parser.add_argument("--dry-run", action="store_true", help="Show a diff summary without writing")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Apply a sequence of edits to every .txt caption in a folder."
+    )
+    parser.add_argument("folder_path", help="Folder containing .txt files, or a caption store")
+    add_operation_arguments(parser)
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker threads")
+    args = parser.parse_args()
+
+    operations = build_operations(args.operations or [])
+    if not operations and not args.fix_encoding:
+        parser.error("no operations given")
+
+    # Imported here because caption_store builds on this module
+    from caption_store import edit_store, is_caption_store
+
+    if is_caption_store(args.folder_path):
+        if args.fix_encoding:
+            # Stored captions are already decoded text
+            parser.error("--fix-encoding only applies to .txt folders, not caption stores")
+        if not operations:
+            parser.error("no operations given")
+        print_summary(edit_store(args.folder_path, operations, args.dry_run), args.dry_run)
+        return
+
+    if not os.path.isdir(args.folder_path):
+        print(f"Error: {args.folder_path} is not a valid directory.")
+        return
+
+    results = edit_folder(
+        args.folder_path, operations, args.fix_encoding, args.dry_run, args.workers
+    )
+    print_summary(results, args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,7 @@ import os
 import argparse
 import base64
 from antares import Antares
+from caption_store import CaptionStore
 from tqdm import tqdm
 import concurrent.futures
 
@@ -50,16 +51,53 @@ def describe_image(img_path, prompt, model):
 
 def process_single_image(img_data):
     """Process a single image with the given parameters"""
-    img_path, prompt, model, output_format = img_data
+    img_path, prompt, model, output_format, to_store = img_data
     filename = os.path.basename(img_path)
     caption = describe_image(img_path, prompt, model)
+    if to_store:
+        # The caller writes to the store from the main thread
+        return filename, caption
     output_path = os.path.splitext(img_path)[0] + f".{output_format}"
     with open(output_path, "w", encoding="utf-8") as output_file:
         output_file.write(caption)
     return filename, output_path
 
 
-def process_images(input_folder, output_format, prompt, model, test_mode=False, num_threads=4):
+def caption_to_store(img_data, num_threads, store_path, batch_size=20):
+    """Caption images in parallel, committing to the store every batch_size captions.
+
+    Captions already paid for survive a crash or Ctrl-C. Returns how many were stored.
+    """
+    stored = 0
+    batch = []
+    with CaptionStore(store_path) as store, concurrent.futures.ThreadPoolExecutor(
+        max_workers=num_threads
+    ) as executor:
+        futures = [executor.submit(process_single_image, data) for data in img_data]
+        try:
+            for future in tqdm(
+                concurrent.futures.as_completed(futures),
+                total=len(futures),
+                desc="Processing images",
+            ):
+                filename, caption = future.result()
+                if caption is None:
+                    continue
+                batch.append((os.path.splitext(filename)[0], caption))
+                if len(batch) >= batch_size:
+                    store.put_many(batch)
+                    stored += len(batch)
+                    batch = []
+        finally:
+            for future in futures:
+                future.cancel()
+            if batch:
+                store.put_many(batch)
+                stored += len(batch)
+    return stored
+
+
+def process_images(input_folder, output_format, prompt, model, test_mode=False, num_threads=4, store_path=None):
     image_files = [
         f
         for f in os.listdir(input_folder)
@@ -71,10 +109,15 @@ def process_images(input_folder, output_format, prompt, model, test_mode=False,
 
     # Prepare the arguments for each image
     img_data = [
-        (os.path.join(input_folder, filename), prompt, model, output_format)
+        (os.path.join(input_folder, filename), prompt, model, output_format, store_path is not None)
         for filename in image_files
     ]
 
+    if store_path is not None:
+        stored = caption_to_store(img_data, num_threads, store_path)
+        print(f"Saved {stored} of {len(img_data)} captions to {store_path}")
+        return
+
     # Use ThreadPoolExecutor to process images in parallel
     with concurrent.futures.ThreadPoolExecutor(max_workers=num_threads) as executor:
         results = list(tqdm(
@@ -82,7 +125,7 @@ def process_images(input_folder, output_format, prompt, model, test_mode=False,
             total=len(img_data),
             desc="Processing images"
         ))
-    
+
     for filename, output_path in results:
         print(f"Caption for {filename} saved to {output_path}")
 
@@ -149,6 +192,12 @@ def main():
         default=10,
         help="Number of threads to use for parallel processing (default: 10)",
     )
+    parser.add_argument(
+        "--store",
+        type=str,
+        default=None,
+        help="Write captions into this caption store (see caption_store.py) instead of sidecar files",
+    )
     args = parser.parse_args()
 
     global DEFAULT_SYSTEM_PROMPT
@@ -172,7 +221,7 @@ def main():
 
     process_images(
         args.input_folder, args.output_format, prompt, args.model, args.test,
-        num_threads=args.threads
+        num_threads=args.threads, store_path=args.store
     )
 
 
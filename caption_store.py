@@ -0,0 +1,174 @@
+import argparse
+import difflib
+import os
+import sqlite3
+from tqdm import tqdm
+
+from caption_edit import (
+    add_operation_arguments,
+    apply_operations,
+    atomic_write,
+    build_operations,
+    list_txt_files,
+    print_summary,
+    read_folder,
+)
+
+SQLITE_MAGIC = b"SQLite format 3\x00"
+
+
+def is_caption_store(path):
+    """True if path is an existing caption store file (rather than a folder)."""
+    if not os.path.isfile(path):
+        return False
+    with open(path, "rb") as file:
+        return file.read(len(SQLITE_MAGIC)) == SQLITE_MAGIC
+
+
+class CaptionStore:
+    """Captions packed into one SQLite file, keyed by image stem."""
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS captions (stem TEXT PRIMARY KEY, caption TEXT NOT NULL)"
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM captions").fetchone()[0]
+
+    def get(self, stem, default=None):
+        row = self.conn.execute(
+            "SELECT caption FROM captions WHERE stem = ?", (stem,)
+        ).fetchone()
+        return row[0] if row else default
+
+    def put(self, stem, caption):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO captions (stem, caption) VALUES (?, ?)", (stem, caption)
+        )
+
+    def put_many(self, items):
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO captions (stem, caption) VALUES (?, ?)", items
+            )
+
+    def items(self):
+        """Iterate (stem, caption) pairs in stem order with a single sequential scan."""
+        return self.conn.execute("SELECT stem, caption FROM captions ORDER BY stem")
+
+
+def pack(folder_path, store_path, workers=None, batch_size=10000):
+    """Import every sidecar .txt in folder_path into the store."""
+    total = len(list_txt_files(folder_path))
+    batch = []
+    with CaptionStore(store_path) as store:
+        for path, content in tqdm(
+            read_folder(folder_path, workers=workers), total=total, desc="Packing captions"
+        ):
+            batch.append((os.path.splitext(os.path.basename(path))[0], content))
+            if len(batch) >= batch_size:
+                store.put_many(batch)
+                batch.clear()
+        store.put_many(batch)
+        print(f"Packed {total} captions into {store_path} ({len(store)} total)")
+
+
+def unpack(store_path, folder_path, extension="txt"):
+    """Export the store back to sidecar files next to the images."""
+    os.makedirs(folder_path, exist_ok=True)
+    count = 0
+    with CaptionStore(store_path) as store:
+        for stem, caption in tqdm(store.items(), total=len(store), desc="Exporting captions"):
+            atomic_write(os.path.join(folder_path, f"{stem}.{extension}"), caption)
+            count += 1
+    print(f"Exported {count} captions to {folder_path}")
+
+
+def edit_store(store_path, operations, dry_run=False):
+    """Apply caption_edit operations to every caption in one scan and one transaction."""
+    results = []
+    updates = []
+    with CaptionStore(store_path) as store:
+        for stem, original in store.items().fetchall():
+            content = apply_operations(original, operations)
+            result = {"path": stem, "changed": content != original, "diff": None, "error": None}
+            if result["changed"]:
+                if dry_run:
+                    result["diff"] = "".join(
+                        difflib.unified_diff(
+                            original.splitlines(keepends=True),
+                            content.splitlines(keepends=True),
+                            fromfile=stem,
+                            tofile=stem,
+                        )
+                    )
+                else:
+                    updates.append((stem, content))
+            results.append(result)
+        if updates:
+            store.put_many(updates)
+    return results
+
+
+def iter_captions(source, workers=None):
+    """Yield caption texts from either a caption store or a folder of sidecars."""
+    if is_caption_store(source):
+        with CaptionStore(source) as store:
+            for _, caption in store.items():
+                yield caption
+    else:
+        for _, content in read_folder(source, workers=workers):
+            yield content
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Pack sidecar .txt captions into a single SQLite store and back."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    pack_parser = subparsers.add_parser("pack", help="Import sidecar .txt files into a store")
+    pack_parser.add_argument("folder_path", help="Folder containing .txt captions")
+    pack_parser.add_argument("store_path", help="Caption store file to create or update")
+    pack_parser.add_argument("--workers", type=int, default=None, help="Number of reader threads")
+
+    unpack_parser = subparsers.add_parser("unpack", help="Export a store to sidecar .txt files")
+    unpack_parser.add_argument("store_path", help="Caption store file")
+    unpack_parser.add_argument("folder_path", help="Folder to write .txt captions into")
+
+    edit_parser = subparsers.add_parser("edit", help="Edit every caption in a store")
+    edit_parser.add_argument("store_path", help="Caption store file")
+    add_operation_arguments(edit_parser)
+
+    args = parser.parse_args()
+
+    if args.command == "pack":
+        pack(args.folder_path, args.store_path, args.workers)
+    elif args.command == "unpack":
+        unpack(args.store_path, args.folder_path)
+    else:
+        operations = build_operations(args.operations or [])
+        if not operations:
+            edit_parser.error("no operations given")
+        if args.fix_encoding:
+            # Stored captions are already decoded text
+            edit_parser.error("--fix-encoding only applies to .txt folders, not caption stores")
+        results = edit_store(args.store_path, operations, args.dry_run)
+        print_summary(results, args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,76 @@
 import os
 import argparse
+import csv
 import logging
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from PIL import Image
 from tqdm import tqdm
 
+# Pillow PNG save options for each --compression preset
+COMPRESSION_PRESETS = {
+    "fast": {"compress_level": 1},
+    "default": {"compress_level": 6},
+    "max": {"compress_level": 9, "optimize": True},
+}
 
-def convert_to_png(input_folder, overwrite):
+
+def is_up_to_date(file_path, png_path):
+    return os.path.exists(png_path) and os.path.getmtime(png_path) >= os.path.getmtime(file_path)
+
+
+def convert_file(file_path, overwrite, compression="default"):
+    """Convert one image to PNG and return its size/time stats."""
+    filename = os.path.basename(file_path)
+    name, ext = os.path.splitext(file_path)
+    new_file_path = f"{name}.png"
+    result = {
+        "file": filename,
+        "output": os.path.basename(new_file_path),
+        "status": "converted",
+        "input_bytes": os.path.getsize(file_path),
+        "output_bytes": 0,
+        "seconds": 0.0,
+        "removed_original": False,
+    }
+
+    start = time.perf_counter()
+    # Write next to the target and swap it in, so an interrupted save never
+    # leaves a truncated PNG that later looks up to date
+    fd, temp_path = tempfile.mkstemp(prefix=".tmp_", suffix=".png.part", dir=os.path.dirname(new_file_path) or ".")
+    try:
+        with os.fdopen(fd, "wb") as out, Image.open(file_path) as img:
+            img.save(out, "PNG", **COMPRESSION_PRESETS[compression])
+        # mkstemp creates the file private; give the PNG the source's permissions
+        os.chmod(temp_path, os.stat(file_path).st_mode & 0o7777)
+        os.replace(temp_path, new_file_path)
+    except (IOError, OSError):
+        os.remove(temp_path)
+        result["status"] = "invalid"
+        return result
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    result["seconds"] = time.perf_counter() - start
+    result["output_bytes"] = os.path.getsize(new_file_path)
+
+    if overwrite and ext.lower() != ".png":
+        os.remove(file_path)
+        result["removed_original"] = True
+
+    return result
+
+
+def write_report(report_path, results):
+    fields = ["file", "output", "status", "input_bytes", "output_bytes", "seconds", "removed_original"]
+    with open(report_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(results)
+
+
+def convert_to_png(input_folder, overwrite, compression="default", workers=None, force=False, report_path=None):
     # Define a list of common image extensions
     image_extensions = ('.jpg', '.jpeg', '.bmp', '.gif', '.tiff', '.webp')
     
@@ -15,25 +80,59 @@ def convert_to_png(input_folder, overwrite):
         f.lower().endswith(image_extensions)
     ]
 
-    with tqdm(total=len(files), desc="Converting images") as pbar:
-        for filename in files:
-            file_path = os.path.join(input_folder, filename)
-            try:
-                with Image.open(file_path) as img:
-                    name, ext = os.path.splitext(filename)
-                    new_filename = f"{name}.png"
-                    new_file_path = os.path.join(input_folder, new_filename)
+    # Skip sources whose PNG is already newer
+    pending = []
+    results = []
+    for filename in files:
+        file_path = os.path.join(input_folder, filename)
+        png_path = os.path.splitext(file_path)[0] + ".png"
+        if not force and is_up_to_date(file_path, png_path):
+            logging.debug(f"Up to date: {filename}")
+            results.append({"file": filename, "output": os.path.basename(png_path), "status": "skipped"})
+        else:
+            pending.append(file_path)
+
+    if results:
+        logging.info(f"Skipping {len(results)} files with an up-to-date PNG")
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(convert_file, file_path, overwrite, compression)
+            for file_path in pending
+        ]
+        with tqdm(total=len(futures), desc="Converting images") as pbar:
+            for future in as_completed(futures):
+                result = future.result()
+                results.append(result)
 
-                    img.save(new_file_path, "PNG")
-                    logging.info(f"Converted: {filename} -> {new_filename}")
+                if result["status"] == "invalid":
+                    logging.warning(f"Skipped: {result['file']} (not a valid image file)")
+                else:
+                    logging.info(
+                        f"Converted: {result['file']} -> {result['output']} "
+                        f"({result['input_bytes']} -> {result['output_bytes']} bytes, {result['seconds']:.3f}s)"
+                    )
+                    if result["removed_original"]:
+                        logging.info(f"Removed original file: {result['file']}")
 
-                    if overwrite and ext.lower() != ".png":
-                        os.remove(file_path)
-                        logging.info(f"Removed original file: {filename}")
-            except (IOError, OSError):
-                logging.warning(f"Skipped: {filename} (not a valid image file)")
+                pbar.update(1)
 
-            pbar.update(1)
+    converted = [r for r in results if r["status"] == "converted"]
+    if converted:
+        input_bytes = sum(r["input_bytes"] for r in converted)
+        output_bytes = sum(r["output_bytes"] for r in converted)
+        seconds = sum(r["seconds"] for r in converted)
+        logging.info(
+            f"{len(converted)} files, {input_bytes} -> {output_bytes} bytes "
+            f"({output_bytes / max(input_bytes, 1):.2f}x), {seconds:.2f}s of encode time "
+            f"with '{compression}' compression"
+        )
+
+    if report_path:
+        write_report(report_path, results)
+        logging.info(f"Report written to {report_path}")
+
+    return results
 
 
 def main():
@@ -44,6 +143,21 @@ def main():
     parser.add_argument(
         "--overwrite", action="store_true", help="Overwrite original files"
     )
+    parser.add_argument(
+        "--compression",
+        default="default",
+        choices=list(COMPRESSION_PRESETS),
+        help="PNG compression preset: fast (level 1), default (level 6) or max (level 9 + optimize)",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=None, help="Number of worker processes (default: CPU count)"
+    )
+    parser.add_argument(
+        "--force", action="store_true", help="Convert even if the PNG is newer than the source"
+    )
+    parser.add_argument(
+        "--report", default=None, help="Write per-file bytes and timings to this CSV file"
+    )
     parser.add_argument(
         "--log",
         default="info",
@@ -62,9 +176,16 @@ def main():
         return
 
     logging.info(f"Starting conversion in folder: {args.input_folder}")
-    convert_to_png(args.input_folder, args.overwrite)
+    convert_to_png(
+        args.input_folder,
+        args.overwrite,
+        args.compression,
+        args.workers,
+        args.force,
+        args.report,
+    )
     logging.info("Conversion completed")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
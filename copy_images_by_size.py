@@ -1,35 +1,242 @@
 import argparse
 import os
+import sqlite3
+import struct
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
 import shutil
 from tqdm import tqdm
 
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".gif", ".bmp", ".webp")
+INDEX_NAME = ".image_size_index.sqlite"
+FICLONE = 0x40049409  # Linux ioctl used for reflink copies
 
-def copy_images_by_size(input_folder, target_size, output_folder):
+
+def _jpeg_size(f):
+    f.seek(2)
+    while True:
+        marker = f.read(2)
+        while marker and marker[0] != 0xFF:
+            marker = marker[1:] + f.read(1)
+        if len(marker) < 2:
+            return None
+        code = marker[1]
+        if code == 0xFF:
+            f.seek(-1, os.SEEK_CUR)
+            continue
+        if code in (0xD8, 0x01) or 0xD0 <= code <= 0xD7:
+            continue
+        length_bytes = f.read(2)
+        if len(length_bytes) < 2:
+            return None
+        (length,) = struct.unpack(">H", length_bytes)
+        # SOF0..SOF15, excluding DHT (C4), JPG (C8) and DAC (CC)
+        if 0xC0 <= code <= 0xCF and code not in (0xC4, 0xC8, 0xCC):
+            data = f.read(5)
+            if len(data) < 5:
+                return None
+            height, width = struct.unpack(">HH", data[1:5])
+            return width, height
+        f.seek(length - 2, os.SEEK_CUR)
+
+
+def read_image_size(path):
+    """Read (width, height) from the file header without decoding pixel data."""
+    with open(path, "rb") as f:
+        head = f.read(32)
+
+        if head.startswith(b"\x89PNG\r\n\x1a\n") and head[12:16] == b"IHDR":
+            return struct.unpack(">II", head[16:24])
+
+        if head[:6] in (b"GIF87a", b"GIF89a"):
+            return struct.unpack("<HH", head[6:10])
+
+        if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+            chunk = head[12:16]
+            if chunk == b"VP8X":
+                width = int.from_bytes(head[24:27], "little") + 1
+                height = int.from_bytes(head[27:30], "little") + 1
+                return width, height
+            if chunk == b"VP8L":
+                f.seek(21)
+                bits = int.from_bytes(f.read(4), "little")
+                return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+            if chunk == b"VP8 ":
+                f.seek(26)
+                width, height = struct.unpack("<HH", f.read(4))
+                return width & 0x3FFF, height & 0x3FFF
+
+        if head[:2] == b"\xff\xd8":
+            size = _jpeg_size(f)
+            if size:
+                return size
+
+        if head[:2] == b"BM":
+            width, height = struct.unpack("<ii", head[18:26])
+            return width, abs(height)
+
+    # Unknown or unusual layout: Image.open is lazy and also only parses the header
+    with Image.open(path) as img:
+        return img.size
+
+
+def open_index(index_path):
+    conn = sqlite3.connect(index_path)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS images ("
+        "path TEXT PRIMARY KEY, mtime_ns INTEGER, width INTEGER, height INTEGER, dir TEXT)"
+    )
+    # Indexes written before the dir column existed: fill it in from the paths
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(images)")]
+    if "dir" not in columns:
+        with conn:
+            conn.execute("ALTER TABLE images ADD COLUMN dir TEXT")
+            paths = [row[0] for row in conn.execute("SELECT path FROM images")]
+            conn.executemany(
+                "UPDATE images SET dir = ? WHERE path = ?",
+                [(os.path.dirname(path), path) for path in paths],
+            )
+    conn.execute("CREATE INDEX IF NOT EXISTS images_dir ON images (dir)")
+    return conn
+
+
+def update_index(conn, input_folder, workers=None):
+    """Bring the index up to date with the folder, scanning only new or changed files."""
+    files = {}
+    with os.scandir(input_folder) as entries:
+        for entry in entries:
+            if entry.name.lower().endswith(IMAGE_EXTENSIONS) and entry.is_file():
+                files[entry.path] = entry.stat().st_mtime_ns
+
+    # The index may hold other folders; only this folder's direct children can be stale
+    known = dict(
+        conn.execute("SELECT path, mtime_ns FROM images WHERE dir = ?", (input_folder,))
+    )
+    stale = [path for path in known if path not in files]
+    changed = [path for path, mtime in files.items() if known.get(path) != mtime]
+
+    def scan(path):
+        try:
+            return path, read_image_size(path)
+        except Exception as e:
+            print(f"Error processing {os.path.basename(path)}: {str(e)}")
+            return path, None
+
+    rows = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for path, size in tqdm(
+            executor.map(scan, changed), total=len(changed), desc="Indexing images"
+        ):
+            if size is not None:
+                rows.append((path, files[path], size[0], size[1], input_folder))
+
+    with conn:
+        conn.executemany("DELETE FROM images WHERE path = ?", [(p,) for p in stale])
+        conn.executemany("INSERT OR REPLACE INTO images VALUES (?, ?, ?, ?, ?)", rows)
+
+
+def query_index(
+    conn,
+    input_folder,
+    target_size=None,
+    min_size=None,
+    max_size=None,
+    aspect=None,
+    aspect_tolerance=0.01,
+):
+    """Return paths in input_folder matching an exact size, size range and/or aspect ratio."""
+    # Exact, case-sensitive match on the folder: no wildcards to escape, no subfolders
+    clauses = ["dir = ?"]
+    params = [input_folder]
+
+    if target_size:
+        clauses.append("width = ? AND height = ?")
+        params.extend(target_size)
+    if min_size:
+        clauses.append("width >= ? AND height >= ?")
+        params.extend(min_size)
+    if max_size:
+        clauses.append("width <= ? AND height <= ?")
+        params.extend(max_size)
+    if aspect:
+        clauses.append("height > 0 AND CAST(width AS REAL) / height BETWEEN ? AND ?")
+        params.extend([aspect * (1 - aspect_tolerance), aspect * (1 + aspect_tolerance)])
+
+    sql = f"SELECT path FROM images WHERE {' AND '.join(clauses)} ORDER BY path"
+    return [row[0] for row in conn.execute(sql, params)]
+
+
+def transfer_file(input_path, output_path, link_mode="copy"):
+    """Copy a file, or hardlink/reflink it when requested and possible."""
+    if link_mode == "hardlink":
+        try:
+            os.link(input_path, output_path)
+            return
+        except OSError:
+            pass  # Different filesystem or unsupported; fall back to a copy
+    elif link_mode == "reflink":
+        try:
+            import fcntl
+
+            with open(input_path, "rb") as src, open(output_path, "wb") as dst:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+            shutil.copystat(input_path, output_path)
+            return
+        except (ImportError, OSError):
+            pass
+    shutil.copy2(input_path, output_path)
+
+
+def copy_images_by_size(
+    input_folder,
+    target_size,
+    output_folder,
+    min_size=None,
+    max_size=None,
+    aspect=None,
+    aspect_tolerance=0.01,
+    index_path=None,
+    link_mode="copy",
+    workers=None,
+):
     # Ensure output folder exists
     os.makedirs(output_folder, exist_ok=True)
 
-    # Get all files in the input folder
-    all_files = [
-        f
-        for f in os.listdir(input_folder)
-        if os.path.isfile(os.path.join(input_folder, f))
-    ]
+    input_folder = os.path.abspath(input_folder)
+    index_path = index_path or os.path.join(input_folder, INDEX_NAME)
 
-    # Filter for image files (you can expand this list)
-    image_extensions = (".jpg", ".jpeg", ".png", ".gif", ".bmp")
-    image_files = [f for f in all_files if f.lower().endswith(image_extensions)]
+    conn = open_index(index_path)
+    try:
+        update_index(conn, input_folder, workers)
+        matches = query_index(
+            conn, input_folder, target_size, min_size, max_size, aspect, aspect_tolerance
+        )
+    finally:
+        conn.close()
 
-    # Process images
-    for image_file in tqdm(image_files, desc="Processing images"):
-        input_path = os.path.join(input_folder, image_file)
+    def transfer(input_path):
+        output_path = os.path.join(output_folder, os.path.basename(input_path))
         try:
-            with Image.open(input_path) as img:
-                if img.size == target_size:
-                    output_path = os.path.join(output_folder, image_file)
-                    shutil.copy2(input_path, output_path)
+            transfer_file(input_path, output_path, link_mode)
         except Exception as e:
-            print(f"Error processing {image_file}: {str(e)}")
+            print(f"Error copying {os.path.basename(input_path)}: {str(e)}")
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(tqdm(executor.map(transfer, matches), total=len(matches), desc="Copying images"))
+
+    print(f"Matched {len(matches)} images")
+
+
+def parse_size(value):
+    width, height = map(int, value.lower().split("x"))
+    return width, height
+
+
+def parse_aspect(value):
+    if ":" in value:
+        width, height = map(float, value.split(":"))
+        return width / height
+    return float(value)
 
 
 def main():
@@ -40,23 +247,59 @@ def main():
         "input_folder", help="Path to the input folder containing images"
     )
     parser.add_argument(
-        "target_size", help="Target size in the format WIDTHxHEIGHT (e.g., 1920x1080)"
+        "target_size",
+        help="Target size in the format WIDTHxHEIGHT (e.g., 1920x1080), or 'any' to only use the filters below",
     )
     parser.add_argument(
         "output_folder", help="Path to the output folder for copied images"
     )
+    parser.add_argument("--min-size", help="Minimum size as WIDTHxHEIGHT")
+    parser.add_argument("--max-size", help="Maximum size as WIDTHxHEIGHT")
+    parser.add_argument("--aspect", help="Aspect ratio as W:H (e.g., 16:9) or a float")
+    parser.add_argument(
+        "--aspect-tolerance",
+        type=float,
+        default=0.01,
+        help="Relative tolerance for --aspect (default: 0.01)",
+    )
+    parser.add_argument(
+        "--index",
+        help=f"Path to the SQLite size index (default: <input_folder>/{INDEX_NAME})",
+    )
+    parser.add_argument(
+        "--link",
+        choices=["copy", "hardlink", "reflink"],
+        default="copy",
+        help="Copy files, or hardlink/reflink them when on the same filesystem (default: copy)",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=None, help="Number of worker threads"
+    )
 
     args = parser.parse_args()
 
-    # Parse target size
+    # Parse size filters
     try:
-        width, height = map(int, args.target_size.split("x"))
-        target_size = (width, height)
-    except ValueError:
-        print("Invalid target size format. Use WIDTHxHEIGHT (e.g., 1920x1080)")
+        target_size = None if args.target_size == "any" else parse_size(args.target_size)
+        min_size = parse_size(args.min_size) if args.min_size else None
+        max_size = parse_size(args.max_size) if args.max_size else None
+        aspect = parse_aspect(args.aspect) if args.aspect else None
+    except (ValueError, ZeroDivisionError):
+        print("Invalid size format. Use WIDTHxHEIGHT (e.g., 1920x1080) and W:H for aspect")
         return
 
-    copy_images_by_size(args.input_folder, target_size, args.output_folder)
+    copy_images_by_size(
+        args.input_folder,
+        target_size,
+        args.output_folder,
+        min_size,
+        max_size,
+        aspect,
+        args.aspect_tolerance,
+        args.index,
+        args.link,
+        args.workers,
+    )
     print("Image copying complete!")
 
 
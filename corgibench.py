@@ -4,25 +4,131 @@ import json
 import time
 import base64
 import requests
+import hashlib
+import shutil
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from tqdm import tqdm
 from dotenv import load_dotenv
 import fal_client
-from PIL import Image
+from PIL import Image, ImageDraw
 from PIL.PngImagePlugin import PngInfo
 import io
 
 # Load environment variables
 load_dotenv()
 
+# Per-job timing phases, in the order they happen
+PHASES = ("local_queue", "submit", "queue", "inference", "result", "download", "metadata_write", "total")
+
+# Job fields that determine the generated image, and so the cache key
+JOB_PARAMS = (
+    "full_prompt",
+    "image_size",
+    "guidance_scale",
+    "num_inference_steps",
+    "lora_url",
+    "lora_scale",
+    "seed",
+)
+
 
 def sanitize_filename(filename):
     return "".join(c for c in filename if c.isalnum() or c in ("-", "_")).rstrip()
 
 
+class JobTimer:
+    """Records consecutive phase durations (seconds) for one job.
+
+    Time spent waiting locally for a free --max_in_flight slot is recorded as
+    local_queue and is not part of total, which starts at submission.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.mark = self.start
+        self.phases = {}
+
+    def submitting(self):
+        """Mark the moment the job leaves the local queue and is sent to the API."""
+        now = time.perf_counter()
+        self.phases["local_queue"] = now - self.start
+        self.start = self.mark = now
+
+    def begin(self):
+        """Start timing the next phase now, excluding time spent waiting for a worker."""
+        self.mark = time.perf_counter()
+
+    def lap(self, phase):
+        now = time.perf_counter()
+        self.phases[phase] = now - self.mark
+        self.mark = now
+
+    def finish(self):
+        self.phases["total"] = time.perf_counter() - self.start
+
+
+def percentile(values, q):
+    """Linearly interpolated percentile of values (q in 0..100)."""
+    values = sorted(values)
+    if not values:
+        return None
+    position = (len(values) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def summarize_telemetry(records, wall_seconds, settings):
+    """Build the telemetry summary: per-phase p50/p95/p99, throughput and failures."""
+    succeeded = [r for r in records if r["status"] == "ok"]
+    failures = {}
+    for record in records:
+        if record["status"] == "failed":
+            failures[record["failed_stage"]] = failures.get(record["failed_stage"], 0) + 1
+    phases = {}
+    for phase in PHASES:
+        values = [r["timings"][phase] for r in succeeded if phase in r["timings"]]
+        if values:
+            phases[phase] = {
+                "count": len(values),
+                "mean": round(sum(values) / len(values), 3),
+                "p50": round(percentile(values, 50), 3),
+                "p95": round(percentile(values, 95), 3),
+                "p99": round(percentile(values, 99), 3),
+                "max": round(max(values), 3),
+            }
+    return {
+        "settings": settings,
+        "jobs": len(records),
+        "succeeded": len(succeeded),
+        "cached": sum(1 for r in records if r["status"] == "cached"),
+        "failed": sum(failures.values()),
+        "failures_by_stage": failures,
+        "wall_seconds": round(wall_seconds, 3),
+        "jobs_per_minute": round(len(succeeded) / wall_seconds * 60, 2) if wall_seconds else None,
+        "phases": phases,
+        "records": records,
+    }
+
+
+def make_session(pool_size):
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
 def generate_image(
-    prompt, image_size, guidance_scale, num_inference_steps, lora_url, lora_scale, seed
+    prompt, image_size, guidance_scale, num_inference_steps, lora_url, lora_scale, seed, timer=None
 ):
+    """Submit one job to FAL and block until it finishes; returns the image URL or None.
+
+    timer gets submit, queue, inference and result phases.
+    """
+    timer = timer or JobTimer()
     try:
+        timer.submitting()
         handler = fal_client.submit(
             "fal-ai/flux-lora",
             arguments={
@@ -35,15 +141,22 @@ def generate_image(
                 "seed": seed,
             },
         )
+        timer.lap("submit")
+        started = False
+        # Status events split the wait into time queued and time running
+        for event in handler.iter_events(with_logs=False):
+            if isinstance(event, fal_client.InProgress) and not started:
+                timer.lap("queue")
+                started = True
+            elif isinstance(event, fal_client.Completed):
+                break
+        if not started:
+            timer.lap("queue")
+        timer.lap("inference")
         result = handler.get()
+        timer.lap("result")
         if "images" in result and result["images"]:
-            image_url = result["images"][0]["url"]
-            response = requests.get(image_url, timeout=5)
-            if response.status_code == 200:
-                return response.content
-            else:
-                print(f"Failed to download image. Status code: {response.status_code}")
-                return None
+            return result["images"][0]["url"]
         else:
             print("No images found in the response")
             return None
@@ -52,10 +165,24 @@ def generate_image(
         return None
 
 
-def add_prompt_metadata(image_data, prompt):
+def download_image(image_url, session=None):
+    try:
+        response = (session or requests).get(image_url, timeout=30)
+    except requests.RequestException as e:
+        print(f"Failed to download image: {e}")
+        return None
+    if response.status_code == 200:
+        return response.content
+    print(f"Failed to download image. Status code: {response.status_code}")
+    return None
+
+
+def add_prompt_metadata(image_data, prompt, extra=None):
     img = Image.open(io.BytesIO(image_data))
     metadata = PngInfo()
     metadata.add_text("prompt", prompt)
+    for key, value in (extra or {}).items():
+        metadata.add_text(key, str(value))
 
     # Save the image with metadata to a bytes object
     img_byte_arr = io.BytesIO()
@@ -63,7 +190,146 @@ def add_prompt_metadata(image_data, prompt):
     return img_byte_arr.getvalue()
 
 
-def run_corgi_bench(benchmark_file, lora_url, lora_scale, output_folder, seed, override_image_size=None, override_guidance_scale=None, prefix="", suffix=""):
+def place_file(src, dest):
+    """Hardlink src to dest, falling back to a copy across filesystems."""
+    if os.path.exists(dest):
+        os.remove(dest)
+    try:
+        os.link(src, dest)
+    except OSError:
+        shutil.copyfile(src, dest)
+
+
+def save_image(image_url, prompt, output_files, session=None, extra=None, cache_file=None, timer=None):
+    """Download a finished image, embed the prompt and write it to every output file.
+
+    When cache_file is given the image is written there first (atomically) and
+    the outputs link to it. Returns the list of written files, or None.
+    """
+    timer = timer or JobTimer()
+    timer.begin()
+    image_data = download_image(image_url, session)
+    timer.lap("download")
+    if not image_data:
+        return None
+    image_with_metadata = add_prompt_metadata(image_data, prompt, extra)
+    target = cache_file or output_files[0]
+    temp_file = f"{target}.tmp"
+    with open(temp_file, "wb") as f:
+        f.write(image_with_metadata)
+    os.replace(temp_file, target)
+    for output_file in output_files:
+        if output_file != target:
+            place_file(target, output_file)
+    timer.lap("metadata_write")
+    timer.finish()
+    return output_files
+
+
+def job_key(job):
+    """Stable hash of everything that affects a generated image."""
+    params = {name: job[name] for name in JOB_PARAMS}
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def cell_name(lora_index, lora_scale, seed):
+    return f"lora{lora_index + 1}_scale{lora_scale:g}_seed{seed}"
+
+
+def build_jobs(prompts, override_image_size=None, override_guidance_scale=None, prefix="", suffix=""):
+    jobs = []
+    for idx, prompt_data in enumerate(prompts):
+        prompt = prompt_data["prompt"]
+        jobs.append(
+            {
+                "idx": idx + 1,
+                "prompt": prompt,
+                # Apply prefix and suffix to the prompt
+                "full_prompt": f"{prefix}{prompt}{suffix}".strip(),
+                "image_size": override_image_size or prompt_data.get("image_size", "square_hd"),
+                "guidance_scale": override_guidance_scale or prompt_data.get("guidance_scale", 3.5),
+                "num_inference_steps": prompt_data.get("num_inference_steps", 28),
+            }
+        )
+    return jobs
+
+
+def expand_sweep(jobs, lora_urls, lora_scales, seeds, output_folder):
+    """Cross prompt jobs with every LoRA/scale/seed; returns (jobs, cells).
+
+    A single combination keeps the flat output_folder/image_{idx}.png layout;
+    a sweep puts each combination in its own subfolder.
+    """
+    combos = [
+        (lora_index, lora_url, lora_scale, seed)
+        for lora_index, lora_url in enumerate(lora_urls)
+        for lora_scale in lora_scales
+        for seed in seeds
+    ]
+    sweep = len(combos) > 1
+    expanded = []
+    cells = []
+    for lora_index, lora_url, lora_scale, seed in combos:
+        name = cell_name(lora_index, lora_scale, seed)
+        folder = os.path.join(output_folder, name) if sweep else output_folder
+        os.makedirs(folder, exist_ok=True)
+        cells.append(
+            {"cell": name, "folder": folder, "lora_url": lora_url, "lora_scale": lora_scale, "seed": seed}
+        )
+        for job in jobs:
+            job = dict(job, lora_url=lora_url, lora_scale=lora_scale, seed=seed, cell=name)
+            job["output_file"] = os.path.join(folder, f"image_{job['idx']}.png")
+            job["key"] = job_key(job)
+            expanded.append(job)
+    return expanded, cells
+
+
+def build_comparison_grids(jobs, lora_urls, lora_scales, seeds, grid_folder, tile_size=384):
+    """Write one grid per prompt: a row per LoRA, a column per scale/seed pair."""
+    os.makedirs(grid_folder, exist_ok=True)
+    columns = [(lora_scale, seed) for lora_scale in lora_scales for seed in seeds]
+    by_prompt = {}
+    for job in jobs:
+        by_prompt.setdefault(job["idx"], {})[(job["lora_url"], job["lora_scale"], job["seed"])] = job
+    label_height = 20
+    for idx, cells in sorted(by_prompt.items()):
+        grid = Image.new(
+            "RGB",
+            (tile_size * len(columns), (tile_size + label_height) * len(lora_urls)),
+            (32, 32, 32),
+        )
+        draw = ImageDraw.Draw(grid)
+        for row, lora_url in enumerate(lora_urls):
+            for col, (lora_scale, seed) in enumerate(columns):
+                x, y = col * tile_size, row * (tile_size + label_height)
+                draw.text((x + 4, y + 4), cell_name(row, lora_scale, seed), fill=(230, 230, 230))
+                output_file = cells[(lora_url, lora_scale, seed)]["output_file"]
+                if not os.path.exists(output_file):
+                    continue
+                with Image.open(output_file) as img:
+                    img = img.convert("RGB")
+                    img.thumbnail((tile_size, tile_size), Image.Resampling.LANCZOS)
+                    offset = ((tile_size - img.width) // 2, (tile_size - img.height) // 2)
+                    grid.paste(img, (x + offset[0], y + label_height + offset[1]))
+        grid.save(os.path.join(grid_folder, f"image_{idx}.png"))
+
+
+def as_list(value):
+    return list(value) if isinstance(value, (list, tuple)) else [value]
+
+
+def run_corgi_bench(benchmark_file, lora_url, lora_scale, output_folder, seed, override_image_size=None, override_guidance_scale=None, prefix="", suffix="", max_in_flight=4, download_workers=4, cache_dir=None):
+    """Generate every benchmark prompt with up to max_in_flight FAL jobs at once.
+
+    lora_url, lora_scale and seed may be lists, in which case the full matrix
+    is run as a sweep and comparison grids are written to output_folder/grids.
+    Identical jobs are generated once, and with cache_dir set, finished images
+    are reused from earlier runs.
+
+    Downloads and metadata writes run on their own pool so they overlap with
+    generation. Files are named image_{idx}.png by prompt position, whatever
+    order jobs finish in.
+    """
     with open(benchmark_file, "r") as f:
         benchmark_data = json.load(f)
 
@@ -74,34 +340,126 @@ def run_corgi_bench(benchmark_file, lora_url, lora_scale, output_folder, seed, o
         return
 
     os.makedirs(output_folder, exist_ok=True)
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
 
-    for idx, prompt_data in enumerate(tqdm(prompts, desc="Generating images")):
-        prompt = prompt_data["prompt"]
-        image_size = override_image_size or prompt_data.get("image_size", "square_hd")
-        guidance_scale = override_guidance_scale or prompt_data.get("guidance_scale", 3.5)
-        num_inference_steps = prompt_data.get("num_inference_steps", 28)
-
-        # Apply prefix and suffix to the prompt
-        full_prompt = f"{prefix}{prompt}{suffix}".strip()
-
-        image_data = generate_image(
-            full_prompt,
-            image_size,
-            guidance_scale,
-            num_inference_steps,
-            lora_url,
-            lora_scale,
-            seed,
+    lora_urls, lora_scales, seeds = as_list(lora_url), as_list(lora_scale), as_list(seed)
+    jobs = build_jobs(prompts, override_image_size, override_guidance_scale, prefix, suffix)
+    jobs, cells = expand_sweep(jobs, lora_urls, lora_scales, seeds, output_folder)
+
+    # Identical jobs (repeated prompts or LoRAs) are generated once and linked
+    groups = {}
+    for job in jobs:
+        groups.setdefault(job["key"], []).append(job)
+
+    session = make_session(download_workers)
+    saves = {}
+    to_generate = []
+    timers = {key: JobTimer() for key in groups}
+    failed_stage = {}
+    run_start = time.perf_counter()
+    for key, group in groups.items():
+        cache_file = os.path.join(cache_dir, f"{key}.png") if cache_dir else None
+        if cache_file and os.path.exists(cache_file):
+            for job in group:
+                place_file(cache_file, job["output_file"])
+            saves[key] = [job["output_file"] for job in group]
+        else:
+            to_generate.append((key, group, cache_file))
+    if saves:
+        print(f"Reused {len(saves)} cached image(s)")
+
+    with ThreadPoolExecutor(max_workers=max_in_flight) as generate_pool, ThreadPoolExecutor(
+        max_workers=download_workers
+    ) as save_pool:
+        futures = {
+            generate_pool.submit(
+                generate_image,
+                group[0]["full_prompt"],
+                group[0]["image_size"],
+                group[0]["guidance_scale"],
+                group[0]["num_inference_steps"],
+                group[0]["lora_url"],
+                group[0]["lora_scale"],
+                group[0]["seed"],
+                timers[key],
+            ): (key, group, cache_file)
+            for key, group, cache_file in to_generate
+        }
+        for future in tqdm(as_completed(futures), total=len(futures), desc="Generating images"):
+            key, group, cache_file = futures[future]
+            image_url = future.result()
+            if not image_url:
+                failed_stage[key] = "generate"
+            else:
+                job = group[0]
+                extra = {"lora": job["lora_url"], "lora_scale": job["lora_scale"], "seed": job["seed"]}
+                saves[key] = save_pool.submit(
+                    save_image,
+                    image_url,
+                    job["full_prompt"],
+                    [j["output_file"] for j in group],
+                    session,
+                    extra,
+                    cache_file,
+                    timers[key],
+                )
+
+    records = []
+    for key, group in groups.items():
+        save = saves.get(key)
+        status = "cached" if isinstance(save, list) else "ok"
+        if save is not None and status == "ok":
+            try:
+                if save.result() is None:
+                    failed_stage[key] = "download"
+            except Exception as e:
+                print(f"Failed to write image: {e}")
+                failed_stage[key] = "metadata_write"
+        job = group[0]
+        records.append(
+            {
+                "idx": job["idx"],
+                "cell": job["cell"],
+                "outputs": len(group),
+                "status": "failed" if key in failed_stage else status,
+                "failed_stage": failed_stage.get(key),
+                "timings": {k: round(v, 3) for k, v in timers[key].phases.items()},
+            }
         )
+    wall_seconds = time.perf_counter() - run_start
 
-        if image_data:
-            image_with_metadata = add_prompt_metadata(image_data, full_prompt)
-            output_file = os.path.join(output_folder, f"image_{idx+1}.png")
-            with open(output_file, "wb") as f:
-                f.write(image_with_metadata)
-            print(f"Image saved with metadata: {output_file}")
+    # Report in prompt order so logs are comparable between runs
+    for job in jobs:
+        if job["key"] in failed_stage:
+            print(f"Failed to generate image for prompt: {job['prompt']}")
         else:
-            print(f"Failed to generate image for prompt: {prompt}")
+            print(f"Image saved with metadata: {job['output_file']}")
+
+    settings = {
+        "benchmark": os.path.basename(benchmark_file),
+        "lora_urls": lora_urls,
+        "lora_scales": lora_scales,
+        "seeds": seeds,
+        "max_in_flight": max_in_flight,
+        "download_workers": download_workers,
+    }
+    summary = summarize_telemetry(records, wall_seconds, settings)
+    with open(os.path.join(output_folder, "telemetry.json"), "w") as f:
+        json.dump(summary, f, indent=2)
+    total = summary["phases"].get("total")
+    print(
+        f"{summary['succeeded']} generated, {summary['cached']} cached, {summary['failed']} failed "
+        f"in {summary['wall_seconds']:.1f}s ({summary['jobs_per_minute']} jobs/min)"
+        + (f", total p50 {total['p50']}s p95 {total['p95']}s" if total else "")
+    )
+
+    if len(cells) > 1:
+        with open(os.path.join(output_folder, "sweep.json"), "w") as f:
+            json.dump({"cells": cells}, f, indent=2)
+        grid_folder = os.path.join(output_folder, "grids")
+        build_comparison_grids(jobs, lora_urls, lora_scales, seeds, grid_folder)
+        print(f"Comparison grids saved to {grid_folder}")
 
 
 def main():
@@ -111,12 +469,14 @@ def main():
     parser.add_argument(
         "benchmark", help="Name of the benchmark JSON file (without .json extension)"
     )
-    parser.add_argument("lora_url", help="URL of the LoRA weights")
     parser.add_argument(
-        "--scale", type=float, default=1, help="LoRA scale (default: 1)"
+        "lora_url", nargs="+", help="URL of the LoRA weights (several for a sweep)"
+    )
+    parser.add_argument(
+        "--scale", type=float, nargs="+", default=[1], help="LoRA scale(s) (default: 1)"
     )
     parser.add_argument(
-        "--seed", type=int, default=42, help="Seed for image generation (default: 42)"
+        "--seed", type=int, nargs="+", default=[42], help="Seed(s) for image generation (default: 42)"
     )
     parser.add_argument(
         "--override_image_size",
@@ -140,6 +500,28 @@ def main():
         default="",
         help="Suffix to add to all prompts"
     )
+    parser.add_argument(
+        "--max_in_flight",
+        type=int,
+        default=4,
+        help="Maximum FAL jobs running at once (default: 4)"
+    )
+    parser.add_argument(
+        "--download_workers",
+        type=int,
+        default=4,
+        help="Threads downloading and writing finished images (default: 4)"
+    )
+    parser.add_argument(
+        "--cache_dir",
+        default="corgibench_cache",
+        help="Folder of finished images reused by later runs with identical parameters (default: corgibench_cache)"
+    )
+    parser.add_argument(
+        "--no_cache",
+        action="store_true",
+        help="Always generate, without reading or writing the cache"
+    )
     args = parser.parse_args()
 
     script_dir = os.path.dirname(os.path.abspath(__file__))
@@ -154,9 +536,11 @@ def main():
     output_folder = f"corgibench_{sanitize_filename(args.benchmark)}_{timestamp}"
 
     print(f"Starting CorgiBench with benchmark: {args.benchmark}")
-    print(f"LoRA URL: {args.lora_url}")
-    print(f"LoRA scale: {args.scale}")
+    print(f"LoRA URL(s): {', '.join(args.lora_url)}")
+    print(f"LoRA scale(s): {', '.join(f'{scale:g}' for scale in args.scale)}")
+    print(f"Seed(s): {', '.join(str(seed) for seed in args.seed)}")
     print(f"Output folder: {output_folder}")
+    print(f"Max in flight: {args.max_in_flight}")
 
     run_corgi_bench(
         benchmark_file,
@@ -167,7 +551,10 @@ def main():
         args.override_image_size,
         args.override_guidance_scale,
         args.prefix,
-        args.suffix
+        args.suffix,
+        args.max_in_flight,
+        args.download_workers,
+        None if args.no_cache else args.cache_dir,
     )
     print("CorgiBench completed.")
 
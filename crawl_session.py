@@ -0,0 +1,151 @@
+import json
+import logging
+import os
+import random
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class PoliteSession:
+    """Pooled requests session with per-host concurrency, rate limiting and retries.
+
+    Safe to share between threads. Each host gets at most `per_host` requests
+    in flight and at most `rate` requests started per second; failed requests
+    (connection errors, 429 and 5xx) are retried with exponential backoff.
+    """
+
+    def __init__(self, per_host=4, rate=4.0, retries=4, backoff=1.0, timeout=30, user_agent=None):
+        self.per_host = per_host
+        self.min_interval = 1.0 / rate if rate else 0.0
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=16, pool_maxsize=max(per_host, 1) * 4)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        if user_agent:
+            self.session.headers["User-Agent"] = user_agent
+
+        self._lock = threading.Lock()
+        self._semaphores = {}
+        self._next_slot = {}
+
+    def _host_semaphore(self, host):
+        with self._lock:
+            if host not in self._semaphores:
+                self._semaphores[host] = threading.BoundedSemaphore(self.per_host)
+            return self._semaphores[host]
+
+    def _wait_for_slot(self, host):
+        # Reserve the next start time for this host, then sleep until it arrives
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = start + self.min_interval
+        delay = start - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def get(self, url, stream=False, **kwargs):
+        """GET with retries; returns the final response (which may be an error status)."""
+        host = urlparse(url).netloc
+        semaphore = self._host_semaphore(host)
+        kwargs.setdefault("timeout", self.timeout)
+
+        for attempt in range(self.retries + 1):
+            retry_after = None
+            with semaphore:
+                self._wait_for_slot(host)
+                try:
+                    response = self.session.get(url, stream=stream, **kwargs)
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    if attempt == self.retries:
+                        raise
+                    logging.warning(f"Retrying {url} after error: {e}")
+                else:
+                    if response.status_code not in RETRY_STATUSES or attempt == self.retries:
+                        return response
+                    retry_after = response.headers.get("Retry-After")
+                    response.close()
+                    logging.warning(f"Retrying {url} after HTTP {response.status_code}")
+
+            if retry_after and retry_after.isdigit():
+                delay = float(retry_after)
+            else:
+                delay = self.backoff * (2 ** attempt) * (1 + random.random() * 0.25)
+            time.sleep(delay)
+
+    def download(self, url, path, chunk_size=1 << 16):
+        """Stream url to path via a .part file. Returns the response on success, else None."""
+        response = self.get(url, stream=True)
+        if response.status_code != 200:
+            response.close()
+            return None
+        temp_path = path + ".part"
+        with response, open(temp_path, "wb") as f:
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                f.write(chunk)
+        os.replace(temp_path, path)
+        return response
+
+
+class CrawlIndex:
+    """Persistent record of visited pages and finished downloads, for resuming crawls."""
+
+    def __init__(self, path, save_every=50):
+        self.path = path
+        self.save_every = save_every
+        self._lock = threading.Lock()
+        self._dirty = 0
+        self.data = {"visited": {}, "downloaded": {}}
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self.data.update(json.load(f))
+            except (OSError, ValueError):
+                logging.warning(f"Ignoring unreadable crawl index: {path}")
+
+    def is_visited(self, url):
+        with self._lock:
+            return url in self.data["visited"]
+
+    def mark_visited(self, url, value=True):
+        self._set("visited", url, value)
+
+    def downloaded(self, url):
+        with self._lock:
+            return self.data["downloaded"].get(url)
+
+    def mark_downloaded(self, url, value):
+        self._set("downloaded", url, value)
+
+    def lookup(self, section, key, default=None):
+        with self._lock:
+            return self.data.get(section, {}).get(key, default)
+
+    def record(self, section, key, value):
+        self._set(section, key, value)
+
+    def _set(self, section, key, value):
+        with self._lock:
+            self.data.setdefault(section, {})[key] = value
+            self._dirty += 1
+            should_save = self._dirty >= self.save_every
+        if should_save:
+            self.save()
+
+    def save(self):
+        with self._lock:
+            temp_path = self.path + ".tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(self.data, f)
+            os.replace(temp_path, self.path)
+            self._dirty = 0
@@ -1,11 +1,91 @@
 import os
+import threading
 import tkinter as tk
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 from tkinter import filedialog
 from PIL import Image, ImageTk
 
+CURRENT_SIZE = (600, 600)
+SIDE_SIZE = (200, 200)
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".gif")
+RECONCILE_INTERVAL_MS = 30000
+
+
+def load_preview(path):
+    """Decode an image once and return it resized for the current and side slots"""
+    with Image.open(path) as img:
+        # Only JPEG honours draft(); it decodes at a reduced scale that is still >= 600px
+        img.draft(img.mode, CURRENT_SIZE)
+        img.load()
+        return {
+            CURRENT_SIZE: img.resize(CURRENT_SIZE, Image.NEAREST),
+            SIDE_SIZE: img.resize(SIDE_SIZE, Image.NEAREST),
+        }
+
+
+class ThumbnailCache:
+    """LRU cache of resized previews, filled in the background by a thread pool"""
+
+    def __init__(self, max_items=64, workers=4):
+        self.max_items = max_items
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _future(self, path):
+        with self.lock:
+            future = self.entries.get(path)
+            if future is None:
+                future = self.executor.submit(load_preview, path)
+                self.entries[path] = future
+            self.entries.move_to_end(path)
+            while len(self.entries) > self.max_items:
+                _, evicted = self.entries.popitem(last=False)
+                evicted.cancel()
+            return future
+
+    def prefetch(self, paths):
+        for path in paths:
+            self._future(path)
+
+    def get(self, path, size):
+        # Blocks only when the preview was not prefetched yet
+        return self._future(path).result()[size]
+
+    def discard(self, path):
+        with self.lock:
+            future = self.entries.pop(path, None)
+        if future is not None:
+            future.cancel()
+
+    def clear(self):
+        with self.lock:
+            for future in self.entries.values():
+                future.cancel()
+            self.entries.clear()
+
+
+def move_with_sidecar(source, dest):
+    """Move an image and its .txt caption (if any) to dest"""
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    os.rename(source, dest)
+
+    source_txt = os.path.splitext(source)[0] + ".txt"
+    if os.path.exists(source_txt):
+        os.rename(source_txt, os.path.splitext(dest)[0] + ".txt")
+
+
+def count_images(folder):
+    """Count images in a folder, ignoring sidecar files"""
+    if not os.path.isdir(folder):
+        return 0
+    with os.scandir(folder) as entries:
+        return sum(1 for entry in entries if entry.name.lower().endswith(IMAGE_EXTENSIONS))
+
 
 class DatasetFilterApp:
-    def __init__(self, master):
+    def __init__(self, master, prefetch=3):
         self.master = master
         self.master.title("Dataset Filter")
         self.master.geometry("1024x768")  # Default size
@@ -18,10 +98,22 @@ class DatasetFilterApp:
         self.selected_folder = "selected"
         self.discarded_folder = "discarded"
 
+        # Previews for the next/previous `prefetch` images are decoded ahead of time
+        self.prefetch = prefetch
+        self.cache = ThumbnailCache(max_items=max(16, prefetch * 4 + 3))
+
+        # A single worker keeps moves (and their undos) in submission order
+        self.mover = ThreadPoolExecutor(max_workers=1)
+        self.move_errors = deque()
+        self.history = []
+        self.counts = {"selected": 0, "discarded": 0}
+
         self.setup_ui()
         self.load_images()
         self.update_display()
         self.update_counts()
+        self.reconcile_counts()
+        self.master.protocol("WM_DELETE_WINDOW", self.on_close)
 
     def center_window(self):
         # Center the window on the screen
@@ -99,10 +191,12 @@ class DatasetFilterApp:
 
         tk.Label(self.help_frame, text="Up Arrow: Move to Selected").pack(side=tk.LEFT, padx=10)
         tk.Label(self.help_frame, text="Down Arrow: Move to Discarded").pack(side=tk.LEFT, padx=10)
+        tk.Label(self.help_frame, text="Ctrl+Z: Undo").pack(side=tk.LEFT, padx=10)
 
         # Key bindings
         self.master.bind("<Up>", self.move_to_selected)
         self.master.bind("<Down>", self.move_to_discarded)
+        self.master.bind("<Control-z>", self.undo_move)
 
     def browse_path(self):
         new_path = filedialog.askdirectory()
@@ -110,8 +204,11 @@ class DatasetFilterApp:
             self.base_path = new_path
             self.path_entry.delete(0, tk.END)
             self.path_entry.insert(0, self.base_path)
+            self.cache.clear()
+            self.history.clear()
             self.load_images()
             self.update_display()
+            self.reconcile_counts(reschedule=False)
 
     def load_images(self):
         self.images = [
@@ -121,53 +218,87 @@ class DatasetFilterApp:
         ]
         self.current_index = 0
 
+    def image_path(self, index):
+        return os.path.join(self.base_path, self.images[index % len(self.images)])
+
+    def prefetch_neighbors(self):
+        # Nearest images first so the next keypress is most likely a cache hit
+        paths = []
+        for offset in range(1, self.prefetch + 1):
+            paths.append(self.image_path(self.current_index + offset))
+            paths.append(self.image_path(self.current_index - offset))
+        self.cache.prefetch(paths)
+
+    def show_preview(self, label, index, size):
+        try:
+            image = self.cache.get(self.image_path(index), size)
+        except OSError:
+            # e.g. an undone move that has not finished restoring the file yet
+            label.config(image="")
+            return
+        photo = ImageTk.PhotoImage(image)
+        label.config(image=photo)
+        label.image = photo
+
     def update_display(self):
         if not self.images:
             return
 
         # Update current image
-        current_img = Image.open(
-            os.path.join(self.base_path, self.images[self.current_index])
-        )
-        current_img = current_img.resize((600, 600), Image.NEAREST)
-        current_photo = ImageTk.PhotoImage(current_img)
-        self.current_label.config(image=current_photo)
-        self.current_label.image = current_photo
+        self.show_preview(self.current_label, self.current_index, CURRENT_SIZE)
 
-        # Update previous image
+        # Update previous and next images
         if len(self.images) > 1:
-            prev_index = (self.current_index - 1) % len(self.images)
-            prev_img = Image.open(os.path.join(self.base_path, self.images[prev_index]))
-            prev_img = prev_img.resize((200, 200), Image.NEAREST)
-            prev_photo = ImageTk.PhotoImage(prev_img)
-            self.prev_label.config(image=prev_photo)
-            self.prev_label.image = prev_photo
+            self.show_preview(self.prev_label, self.current_index - 1, SIDE_SIZE)
+            self.show_preview(self.next_label, self.current_index + 1, SIDE_SIZE)
         else:
             self.prev_label.config(image="")
-
-        # Update next image
-        if len(self.images) > 1:
-            next_index = (self.current_index + 1) % len(self.images)
-            next_img = Image.open(os.path.join(self.base_path, self.images[next_index]))
-            next_img = next_img.resize((200, 200), Image.NEAREST)
-            next_photo = ImageTk.PhotoImage(next_img)
-            self.next_label.config(image=next_photo)
-            self.next_label.image = next_photo
-        else:
             self.next_label.config(image="")
 
+        self.prefetch_neighbors()
+
     def update_counts(self):
-        remaining = len(self.images)
-        
-        selected_path = os.path.join(self.base_path, self.selected_folder)
-        discarded_path = os.path.join(self.base_path, self.discarded_folder)
-        
-        selected = len(os.listdir(selected_path)) if os.path.exists(selected_path) else 0
-        discarded = len(os.listdir(discarded_path)) if os.path.exists(discarded_path) else 0
-
-        self.remaining_label.config(text=f"Remaining: {remaining}")
-        self.selected_count_label.config(text=f"Selected: {selected}")
-        self.discarded_count_label.config(text=f"Discarded: {discarded}")
+        # Counts are tracked in memory; reconcile_counts() re-syncs them with disk
+        self.remaining_label.config(text=f"Remaining: {len(self.images)}")
+        self.selected_count_label.config(text=f"Selected: {self.counts['selected']}")
+        self.discarded_count_label.config(text=f"Discarded: {self.counts['discarded']}")
+
+    def reconcile_counts(self, reschedule=True):
+        folders = {
+            folder: os.path.join(self.base_path, getattr(self, f"{folder}_folder"))
+            for folder in self.counts
+        }
+        # Queued behind pending moves so the listing reflects them
+        future = self.mover.submit(
+            lambda: {folder: count_images(path) for folder, path in folders.items()}
+        )
+        self.master.after(100, self.poll_reconcile, future, self.base_path)
+        if reschedule:
+            self.master.after(RECONCILE_INTERVAL_MS, self.reconcile_counts)
+
+    def poll_reconcile(self, future, base_path):
+        if not future.done():
+            self.master.after(100, self.poll_reconcile, future, base_path)
+            return
+        self.report_move_errors()
+        if future.exception() is None and base_path == self.base_path:
+            self.counts.update(future.result())
+            self.update_counts()
+
+    def report_move_errors(self):
+        if self.move_errors:
+            message = self.move_errors.popleft()
+            self.move_errors.clear()
+            self.show_notification(message, fg="red")
+
+    def queue_move(self, source, dest):
+        def run():
+            try:
+                move_with_sidecar(source, dest)
+            except OSError as e:
+                self.move_errors.append(f"Failed to move {os.path.basename(source)}: {e}")
+
+        return self.mover.submit(run)
 
     def move_to_selected(self, event):
         self.move_image("selected")
@@ -179,29 +310,67 @@ class DatasetFilterApp:
         if not self.images:
             return
 
-        source = os.path.join(self.base_path, self.images[self.current_index])
+        filename = self.images[self.current_index]
+        source = os.path.join(self.base_path, filename)
         dest_folder = os.path.join(self.base_path, getattr(self, f"{folder}_folder"))
-        os.makedirs(dest_folder, exist_ok=True)
-        dest = os.path.join(dest_folder, self.images[self.current_index])
+        dest = os.path.join(dest_folder, filename)
 
-        os.rename(source, dest)
+        self.queue_move(source, dest)
+        self.history.append((filename, self.current_index, folder, source, dest))
+        self.counts[folder] += 1
+        self.cache.discard(source)
         self.images.pop(self.current_index)
 
         # Show non-intrusive notification
         self.show_notification(f"Image moved to {folder} folder")
+        self.report_move_errors()
+        self.refresh()
+
+    def undo_move(self, event=None):
+        if not self.history:
+            return
+
+        filename, index, folder, source, dest = self.history.pop()
+        future = self.queue_move(dest, source)
+        self.counts[folder] = max(0, self.counts[folder] - 1)
+        index = min(index, len(self.images))
+        self.images.insert(index, filename)
+        self.current_index = index
+        self.update_counts()
 
+        # The preview is shown once the file is back in place; the UI keeps running meanwhile
+        self.show_notification(f"Restoring {filename}...")
+        self.poll_undo(future, source, filename, folder)
+
+    def poll_undo(self, future, source, filename, folder):
+        if not future.done():
+            self.master.after(100, self.poll_undo, future, source, filename, folder)
+            return
+        # Drop any preview that failed to load while the file was still moving
+        self.cache.discard(source)
+        if os.path.exists(source):
+            self.show_notification(f"Undid move of {filename} to {folder} folder")
+        self.report_move_errors()
+        self.refresh()
+
+    def refresh(self):
         if self.images:
             self.current_index %= len(self.images)
             self.update_display()
-            self.update_counts()
         else:
             self.current_label.config(image="")
             self.prev_label.config(image="")
             self.next_label.config(image="")
-            self.update_counts()
+        self.update_counts()
+
+    def on_close(self):
+        # Let queued moves finish before exiting
+        self.mover.shutdown(wait=True)
+        self.cache.executor.shutdown(wait=False, cancel_futures=True)
+        self.master.destroy()
 
-    def show_notification(self, message):
-        self.notification_label.config(text=message)
+    def show_notification(self, message, fg="green"):
+        self.notification_label.config(text=message, fg=fg)
         self.master.after(2000, lambda: self.notification_label.config(text=""))
 
 if __name__ == "__main__":
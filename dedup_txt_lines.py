@@ -1,26 +1,366 @@
 import argparse
+import hashlib
+import heapq
+import os
+import re
+import struct
+import tempfile
+
+import numpy as np
 from tqdm import tqdm
 
 
-def deduplicate_lines(input_file, output_file):
-    unique_lines = set()
-    total_lines = 0
-    unique_count = 0
+def line_hash(line, bits=64):
+    """Hash a line to a 64- or 128-bit integer."""
+    return int.from_bytes(
+        hashlib.blake2b(line.encode("utf-8"), digest_size=bits // 8).digest(), "little"
+    )
+
+
+def hash_lines(lines, bits=64):
+    """Hash many lines at once into a (n, bits // 64) uint64 array.
+
+    64-bit hashes use Python's built-in (SipHash) string hash, which is only
+    stable within one process; that is all an in-memory set needs.
+    """
+    if bits == 64:
+        return np.fromiter(map(hash, lines), dtype=np.int64, count=len(lines)).view(
+            np.uint64
+        ).reshape(-1, 1)
+    size = bits // 8
+    digests = b"".join(
+        hashlib.blake2b(line.encode("utf-8"), digest_size=size).digest() for line in lines
+    )
+    return np.frombuffer(digests, dtype="<u8").reshape(-1, bits // 64)
+
+
+class CompactHashSet:
+    """Open-addressing set of 64/128-bit hashes stored in a flat numpy table.
+
+    Costs 8 (or 16) bytes per slot instead of a full Python string per line.
+    add_many() inserts a whole batch with vectorized probing.
+    """
+
+    def __init__(self, bits=64, capacity=1 << 16):
+        self.bits = bits
+        self.words = bits // 64
+        self.size = 0
+        self._allocate(capacity)
+
+    def _allocate(self, capacity):
+        self.capacity = capacity
+        self.mask = np.uint64(capacity - 1)
+        self.slots = np.zeros((capacity, self.words), dtype=np.uint64)
+
+    @property
+    def nbytes(self):
+        return self.slots.nbytes
+
+    def _split(self, value):
+        return np.array(
+            [[(value >> (64 * i)) & 0xFFFFFFFFFFFFFFFF for i in range(self.words)]],
+            dtype=np.uint64,
+        )
+
+    def _insert(self, keys):
+        """Insert distinct keys; return a mask of those that were not present."""
+        added = np.zeros(len(keys), dtype=bool)
+        active = np.arange(len(keys))
+        index = keys[:, 0] & self.mask
+        while len(active):
+            slot_keys = self.slots[index]
+            empty = ~slot_keys.any(axis=1)
+            found = (slot_keys == keys[active]).all(axis=1)
+
+            # Several keys may race for the same empty slot; the first one wins
+            claim = np.flatnonzero(empty)
+            _, first = np.unique(index[claim], return_index=True)
+            winners = claim[first]
+            self.slots[index[winners]] = keys[active[winners]]
+            added[active[winners]] = True
+
+            done = found.copy()
+            done[winners] = True
+            # Losers retry the same slot (now taken); everything else probes onward
+            advance = ~done & ~empty
+            index = np.where(advance, (index + np.uint64(1)) & self.mask, index)
+            active, index = active[~done], index[~done]
+        return added
+
+    def add_many(self, keys):
+        """Add a (n, words) batch of hashes; return a mask of first occurrences."""
+        keys = np.array(keys, dtype=np.uint64).reshape(-1, self.words)
+        # Zero marks an empty slot, so nudge all-zero hashes
+        keys[~keys.any(axis=1), 0] = 1
+        if self.words == 1:
+            _, first = np.unique(keys[:, 0], return_index=True)
+        else:
+            _, first = np.unique(keys, axis=0, return_index=True)
+        while (self.size + len(first)) * 2 > self.capacity:
+            self._grow()
+        added = self._insert(keys[first])
+        self.size += int(added.sum())
+        result = np.zeros(len(keys), dtype=bool)
+        result[first[added]] = True
+        return result
+
+    def add(self, value):
+        """Add a hash; return True if it was not present yet."""
+        return bool(self.add_many(self._split(value or 1))[0])
+
+    def _grow(self):
+        old = self.slots[self.slots.any(axis=1)]
+        self._allocate(self.capacity * 2)
+        self._insert(old)
+
+    def __len__(self):
+        return self.size
+
+
+class NearDuplicateIndex:
+    """MinHash + LSH index that flags lines similar to ones already seen."""
+
+    _PRIME = (1 << 61) - 1
+
+    def __init__(self, threshold=0.8, num_perm=64, shingle_size=5, seed=1):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, 1 << 32, size=num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, 1 << 32, size=num_perm, dtype=np.uint64)
+        self.bands, self.rows = self._optimal_bands(threshold, num_perm)
+        self.buckets = [dict() for _ in range(self.bands)]
+        self.signatures = []
+
+    @staticmethod
+    def _optimal_bands(threshold, num_perm):
+        # Pick the band layout whose S-curve midpoint (1/b)^(1/r) is closest to the threshold
+        best = None
+        for rows in range(1, num_perm + 1):
+            if num_perm % rows:
+                continue
+            bands = num_perm // rows
+            error = abs((1 / bands) ** (1 / rows) - threshold)
+            if best is None or error < best[0]:
+                best = (error, bands, rows)
+        return best[1], best[2]
+
+    def signature(self, text):
+        text = re.sub(r"\s+", " ", text.lower()).strip()
+        k = self.shingle_size
+        shingles = {text[i : i + k] for i in range(max(1, len(text) - k + 1))}
+        hashes = np.fromiter(
+            (line_hash(s, 64) & 0xFFFFFFFF for s in shingles),
+            dtype=np.uint64,
+            count=len(shingles),
+        )
+        permuted = (np.outer(hashes, self.a) + self.b) % np.uint64(self._PRIME)
+        return (permuted & np.uint64(0xFFFFFFFF)).min(axis=0)
+
+    def add(self, text):
+        """Index text; return True if it is novel, False if it is a near duplicate."""
+        signature = self.signature(text)
+        keys = [
+            signature[i * self.rows : (i + 1) * self.rows].tobytes()
+            for i in range(self.bands)
+        ]
+
+        for band, key in zip(self.buckets, keys):
+            for candidate in band.get(key, ()):
+                similarity = np.mean(self.signatures[candidate] == signature)
+                if similarity >= self.threshold:
+                    return False
+
+        index = len(self.signatures)
+        self.signatures.append(signature)
+        for band, key in zip(self.buckets, keys):
+            band.setdefault(key, []).append(index)
+        return True
+
+
+class MemoryBudgetExceeded(Exception):
+    pass
+
+
+def _iter_lines(input_file, desc):
+    """Yield (offset, raw_line) pairs, tracking progress by bytes."""
+    with open(input_file, "rb") as infile, tqdm(
+        total=os.path.getsize(input_file), unit="B", unit_scale=True, desc=desc
+    ) as pbar:
+        offset = 0
+        for raw in infile:
+            yield offset, raw
+            offset += len(raw)
+            pbar.update(len(raw))
+
+
+def default_memory_budget():
+    """Half of the currently available physical memory, or 1 GB if it cannot be read."""
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE") // 2
+    except (AttributeError, ValueError, OSError):
+        return 1024 * 1024 * 1024
+
+
+def _iter_line_batches(input_file, desc, block_size=4 << 20):
+    """Yield lists of stripped lines, reading and decoding the file in large blocks."""
+    with open(input_file, "rb") as infile, tqdm(
+        total=os.path.getsize(input_file), unit="B", unit_scale=True, desc=desc
+    ) as pbar:
+        remainder = b""
+        while True:
+            block = infile.read(block_size)
+            if not block:
+                break
+            pbar.update(len(block))
+            block = remainder + block
+            # Only decode up to the last newline so multi-byte characters are never split
+            cut = block.rfind(b"\n") + 1
+            remainder = block[cut:]
+            if cut:
+                yield [line.strip() for line in block[:cut].decode("utf-8").split("\n")[:-1]]
+        if remainder:
+            yield [remainder.decode("utf-8").strip()]
+
+
+def _dedup_in_memory(input_file, outfile, bits, max_memory, near_dup):
+    seen = CompactHashSet(bits)
+    total_lines = unique_count = 0
+
+    for batch in _iter_line_batches(input_file, "Deduplicating lines"):
+        total_lines += len(batch)
+        novel = seen.add_many(hash_lines(batch, bits))
+        kept = [line for line, new in zip(batch, novel) if new]
+        if near_dup is not None:
+            kept = [line for line in kept if near_dup.add(line)]
+        if kept:
+            outfile.write("\n".join(kept) + "\n")
+        unique_count += len(kept)
+        if max_memory and seen.nbytes > max_memory:
+            raise MemoryBudgetExceeded()
+
+    return total_lines, unique_count
+
+
+def _spill(records, fmt, chunk_records, temp_dir):
+    """Write sorted runs of fixed-size records to temp files and return their paths."""
+    paths = []
+    chunk = []
+
+    def flush():
+        chunk.sort()
+        fd, path = tempfile.mkstemp(dir=temp_dir, suffix=".run")
+        with os.fdopen(fd, "wb") as f:
+            f.write(b"".join(struct.pack(fmt, *record) for record in chunk))
+        paths.append(path)
+        chunk.clear()
+
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= chunk_records:
+            flush()
+    if chunk:
+        flush()
+    return paths
+
+
+def _read_run(path, fmt):
+    size = struct.calcsize(fmt)
+    with open(path, "rb") as f:
+        while True:
+            data = f.read(size * 4096)
+            if not data:
+                return
+            yield from struct.iter_unpack(fmt, data)
+
+
+def _merge_runs(paths, fmt):
+    return heapq.merge(*(_read_run(path, fmt) for path in paths))
+
+
+def _dedup_external(input_file, outfile, bits, chunk_records, temp_dir):
+    """Sort-and-merge dedup for inputs whose unique set does not fit in RAM.
+
+    Pass 1 spills sorted (hash, offset) runs; merging them yields the first
+    offset of every distinct hash. Those offsets are sorted again, and pass 2
+    streams the input, writing only lines that start at a kept offset.
+    """
+    words = bits // 64
+    hash_fmt = "<" + "Q" * (words + 1)
+    counter = {"total": 0}
+
+    def hashed():
+        for offset, raw in _iter_lines(input_file, "Hashing lines"):
+            counter["total"] += 1
+            value = line_hash(raw.decode("utf-8").strip(), bits)
+            parts = [(value >> (64 * i)) & 0xFFFFFFFFFFFFFFFF for i in reversed(range(words))]
+            yield (*parts, offset)
+
+    with tempfile.TemporaryDirectory(dir=temp_dir) as work_dir:
+        hash_runs = _spill(hashed(), hash_fmt, chunk_records, work_dir)
+
+        def first_offsets():
+            previous = None
+            for record in _merge_runs(hash_runs, hash_fmt):
+                if record[:-1] != previous:
+                    previous = record[:-1]
+                    yield (record[-1],)
+
+        offset_runs = _spill(first_offsets(), "<Q", chunk_records, work_dir)
+        for path in hash_runs:
+            os.remove(path)
+
+        keep = (record[0] for record in _merge_runs(offset_runs, "<Q"))
+        next_keep = next(keep, None)
+        unique_count = 0
+        for offset, raw in _iter_lines(input_file, "Writing unique lines"):
+            if offset != next_keep:
+                continue
+            outfile.write(raw.decode("utf-8").strip() + "\n")
+            unique_count += 1
+            next_keep = next(keep, None)
+
+    return counter["total"], unique_count
+
+
+def deduplicate_lines(
+    input_file,
+    output_file,
+    bits=64,
+    mode="auto",
+    max_memory_mb=None,
+    near_dup_threshold=None,
+    chunk_records=1_000_000,
+    temp_dir=None,
+):
+    near_dup = (
+        NearDuplicateIndex(near_dup_threshold) if near_dup_threshold is not None else None
+    )
+    max_memory = max_memory_mb * 1024 * 1024 if max_memory_mb else default_memory_budget()
 
-    # Count total lines for the progress bar
-    with open(input_file, "r", encoding="utf-8") as f:
-        total_lines = sum(1 for _ in f)
+    if near_dup is not None and mode == "external":
+        raise ValueError("Near-duplicate detection requires the in-memory mode")
 
-    with open(input_file, "r", encoding="utf-8") as infile, open(
-        output_file, "w", encoding="utf-8"
-    ) as outfile:
+    total_lines = unique_count = None
+    if mode in ("auto", "memory"):
+        try:
+            with open(output_file, "w", encoding="utf-8") as outfile:
+                total_lines, unique_count = _dedup_in_memory(
+                    input_file,
+                    outfile,
+                    bits,
+                    max_memory if mode == "auto" and near_dup is None else None,
+                    near_dup,
+                )
+        except MemoryBudgetExceeded:
+            print("Memory budget exceeded, switching to external sort-and-merge")
 
-        for line in tqdm(infile, total=total_lines, desc="Deduplicating lines"):
-            line = line.strip()
-            if line not in unique_lines:
-                unique_lines.add(line)
-                outfile.write(line + "\n")
-                unique_count += 1
+    if total_lines is None:
+        with open(output_file, "w", encoding="utf-8") as outfile:
+            total_lines, unique_count = _dedup_external(
+                input_file, outfile, bits, chunk_records, temp_dir
+            )
 
     print(f"Total lines: {total_lines}")
     print(f"Unique lines: {unique_count}")
@@ -31,6 +371,38 @@ def main():
     parser = argparse.ArgumentParser(description="Deduplicate lines in a text file.")
     parser.add_argument("input_file", help="Path to the input text file")
     parser.add_argument("-o", "--output", help="Path to the output file (optional)")
+    parser.add_argument(
+        "--hash-bits",
+        type=int,
+        choices=[64, 128],
+        default=64,
+        help="Line hash width; 128 makes collisions practically impossible (default: 64)",
+    )
+    parser.add_argument(
+        "--mode",
+        choices=["auto", "memory", "external"],
+        default="auto",
+        help="auto uses memory until the memory budget is exceeded, then external sort (default: auto)",
+    )
+    parser.add_argument(
+        "--max-memory",
+        type=int,
+        default=None,
+        help="Memory budget in MB for the hash set in auto mode (default: half of available RAM)",
+    )
+    parser.add_argument(
+        "--near-dup",
+        type=float,
+        default=None,
+        help="Also drop near-duplicates with estimated Jaccard similarity >= this (e.g. 0.8)",
+    )
+    parser.add_argument(
+        "--chunk-lines",
+        type=int,
+        default=1_000_000,
+        help="Records per sorted run in external mode (default: 1000000)",
+    )
+    parser.add_argument("--temp-dir", default=None, help="Directory for external sort runs")
 
     args = parser.parse_args()
 
@@ -39,7 +411,16 @@ def main():
     else:
         output_file = args.input_file.rsplit(".", 1)[0] + "_dedup.txt"
 
-    deduplicate_lines(args.input_file, output_file)
+    deduplicate_lines(
+        args.input_file,
+        output_file,
+        args.hash_bits,
+        args.mode,
+        args.max_memory,
+        args.near_dup,
+        args.chunk_lines,
+        args.temp_dir,
+    )
     print(f"Deduplicated file saved to {output_file}")
 
 
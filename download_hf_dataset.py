@@ -1,73 +1,244 @@
 import argparse
+from concurrent.futures import ThreadPoolExecutor, wait
+from datasets import Image as ImageFeature
 from datasets import load_dataset
 import os
 import json
 import requests
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlparse
 from PIL import Image
 from io import BytesIO
 
-def download_image(url, save_path):
-    response = requests.get(url)
-    if response.status_code == 200:
-        img = Image.open(BytesIO(response.content))
-        img.save(save_path)
+IMAGE_SIGNATURES = {
+    b"\x89PNG\r\n\x1a\n": ".png",
+    b"\xff\xd8\xff": ".jpg",
+    b"GIF87a": ".gif",
+    b"GIF89a": ".gif",
+}
+URL_IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".gif", ".webp")
+
+
+def detect_extension(data):
+    for signature, extension in IMAGE_SIGNATURES.items():
+        if data.startswith(signature):
+            return extension
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return ".webp"
+    return None
+
+
+def make_session(pool_size):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=3)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def download_image(url, save_path, session=None):
+    if os.path.exists(save_path):
+        return
+    # Closing the response returns the connection to the pool, whatever the status
+    with (session or requests).get(url, stream=True, timeout=30) as response:
+        if response.status_code != 200:
+            raise IOError(f"HTTP {response.status_code} downloading {url}")
+        # Stream the original bytes to disk; no decode/re-encode
+        temp_path = save_path + ".part"
+        with open(temp_path, "wb") as f:
+            for chunk in response.iter_content(chunk_size=1 << 16):
+                f.write(chunk)
+        os.replace(temp_path, save_path)
+
+
+def save_image_bytes(data, img_folder, stem):
+    """Write embedded image bytes as-is when the format is recognised, else as PNG."""
+    extension = detect_extension(data)
+    if extension:
+        img_path = os.path.join(img_folder, stem + extension)
+        if not os.path.exists(img_path):
+            with open(img_path, "wb") as f:
+                f.write(data)
     else:
-        print(f"Failed to download image: {url}")
+        img_path = os.path.join(img_folder, stem + ".png")
+        if not os.path.exists(img_path):
+            Image.open(BytesIO(data)).save(img_path)
+    return os.path.basename(img_path)
+
+
+def repair_jsonl(path):
+    """Drop a partial last line left by an interrupted write and return the line count."""
+    if not os.path.exists(path):
+        return 0
+    with open(path, "rb+") as f:
+        end = f.seek(0, os.SEEK_END)
+        position = end
+        while position > 0:
+            step = min(1 << 16, position)
+            f.seek(position - step)
+            newline = f.read(step).rfind(b"\n")
+            if newline != -1:
+                position = position - step + newline + 1
+                break
+            position -= step
+        if position != end:
+            f.truncate(position)
+        f.seek(0)
+        return sum(1 for _ in f)
+
+
+def with_raw_images(split_dataset):
+    """Ask datasets for undecoded image bytes so they can be written without re-encoding."""
+    features = getattr(split_dataset, "features", None) or {}
+    for name, feature in features.items():
+        if isinstance(feature, ImageFeature) and feature.decode:
+            split_dataset = split_dataset.cast_column(name, ImageFeature(decode=False))
+    return split_dataset
+
+
+def iter_rows(split_dataset, batch_size):
+    """Yield rows from map-style or streaming datasets, fetched in batches."""
+    for batch in split_dataset.iter(batch_size=batch_size):
+        keys = list(batch.keys())
+        for values in zip(*(batch[key] for key in keys)):
+            yield dict(zip(keys, values))
+
+
+def export_row(idx, item, img_folder, executor, session):
+    """Schedule image work for one row and return (row_copy, futures)."""
+    item_copy = dict(item)
+    futures = []
+    for key, value in item.items():
+        if isinstance(value, dict) and value.get('bytes'):
+            # This is likely an image
+            os.makedirs(img_folder, exist_ok=True)
+            future = executor.submit(save_image_bytes, value['bytes'], img_folder, f"{idx}_{key}")
+            futures.append((key, future))
+        elif isinstance(value, str) and value.startswith(('http://', 'https://')):
+            # This might be an image URL
+            os.makedirs(img_folder, exist_ok=True)
+            extension = os.path.splitext(urlparse(value).path)[1].lower()
+            if extension not in URL_IMAGE_EXTENSIONS:
+                extension = ".jpg"
+            img_filename = f"{idx}_{key}{extension}"
+            futures.append((key, executor.submit(
+                download_image, value, os.path.join(img_folder, img_filename), session
+            )))
+            item_copy[key] = img_filename
+    return item_copy, futures
+
 
-def download_dataset(repo_id, output_folder):
+def download_dataset(repo_id, output_folder, streaming=False, workers=8, batch_size=256, resume=True):
     print(f"Downloading dataset: {repo_id}")
-    dataset = load_dataset(repo_id)
+    # repo_id may also be a local dataset directory
+    dataset = load_dataset(repo_id, streaming=streaming)
 
     os.makedirs(output_folder, exist_ok=True)
+    session = make_session(workers)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for split in dataset.keys():
+            split_folder = os.path.join(output_folder, split)
+            os.makedirs(split_folder, exist_ok=True)
+            img_folder = os.path.join(split_folder, 'images')
+
+            output_path = os.path.join(split_folder, f"{split}.jsonl")
+            failures_path = os.path.join(split_folder, f"{split}.failures.jsonl")
+            split_dataset = with_raw_images(dataset[split])
+
+            # Every row lands in exactly one of the two files, and only once its
+            # images are settled, so their combined line count is a safe resume point
+            done = repair_jsonl(output_path) + repair_jsonl(failures_path) if resume else 0
+            if done and hasattr(split_dataset, "__len__"):
+                if done >= len(split_dataset):
+                    print(f"{split} split already complete ({done} rows)")
+                    continue
+                print(f"Resuming {split} split after {done} rows")
+                split_dataset = split_dataset.select(range(done, len(split_dataset)))
+            elif done:
+                print(f"Resuming {split} split after {done} rows")
+                split_dataset = split_dataset.skip(done)
+            print(f"Saving {split} split to: {output_path}")
+
+            mode = 'a' if done else 'w'
+            with open(output_path, mode, encoding='utf-8') as f, open(
+                failures_path, mode, encoding='utf-8'
+            ) as failures:
+                pending = []
+                failed = 0
+                for idx, item in enumerate(iter_rows(split_dataset, batch_size), start=done):
+                    pending.append((idx, *export_row(idx, item, img_folder, executor, session)))
+                    if len(pending) >= batch_size:
+                        failed += flush_rows(pending, f, failures)
+                failed += flush_rows(pending, f, failures)
+            if failed:
+                print(f"{failed} rows with failed images logged to {failures_path} for retry")
 
-    for split in dataset.keys():
-        split_folder = os.path.join(output_folder, split)
-        os.makedirs(split_folder, exist_ok=True)
-
-        output_path = os.path.join(split_folder, f"{split}.jsonl")
-        print(f"Saving {split} split to: {output_path}")
-        
-        with open(output_path, 'w', encoding='utf-8') as f:
-            for idx, item in enumerate(dataset[split]):
-                item_copy = item.copy()
-                for key, value in item.items():
-                    if isinstance(value, dict) and 'bytes' in value:
-                        # This is likely an image
-                        img_folder = os.path.join(split_folder, 'images')
-                        os.makedirs(img_folder, exist_ok=True)
-                        img_filename = f"{idx}_{key}.jpg"
-                        img_path = os.path.join(img_folder, img_filename)
-                        
-                        img = Image.open(BytesIO(value['bytes']))
-                        img.save(img_path)
-                        
-                        item_copy[key] = img_filename
-                    elif isinstance(value, str) and value.startswith(('http://', 'https://')):
-                        # This might be an image URL
-                        img_folder = os.path.join(split_folder, 'images')
-                        os.makedirs(img_folder, exist_ok=True)
-                        img_filename = f"{idx}_{key}.jpg"
-                        img_path = os.path.join(img_folder, img_filename)
-                        
-                        download_image(value, img_path)
-                        item_copy[key] = img_filename
-                
-                json.dump(item_copy, f, ensure_ascii=False)
-                f.write('\n')
-    
     print("Download complete!")
 
 
+def flush_rows(pending, f, failures):
+    """Wait for the batch's image jobs, then append its rows in order.
+
+    Rows whose images failed go to the failures file instead, as
+    {"idx", "errors"}, so they can be retried. Each row is flushed as it is
+    written, keeping the two files' combined line count an exact resume point.
+    Returns the number of failed rows.
+    """
+    wait([future for _, _, futures in pending for _, future in futures])
+    failed = 0
+    for idx, item_copy, futures in pending:
+        errors = {}
+        for key, future in futures:
+            try:
+                result = future.result()
+            except Exception as e:
+                errors[key] = str(e)
+                continue
+            if result is not None:
+                item_copy[key] = result
+        if errors:
+            print(f"Failed to save images for row {idx}: {errors}")
+            failures.write(json.dumps({"idx": idx, "errors": errors}) + '\n')
+            failures.flush()
+            failed += 1
+            continue
+        json.dump(item_copy, f, ensure_ascii=False, default=str)
+        f.write('\n')
+        f.flush()
+    pending.clear()
+    return failed
+
+
 def main():
     parser = argparse.ArgumentParser(description="Download a Hugging Face dataset")
-    parser.add_argument("repo_id", help="The repository ID of the dataset")
+    parser.add_argument("repo_id", help="The repository ID of the dataset, or a local dataset directory")
     parser.add_argument(
         "--output", default="output", help="The output folder to save the dataset"
     )
+    parser.add_argument(
+        "--streaming", action="store_true", help="Stream rows instead of downloading the full dataset first"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=8, help="Parallel image writes/downloads (default: 8)"
+    )
+    parser.add_argument(
+        "--batch-size", type=int, default=256, help="Rows fetched and flushed per batch (default: 256)"
+    )
+    parser.add_argument(
+        "--no-resume", action="store_true", help="Rewrite splits from scratch instead of resuming"
+    )
 
     args = parser.parse_args()
 
-    download_dataset(args.repo_id, args.output)
+    download_dataset(
+        args.repo_id,
+        args.output,
+        args.streaming,
+        args.workers,
+        args.batch_size,
+        not args.no_resume,
+    )
 
 
 if __name__ == "__main__":
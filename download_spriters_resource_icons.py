@@ -1,58 +1,145 @@
 import os
 import argparse
+import hashlib
 import logging
 import concurrent.futures
-import requests
+import threading
+import time
+import uuid
 from bs4 import BeautifulSoup
 from PIL import Image
 from tqdm import tqdm
 from urllib.parse import urlparse
 
+from crawl_session import CrawlIndex, PoliteSession
+
 BASE_URL = "https://www.spriters-resource.com"
 
-def download_image(url, output_folder):
-    url = BASE_URL + url
-    
-    response = requests.get(url)
-    if response.status_code == 200:
-        parsed_url = urlparse(url)
-        filename = os.path.basename(parsed_url.path)
-        file_path = os.path.join(output_folder, filename)
-        with open(file_path, "wb") as file:
-            file.write(response.content)
-        try:
-            img = Image.open(file_path)
-            img.save(
-                file_path, format=img.format, transparency=img.info.get("transparency")
-            )
-        except Exception as e:
-            logging.error(f"Error processing image {file_path}: {str(e)}")
-        return file_path
-    else:
+
+class IconStore:
+    """Tracks content hashes so identical icons are only kept once."""
+
+    def __init__(self, index):
+        self.index = index
+        self.lock = threading.Lock()
+
+    def claim(self, digest, temp_path, file_path):
+        """Move temp_path into place unless the content already exists; return the final path."""
+        with self.lock:
+            existing = self.index.lookup("hashes", digest)
+            if existing and os.path.exists(existing):
+                os.remove(temp_path)
+                return existing, True
+
+            if os.path.exists(file_path):
+                # Same name, different content: keep both
+                name, ext = os.path.splitext(file_path)
+                file_path = f"{name}_{digest[:8]}{ext}"
+            os.replace(temp_path, file_path)
+            self.index.record("hashes", digest, file_path)
+            return file_path, False
+
+
+def is_valid_image(file_path):
+    """Header-only check: Image.open parses the header without decoding pixels."""
+    try:
+        with Image.open(file_path) as img:
+            return img.format is not None
+    except Exception:
+        return False
+
+
+def download_image(url, output_folder, session=None, index=None, store=None):
+    url = BASE_URL + url if url.startswith("/") else url
+
+    if index is not None:
+        previous = index.downloaded(url)
+        if previous and os.path.exists(previous):
+            return previous, 0, "cached"
+
+    session = session or PoliteSession()
+    response = session.get(url, stream=True)
+    if response.status_code != 200:
+        response.close()
         logging.error(f"Failed to download image from URL: {url}")
-        return None
+        return None, 0, "failed"
+
+    parsed_url = urlparse(url)
+    filename = os.path.basename(parsed_url.path)
+    file_path = os.path.join(output_folder, filename)
+    temp_path = os.path.join(output_folder, f".{uuid.uuid4().hex}.part")
 
+    # Stream to disk once, hashing as we go; no decode/re-encode
+    digest = hashlib.sha256()
+    size = 0
+    with response, open(temp_path, "wb") as file:
+        for chunk in response.iter_content(chunk_size=1 << 16):
+            file.write(chunk)
+            digest.update(chunk)
+            size += len(chunk)
 
-def download_images(url, output_folder, max_workers=None):
-    response = requests.get(url)
+    if not is_valid_image(temp_path):
+        os.remove(temp_path)
+        logging.error(f"Downloaded file is not a valid image: {url}")
+        return None, size, "invalid"
+
+    if store is not None:
+        file_path, duplicate = store.claim(digest.hexdigest(), temp_path, file_path)
+    else:
+        os.replace(temp_path, file_path)
+        duplicate = False
+
+    if index is not None:
+        index.mark_downloaded(url, file_path)
+    return file_path, size, "duplicate" if duplicate else "downloaded"
+
+
+def download_images(url, output_folder, max_workers=None, per_host=8, rate=10.0):
+    session = PoliteSession(per_host=per_host, rate=rate)
+    response = session.get(url)
     if response.status_code == 200:
         soup = BeautifulSoup(response.text, "html.parser")
         img_elements = soup.select(".iconcontainer > .iconbody > img")
         img_urls = [img["src"] for img in img_elements]
 
         os.makedirs(output_folder, exist_ok=True)
+        index = CrawlIndex(os.path.join(output_folder, ".icon_index.json"))
+        store = IconStore(index)
+
+        counts = {"downloaded": 0, "duplicate": 0, "cached": 0, "failed": 0, "invalid": 0}
+        total_bytes = 0
+        start = time.perf_counter()
 
         with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
             futures = [
-                executor.submit(download_image, img_url, output_folder)
+                executor.submit(download_image, img_url, output_folder, session, index, store)
                 for img_url in img_urls
             ]
             with tqdm(total=len(futures), unit="image") as pbar:
                 for future in concurrent.futures.as_completed(futures):
-                    file_path = future.result()
-                    if file_path:
+                    try:
+                        file_path, size, status = future.result()
+                    except Exception as e:
+                        logging.error(f"Download failed: {e}")
+                        file_path, size, status = None, 0, "failed"
+                    counts[status] += 1
+                    total_bytes += size
+                    if status == "downloaded":
                         logging.info(f"Downloaded image: {file_path}")
                     pbar.update(1)
+
+        index.save()
+        elapsed = max(time.perf_counter() - start, 1e-9)
+        fetched = counts["downloaded"] + counts["duplicate"]
+        logging.info(
+            f"{counts['downloaded']} new, {counts['duplicate']} duplicates, "
+            f"{counts['cached']} already downloaded, {counts['failed'] + counts['invalid']} failed"
+        )
+        logging.info(
+            f"Throughput: {fetched / elapsed:.1f} images/s, "
+            f"{total_bytes / elapsed / 1024:.1f} KiB/s over {elapsed:.1f}s"
+        )
+        return counts
     else:
         logging.error(
             f"Failed to fetch the webpage. Status code: {response.status_code}"
@@ -68,6 +155,12 @@ if __name__ == "__main__":
     parser.add_argument(
         "--max-workers", type=int, default=None, help="Maximum number of worker threads"
     )
+    parser.add_argument(
+        "--per-host", type=int, default=8, help="Maximum concurrent requests per host (default: 8)"
+    )
+    parser.add_argument(
+        "--rate", type=float, default=10.0, help="Maximum requests per second per host (default: 10)"
+    )
     parser.add_argument(
         "--log-level", type=str, default="INFO", help="Logging level (default: INFO)"
     )
@@ -77,4 +170,4 @@ if __name__ == "__main__":
         level=args.log_level, format="%(asctime)s - %(levelname)s - %(message)s"
     )
 
-    download_images(args.url, args.output_folder, args.max_workers)
+    download_images(args.url, args.output_folder, args.max_workers, args.per_host, args.rate)
@@ -1,23 +1,29 @@
 import os
-import requests
 from bs4 import BeautifulSoup
 import argparse
 import logging
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
 from urllib.parse import urlparse, urljoin
 from tqdm import tqdm
 import re
 import zipfile
 
-def download_image(url, output_folder):
-    response = requests.get(url)
-    if response.status_code == 200:
-        parsed_url = urlparse(url)
-        filename = os.path.join(output_folder, os.path.basename(parsed_url.path))
-        with open(filename, "wb") as file:
-            file.write(response.content)
+from crawl_session import CrawlIndex, PoliteSession
+
+BASE_URL = "https://www.spriters-resource.com"
+
+
+def download_image(url, output_folder, session, index):
+    parsed_url = urlparse(url)
+    filename = os.path.join(output_folder, os.path.basename(parsed_url.path))
+    if index.downloaded(url) and os.path.exists(filename):
+        return None
+    if session.download(url, filename):
+        index.mark_downloaded(url, filename)
         logging.info(f"Downloaded: {filename}")
     else:
         logging.warning(f"Failed to download: {url}")
+    return None
 
 
 def sanitize_filename(filename):
@@ -28,97 +34,188 @@ def sanitize_filename(filename):
     return re.sub(invalid_chars, "_", filename)
 
 
-def scrape_images(base_url, url, output_folder, download_zips=False):
-    response = requests.get(url)
-    if response.status_code == 200:
-        soup = BeautifulSoup(response.text, "html.parser")
-        update_sheet_icons = soup.find_all(class_="updatesheeticons")
-        total_icons = len(update_sheet_icons)
-        logging.info(f"Found {total_icons} update sheet icons")
-
-        for icon in tqdm(update_sheet_icons, desc="Processing icons", unit="icon"):
-            links = icon.find_all("a")
-            total_links = len(links)
-            logging.info(f"Found {total_links} links for the current icon")
-
-            for link in links:
-                href = link.get("href")
-                if href:
-                    sheet_url = base_url + href
-                    sheet_response = requests.get(sheet_url)
-                    if sheet_response.status_code == 200:
-                        sheet_soup = BeautifulSoup(sheet_response.text, "html.parser")
-
-                        if download_zips:
-                            sheet_container = sheet_soup.find(id="content")
-                        else:
-                            sheet_container = sheet_soup.find(id="sheet-container")
-
-                        if download_zips and sheet_container:
-                            download_links = sheet_container.find_all("a", href=re.compile(r"/download/\d+"))
-                            total_links = len(download_links)
-                            logging.info(f"Found {total_links} download links in the content")
-
-                            for dl_link in tqdm(download_links, desc="Processing downloads", unit="file", leave=False):
-                                download_url = urljoin(base_url, dl_link["href"])
-                                try:
-                                    response = requests.get(download_url, stream=True)
-                                    response.raise_for_status()
-
-                                    # Extract filename from Content-Disposition header
-                                    content_disposition = response.headers.get('content-disposition', '')
-                                    if 'filename=' in content_disposition:
-                                        filename = content_disposition.split('filename=')[-1]
-                                        filename = sanitize_filename(filename)
-                                    else:
-                                        # Fallback filename based on URL
-                                        filename = f"sheet_{dl_link['href'].split('/')[-1]}.zip"
-                                    
-                                    filepath = os.path.join(output_folder, filename)
-                                    
-                                    with open(filepath, 'wb') as f:
-                                        for chunk in response.iter_content(chunk_size=8192):
-                                            f.write(chunk)
-
-                                    # If it's a zip file, extract it
-                                    if filename.lower().endswith('.zip'):
-                                        with zipfile.ZipFile(filepath) as zf:
-                                            extract_path = os.path.join(output_folder, 'sheets')
-                                            zf.extractall(extract_path)
-                                        # Optionally remove the zip file after extraction
-                                        os.remove(filepath)
-                                        logging.info(f"Extracted {filename} to {extract_path}")
-                                    else:
-                                        logging.info(f"Downloaded {filename}")
-
-                                except requests.exceptions.RequestException as e:
-                                    logging.error(f"Failed to download {download_url}: {e}")
-                                except zipfile.BadZipFile:
-                                    logging.error(f"Invalid zip file: {filepath}")
-                                    if os.path.exists(filepath):
-                                        os.remove(filepath)
-                        else:
-                            if sheet_container:
-                                images = sheet_container.find_all("img")
-                                total_images = len(images)
-                                logging.info(
-                                    f"Found {total_images} images in the sheet container"
-                                )
-
-                                for image in tqdm(
-                                    images,
-                                    desc="Downloading images",
-                                    unit="image",
-                                    leave=False,
-                                ):
-                                    image_url = base_url + image["src"]
-                                    download_image(image_url, output_folder)
-                            else:
-                                logging.warning(f"Sheet container not found: {sheet_url}")
-                    else:
-                        logging.warning(f"Failed to load sheet: {sheet_url}")
-    else:
+def download_file(download_url, href, output_folder, session):
+    """Download a /download/ link; returns the saved path, or None on failure."""
+    response = session.get(download_url, stream=True)
+    with response:
+        if response.status_code != 200:
+            logging.error(f"Failed to download {download_url}: HTTP {response.status_code}")
+            return None
+
+        # Extract filename from Content-Disposition header
+        content_disposition = response.headers.get('content-disposition', '')
+        if 'filename=' in content_disposition:
+            filename = content_disposition.split('filename=')[-1]
+            filename = sanitize_filename(filename)
+        else:
+            # Fallback filename based on URL
+            filename = f"sheet_{href.rstrip('/').split('/')[-1]}.zip"
+
+        filepath = os.path.join(output_folder, filename)
+        temp_path = filepath + ".part"
+        with open(temp_path, 'wb') as f:
+            for chunk in response.iter_content(chunk_size=1 << 16):
+                f.write(chunk)
+        os.replace(temp_path, filepath)
+    return filepath
+
+
+def extract_zip(filepath, extract_path):
+    """Runs in the extractor process so unzipping overlaps with downloads."""
+    try:
+        with zipfile.ZipFile(filepath) as zf:
+            zf.extractall(extract_path)
+    except zipfile.BadZipFile:
+        if os.path.exists(filepath):
+            os.remove(filepath)
+        raise
+    # Remove the zip file after extraction
+    os.remove(filepath)
+    return filepath
+
+
+def parse_sheet(sheet_url, base_url, session, download_zips=False):
+    """Fetch a sheet page and return the asset URLs it links to (None on failure)."""
+    sheet_response = session.get(sheet_url)
+    if sheet_response.status_code != 200:
+        logging.warning(f"Failed to load sheet: {sheet_url}")
+        return None
+
+    sheet_soup = BeautifulSoup(sheet_response.text, "html.parser")
+
+    if download_zips:
+        sheet_container = sheet_soup.find(id="content")
+        if not sheet_container:
+            return []
+        download_links = sheet_container.find_all("a", href=re.compile(r"/download/\d+"))
+        logging.info(f"Found {len(download_links)} download links in the content")
+        return [urljoin(base_url, link["href"]) for link in download_links]
+
+    sheet_container = sheet_soup.find(id="sheet-container")
+    if not sheet_container:
+        logging.warning(f"Sheet container not found: {sheet_url}")
+        return []
+    images = sheet_container.find_all("img")
+    logging.info(f"Found {len(images)} images in the sheet container")
+    return [urljoin(base_url, image["src"]) for image in images]
+
+
+def scrape_images(
+    base_url,
+    url,
+    output_folder,
+    download_zips=False,
+    workers=8,
+    per_host=4,
+    rate=4.0,
+    session=None,
+):
+    session = session or PoliteSession(per_host=per_host, rate=rate)
+    index = CrawlIndex(os.path.join(output_folder, ".crawl_index.json"))
+
+    response = session.get(url)
+    if response.status_code != 200:
         logging.error(f"Failed to load URL: {url}")
+        return
+
+    soup = BeautifulSoup(response.text, "html.parser")
+    update_sheet_icons = soup.find_all(class_="updatesheeticons")
+    logging.info(f"Found {len(update_sheet_icons)} update sheet icons")
+
+    sheet_urls = []
+    for icon in update_sheet_icons:
+        for link in icon.find_all("a"):
+            href = link.get("href")
+            if href:
+                sheet_urls.append(urljoin(base_url, href))
+    # The same sheet is often linked from several icons; fetch each one once, in page order
+    sheet_urls = list(dict.fromkeys(sheet_urls))
+    logging.info(f"Found {len(sheet_urls)} unique sheet links")
+
+    extract_path = os.path.join(output_folder, 'sheets')
+    pending = set()
+    submitted_assets = set()
+    extractions = set()
+    failed = 0
+
+    with ThreadPoolExecutor(max_workers=workers) as executor, ProcessPoolExecutor(max_workers=1) as extractor:
+
+        def submit_assets(asset_urls):
+            for asset_url in asset_urls:
+                if asset_url in submitted_assets or index.downloaded(asset_url):
+                    continue
+                submitted_assets.add(asset_url)
+                if download_zips:
+                    href = urlparse(asset_url).path
+                    future = executor.submit(download_file, asset_url, href, output_folder, session)
+                else:
+                    future = executor.submit(download_image, asset_url, output_folder, session, index)
+                future.asset_url = asset_url
+                pending.add(future)
+
+        # Sheets parsed on an earlier run (in the same mode) are not fetched again
+        for sheet_url in sheet_urls:
+            sheet_key = sheet_url + ("#zips" if download_zips else "#images")
+            cached = index.is_visited(sheet_key) and index.data["visited"][sheet_key]
+            if isinstance(cached, list):
+                submit_assets(cached)
+            else:
+                future = executor.submit(parse_sheet, sheet_url, base_url, session, download_zips)
+                future.sheet_key = sheet_key
+                pending.add(future)
+
+        with tqdm(total=len(pending), desc="Crawling", unit="task") as pbar:
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    pbar.update(1)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        failed += 1
+                        logging.error(f"Task failed: {e}")
+                        continue
+
+                    if hasattr(future, "sheet_key"):
+                        if result is not None:
+                            index.mark_visited(future.sheet_key, result)
+                            submit_assets(result)
+                            pbar.total += len(result)
+                    elif download_zips and result:
+                        if result.lower().endswith('.zip'):
+                            extraction = extractor.submit(extract_zip, result, extract_path)
+                            extraction.asset_url = future.asset_url
+                            extractions.add(extraction)
+                        else:
+                            index.mark_downloaded(future.asset_url, result)
+                            logging.info(f"Downloaded {os.path.basename(result)}")
+
+                # Record finished extractions as downloads as they complete
+                finished = {e for e in extractions if e.done()}
+                extractions -= finished
+                for extraction in finished:
+                    record_extraction(extraction, index, extract_path)
+
+        for extraction in extractions:
+            wait([extraction])
+            record_extraction(extraction, index, extract_path)
+
+    index.save()
+    if failed:
+        logging.warning(f"{failed} tasks failed; rerun to retry them")
+
+
+def record_extraction(extraction, index, extract_path):
+    try:
+        filepath = extraction.result()
+    except zipfile.BadZipFile:
+        logging.error(f"Invalid zip file from {extraction.asset_url}")
+        return
+    except Exception as e:
+        logging.error(f"Failed to extract zip from {extraction.asset_url}: {e}")
+        return
+    index.mark_downloaded(extraction.asset_url, extract_path)
+    logging.info(f"Extracted {os.path.basename(filepath)} to {extract_path}")
 
 
 def main():
@@ -139,9 +236,20 @@ def main():
         action="store_true",
         help="Download and extract zip files from /download/ links",
     )
+    parser.add_argument(
+        "--base-url", type=str, default=BASE_URL, help=f"Site root used to resolve links (default: {BASE_URL})"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=8, help="Number of concurrent page/file fetches (default: 8)"
+    )
+    parser.add_argument(
+        "--per-host", type=int, default=4, help="Maximum concurrent requests per host (default: 4)"
+    )
+    parser.add_argument(
+        "--rate", type=float, default=4.0, help="Maximum requests per second per host (default: 4)"
+    )
     args = parser.parse_args()
 
-    base_url = "https://www.spriters-resource.com"
     url = args.url
     output_folder = args.output
 
@@ -156,7 +264,15 @@ def main():
     )
 
     logging.info(f"Starting image scraping from: {url}")
-    scrape_images(base_url, url, output_folder, args.download_zips)
+    scrape_images(
+        args.base_url,
+        url,
+        output_folder,
+        args.download_zips,
+        args.workers,
+        args.per_host,
+        args.rate,
+    )
     logging.info("Image scraping completed")
 
 
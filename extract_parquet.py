@@ -1,42 +1,237 @@
 import argparse
+import json
 import os
+import pyarrow as pa
+import pyarrow.csv as pacsv
 import pyarrow.parquet as pq
-import pandas as pd
-from datasets import load_from_disk
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
 from PIL import Image
 import io
 
+# Formats that are written byte-for-byte instead of being re-encoded
+PASSTHROUGH_FORMATS = {
+    b"\x89PNG\r\n\x1a\n": "png",
+    b"\xff\xd8\xff": "jpg",
+}
 
-def extract_parquet(input_path, output_folder):
+
+def detect_passthrough_format(data):
+    head = bytes(data[:8])
+    for magic, extension in PASSTHROUGH_FORMATS.items():
+        if head.startswith(magic):
+            return extension
+    return None
+
+
+def write_raw(data, path):
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
+
+
+def decode_and_save(data, path):
+    """Decode an image in a worker process and save it as PNG."""
+    img = Image.open(io.BytesIO(data))
+    img.save(path)
+    return path
+
+
+def image_buffers(column):
+    """Yield a zero-copy buffer (or None) per row of an image column.
+
+    Handles plain binary columns and Hugging Face Image structs ({bytes, path}).
+    """
+    if isinstance(column, pa.ChunkedArray):
+        for chunk in column.chunks:
+            yield from image_buffers(chunk)
+        return
+    if pa.types.is_struct(column.type):
+        column = column.field("bytes")
+    for value in column:
+        yield value.as_buffer() if value.is_valid else None
+
+
+def is_image_column(column_type):
+    if pa.types.is_struct(column_type):
+        return column_type.get_field_index("bytes") != -1
+    return pa.types.is_binary(column_type) or pa.types.is_large_binary(column_type)
+
+
+class ImageWriter:
+    """Writes passthrough images on threads and re-encodes the rest on processes."""
+
+    def __init__(self, output_folder, workers=None, max_pending=256):
+        self.output_folder = output_folder
+        self.threads = ThreadPoolExecutor(max_workers=workers)
+        self.processes = ProcessPoolExecutor(max_workers=workers)
+        self.max_pending = max_pending
+        self.pending = set()
+        self.written = 0
+
+    def submit(self, index, buffer):
+        extension = detect_passthrough_format(buffer)
+        if extension:
+            path = os.path.join(self.output_folder, f"image_{index}.{extension}")
+            # memoryview keeps the Arrow buffer zero-copy all the way to write()
+            future = self.threads.submit(write_raw, memoryview(buffer), path)
+        else:
+            path = os.path.join(self.output_folder, f"image_{index}.png")
+            future = self.processes.submit(decode_and_save, buffer.to_pybytes(), path)
+        self.pending.add(future)
+        if len(self.pending) >= self.max_pending:
+            self._drain(FIRST_COMPLETED)
+
+    def _drain(self, return_when):
+        done, self.pending = wait(self.pending, return_when=return_when)
+        for future in done:
+            try:
+                future.result()
+                self.written += 1
+            except Exception as e:
+                print(f"Error writing image: {e}")
+
+    def close(self):
+        if self.pending:
+            self._drain(ALL_COMPLETED)
+        self.threads.shutdown()
+        self.processes.shutdown()
+
+
+def select_row_groups(parquet_file, start, end):
+    """Return the row groups overlapping [start, end) and the first row of the first one."""
+    groups = []
+    first_row = None
+    offset = 0
+    for i in range(parquet_file.metadata.num_row_groups):
+        num_rows = parquet_file.metadata.row_group(i).num_rows
+        if offset + num_rows > start and (end is None or offset < end):
+            groups.append(i)
+            if first_row is None:
+                first_row = offset
+        offset += num_rows
+    return groups, first_row or 0
+
+
+def iter_parquet_batches(input_path, columns, start, end, batch_size):
+    parquet_file = pq.ParquetFile(input_path)
+    row_groups, first_row = select_row_groups(parquet_file, start, end)
+    row = first_row
+    for batch in parquet_file.iter_batches(
+        batch_size=batch_size, row_groups=row_groups, columns=columns
+    ):
+        yield row, batch
+        row += batch.num_rows
+
+
+def iter_dataset_batches(input_path, columns, start, end, batch_size):
+    from datasets import load_from_disk
+
+    dataset = load_from_disk(input_path)
+    if columns:
+        dataset = dataset.select_columns(columns)
+    stop = len(dataset) if end is None else min(end, len(dataset))
+    # Walk the underlying Arrow table directly; no Python dicts per row
+    table = dataset.data.table.slice(start, max(0, stop - start))
+    row = start
+    for batch in table.to_batches(max_chunksize=batch_size):
+        yield row, batch
+        row += batch.num_rows
+
+
+def csv_compatible(batch):
+    """Replace nested columns (lists, structs, maps), which pyarrow's CSV writer rejects, with JSON strings."""
+    if not any(pa.types.is_nested(field.type) for field in batch.schema):
+        return batch
+    arrays = []
+    for field, column in zip(batch.schema, batch.columns):
+        if pa.types.is_nested(field.type):
+            column = pa.array(
+                [None if value is None else json.dumps(value, default=str) for value in column.to_pylist()],
+                type=pa.string(),
+            )
+        arrays.append(column)
+    return pa.RecordBatch.from_arrays(arrays, names=batch.schema.names)
+
+
+def extract_parquet(
+    input_path,
+    output_folder,
+    columns=None,
+    start=0,
+    end=None,
+    batch_size=1024,
+    workers=None,
+):
     os.makedirs(output_folder, exist_ok=True)
 
+    is_dataset = os.path.isdir(input_path)
+    if is_dataset:
+        batches = iter_dataset_batches(input_path, columns, start, end, batch_size)
+    else:
+        batches = iter_parquet_batches(input_path, columns, start, end, batch_size)
+
+    writer = None
+    csv_writer = None
+    base_name = os.path.splitext(os.path.basename(os.path.normpath(input_path)))[0]
+    csv_path = os.path.join(output_folder, f"{base_name}.csv")
+
     try:
-        # Try loading as a Hugging Face dataset
-        dataset = load_from_disk(input_path)
-        for i, example in enumerate(dataset):
-            if "image" in example:
-                img = Image.open(io.BytesIO(example["image"]["bytes"]))
-                img.save(os.path.join(output_folder, f"image_{i}.png"))
+        for row, batch in batches:
+            # Trim the batch to the requested row range
+            lo = max(0, start - row)
+            hi = batch.num_rows if end is None else min(batch.num_rows, end - row)
+            if hi <= lo:
+                continue
+            batch = batch.slice(lo, hi - lo)
+            row += lo
+
+            if "image" in batch.schema.names and is_image_column(batch.schema.field("image").type):
+                if writer is None:
+                    writer = ImageWriter(output_folder, workers)
+                for offset, buffer in enumerate(image_buffers(batch.column("image"))):
+                    if buffer is not None:
+                        writer.submit(row + offset, buffer)
             else:
-                pd.DataFrame([example]).to_csv(
-                    os.path.join(output_folder, f"record_{i}.csv"), index=False
-                )
-        print(f"Extracted Hugging Face dataset to: {output_folder}")
-    except:
-        # If not a Hugging Face dataset, try as a regular Parquet file
-        table = pq.read_table(input_path)
-        df = table.to_pandas()
-
-        if "image" in df.columns and df["image"].dtype == "object":
-            for i, img_bytes in enumerate(df["image"]):
-                img = Image.open(io.BytesIO(img_bytes))
-                img.save(os.path.join(output_folder, f"image_{i}.png"))
-            print(f"Extracted images to: {output_folder}")
-        else:
-            base_name = os.path.splitext(os.path.basename(input_path))[0]
-            output_path = os.path.join(output_folder, f"{base_name}.csv")
-            df.to_csv(output_path, index=False)
-            print(f"Extracted CSV to: {output_path}")
+                batch = csv_compatible(batch)
+                if csv_writer is None:
+                    csv_writer = pacsv.CSVWriter(csv_path, batch.schema)
+                csv_writer.write_batch(batch)
+    finally:
+        if writer is not None:
+            writer.close()
+        if csv_writer is not None:
+            csv_writer.close()
+
+    source = "Hugging Face dataset" if is_dataset else "Parquet file"
+    if writer is not None:
+        print(f"Extracted {writer.written} images from {source} to: {output_folder}")
+    if csv_writer is not None:
+        print(f"Extracted CSV to: {csv_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Extract images (or a CSV) from a Parquet file or a saved Hugging Face dataset"
+    )
+    parser.add_argument("input_path", help="Parquet file or dataset folder saved with save_to_disk")
+    parser.add_argument("output_folder", help="Folder to write images or the CSV to")
+    parser.add_argument("--columns", nargs="+", default=None, help="Only read these columns")
+    parser.add_argument("--start", type=int, default=0, help="First row to extract")
+    parser.add_argument("--end", type=int, default=None, help="Row to stop before")
+    parser.add_argument("--batch-size", type=int, default=1024, help="Rows per Arrow record batch")
+    parser.add_argument("--workers", type=int, default=None, help="Number of writer workers")
+    args = parser.parse_args()
+
+    extract_parquet(
+        args.input_path,
+        args.output_folder,
+        args.columns,
+        args.start,
+        args.end,
+        args.batch_size,
+        args.workers,
+    )
 
 
-# ... rest of the script (main function) remains the same
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,28 @@
 import argparse
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 from PIL import Image
 import os
 
+IMAGE_EXTENSIONS = ("png", "jpg", "jpeg")
+
+
+def iter_image_paths(input_folder):
+    """Yield image paths lazily without opening or listing the whole folder up front."""
+    with os.scandir(input_folder) as entries:
+        for entry in entries:
+            if entry.name.endswith(IMAGE_EXTENSIONS) and entry.is_file():
+                yield entry.path
+
+
+def load_thumbnail(path, size):
+    """Open an image and resize it to size, letting JPEG decode at reduced scale."""
+    with Image.open(path) as img:
+        # draft() is a no-op for non-JPEG formats; for JPEG it decodes at 1/2..1/8 scale
+        img.draft("RGB", size)
+        img = img.convert("RGB")
+        return img.resize(size, Image.Resampling.LANCZOS)
+
 
 def create_image_grid(
     input_folder,
@@ -11,12 +32,10 @@ def create_image_grid(
     padding,
     final_size,
     background_color="#FFFFFF",
+    workers=None,
 ):
-    images = [
-        Image.open(os.path.join(input_folder, img))
-        for img in os.listdir(input_folder)
-        if img.endswith(("png", "jpg", "jpeg"))
-    ]
+    # Only the first grid_width * grid_height images are ever opened
+    paths = list(islice(iter_image_paths(input_folder), grid_width * grid_height))
 
     # Calculate single image size based on final dimensions, grid size, and padding
     single_width = (final_size[0] - (padding * (grid_width + 1))) // grid_width
@@ -25,19 +44,92 @@ def create_image_grid(
     # Create a new image with a white background
     grid_image = Image.new("RGB", final_size, color=background_color)
 
-    x_offset, y_offset = padding, padding
-    for i, img in enumerate(images[: grid_width * grid_height]):
-        img = img.resize((single_width, single_height), Image.ANTIALIAS)
-        grid_image.paste(img, (x_offset, y_offset))
-        x_offset += single_width + padding
-        if (i + 1) % grid_width == 0:
-            x_offset = padding
-            y_offset += single_height + padding
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        thumbnails = executor.map(
+            load_thumbnail, paths, [(single_width, single_height)] * len(paths)
+        )
+
+        x_offset, y_offset = padding, padding
+        for i, img in enumerate(thumbnails):
+            grid_image.paste(img, (x_offset, y_offset))
+            x_offset += single_width + padding
+            if (i + 1) % grid_width == 0:
+                x_offset = padding
+                y_offset += single_height + padding
 
     grid_image.save(output_path)
     print(f"Grid image saved to {output_path}")
 
 
+def page_path(output_path, page, pages):
+    """Output path for one page; a single page keeps output_path as given."""
+    if pages == 1:
+        return output_path
+    base, ext = os.path.splitext(output_path)
+    return f"{base}_{page + 1:03d}{ext}"
+
+
+def create_contact_sheet(
+    input_folder,
+    output_path,
+    columns,
+    thumb_size,
+    padding,
+    background_color="#FFFFFF",
+    limit=None,
+    workers=None,
+    page_rows=None,
+    max_page_mb=64,
+):
+    """Tile many thumbnails into contact sheet pages, decoding one row batch at a time.
+
+    Only one page is held in memory; pages are capped at page_rows rows, or
+    sized to fit max_page_mb when page_rows is not given.
+    """
+    paths = list(islice(iter_image_paths(input_folder), limit))
+    if not paths:
+        print(f"No images found in {input_folder}")
+        return
+
+    thumb_width, thumb_height = thumb_size
+    width = columns * thumb_width + padding * (columns + 1)
+    rows = (len(paths) + columns - 1) // columns
+    if page_rows is None:
+        row_bytes = width * (thumb_height + padding) * 3
+        page_rows = max(1, (max_page_mb << 20) // row_bytes)
+    page_rows = min(page_rows, rows)
+    per_page = page_rows * columns
+    pages = (len(paths) + per_page - 1) // per_page
+
+    # Keep at most a few rows of decoded thumbnails alive at once
+    workers = workers or min(32, (os.cpu_count() or 1) + 4)
+    batch_size = max(columns, workers) * 2
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for page in range(pages):
+            page_paths = paths[page * per_page : (page + 1) * per_page]
+            rows_here = (len(page_paths) + columns - 1) // columns
+            sheet = Image.new(
+                "RGB",
+                (width, rows_here * thumb_height + padding * (rows_here + 1)),
+                color=background_color,
+            )
+            for start in range(0, len(page_paths), batch_size):
+                batch = page_paths[start : start + batch_size]
+                thumbnails = executor.map(load_thumbnail, batch, [thumb_size] * len(batch))
+                for i, img in enumerate(thumbnails, start=start):
+                    row, col = divmod(i, columns)
+                    x = padding + col * (thumb_width + padding)
+                    y = padding + row * (thumb_height + padding)
+                    sheet.paste(img, (x, y))
+            placed = min((page + 1) * per_page, len(paths))
+            print(f"Placed {placed}/{len(paths)} thumbnails")
+
+            path = page_path(output_path, page, pages)
+            sheet.save(path)
+            print(f"Contact sheet saved to {path}")
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Create an image grid.")
     parser.add_argument(
@@ -55,7 +147,6 @@ if __name__ == "__main__":
     parser.add_argument(
         "--grid-height",
         type=int,
-        required=True,
         help="Number of images in the grid's height.",
     )
     parser.add_argument(
@@ -65,7 +156,6 @@ if __name__ == "__main__":
         "--final-size",
         type=int,
         nargs=2,
-        required=True,
         help="Final image size (width height).",
     )
     parser.add_argument(
@@ -74,17 +164,66 @@ if __name__ == "__main__":
         default="#FFFFFF",
         help="Background color (hex).",
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Number of decode threads (default: auto).",
+    )
+    parser.add_argument(
+        "--contact-sheet",
+        action="store_true",
+        help="Tile every image (up to --limit) as a contact sheet with --grid-width columns.",
+    )
+    parser.add_argument(
+        "--thumb-size",
+        type=int,
+        nargs=2,
+        default=[128, 128],
+        help="Thumbnail size for --contact-sheet (width height).",
+    )
+    parser.add_argument(
+        "--limit",
+        type=int,
+        default=None,
+        help="Maximum number of images in the contact sheet.",
+    )
+    parser.add_argument(
+        "--page-rows",
+        type=int,
+        default=None,
+        help="Rows per contact sheet page; extra pages are saved as <output>_002.png, ... (default: fit ~64 MB per page).",
+    )
 
     args = parser.parse_args()
 
-    create_image_grid(
-        args.input_folder,
-        args.output_path,
-        args.grid_width,
-        args.grid_height,
-        args.padding,
-        args.final_size,
-        args.background_color,
-    )
+    if args.contact_sheet:
+        create_contact_sheet(
+            args.input_folder,
+            args.output_path,
+            args.grid_width,
+            tuple(args.thumb_size),
+            args.padding,
+            args.background_color,
+            args.limit,
+            args.workers,
+            args.page_rows,
+        )
+    else:
+        if args.grid_height is None or args.final_size is None:
+            parser.error(
+                "--grid-height and --final-size are required unless --contact-sheet is used"
+            )
+
+        create_image_grid(
+            args.input_folder,
+            args.output_path,
+            args.grid_width,
+            args.grid_height,
+            args.padding,
+            tuple(args.final_size),
+            args.background_color,
+            args.workers,
+        )
 
 # python fancy_grid.py --input-folder cascade\pixelcascade128-v2\raw_selected --output-path cascade\pixelcascade128-v2\grid128.png --grid-width 3 --grid-height 3 --padding 8 --final-size 1024 1024
\ No newline at end of file
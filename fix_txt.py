@@ -1,30 +1,22 @@
 import os
 import argparse
-from tqdm import tqdm
 
+from caption_edit import edit_file, edit_folder, print_summary
 
-def fix_file_encoding(file_path):
-    try:
-        # Try to read the file with 'utf-8' encoding first
-        with open(file_path, "r", encoding="utf-8") as file:
-            content = file.read()
-    except UnicodeDecodeError:
-        # If 'utf-8' fails, try 'latin-1' (which can read all byte sequences)
-        with open(file_path, "r", encoding="latin-1") as file:
-            content = file.read()
-
-    # Write the content back to the file using UTF-8 encoding
-    with open(file_path, "w", encoding="utf-8") as file:
-        file.write(content)
 
+def fix_file_encoding(file_path):
+    # Try UTF-8 first, fall back to latin-1 (which can read all byte sequences),
+    # and rewrite the file as UTF-8 only if the fallback was needed
+    return edit_file(file_path, [], fix_encoding=True)
 
-def process_folder(input_folder):
-    txt_files = [f for f in os.listdir(input_folder) if f.lower().endswith(".txt")]
 
-    for filename in tqdm(txt_files, desc="Processing files"):
-        file_path = os.path.join(input_folder, filename)
-        fix_file_encoding(file_path)
-        print(f"Fixed encoding for {filename}")
+def process_folder(input_folder, dry_run=False, workers=None):
+    results = edit_folder(input_folder, [], fix_encoding=True, dry_run=dry_run, workers=workers)
+    for result in results:
+        if result["changed"] and not dry_run:
+            print(f"Fixed encoding for {os.path.basename(result['path'])}")
+    print_summary(results, dry_run)
+    return results
 
 
 def main():
@@ -32,9 +24,11 @@ def main():
     parser.add_argument(
         "input_folder", type=str, help="Folder containing .txt files to fix"
     )
+    parser.add_argument("--dry-run", action="store_true", help="List files that would be re-encoded")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker threads")
     args = parser.parse_args()
 
-    process_folder(args.input_folder)
+    process_folder(args.input_folder, args.dry_run, args.workers)
     print("Encoding fix completed for all .txt files in the folder.")
 
 
@@ -1,6 +1,8 @@
 import os
 import argparse
 import concurrent.futures
+import hashlib
+import json
 from PIL import Image
 import imageio
 import tempfile
@@ -8,6 +10,9 @@ import shutil
 from upscale import upscale_image
 
 
+MANIFEST_NAME = ".gif_to_video_manifest.json"
+
+
 def extract_gif_frames(gif_path, temp_dir, upscale_factor=None):
     """Extract frames from a GIF and optionally upscale them"""
     gif = Image.open(gif_path)
@@ -37,7 +42,7 @@ def extract_gif_frames(gif_path, temp_dir, upscale_factor=None):
     return frame_paths, gif.info.get('duration', 100)
 
 
-def convert_gif_to_video(gif_path, output_path, upscale_factor=None):
+def convert_gif_to_video(gif_path, output_path, upscale_factor=None, ffmpeg_threads=None):
     """Convert a GIF to an MP4 video with optional upscaling"""
     with tempfile.TemporaryDirectory() as temp_dir:
         frame_paths, frame_duration = extract_gif_frames(gif_path, temp_dir, upscale_factor)
@@ -45,8 +50,13 @@ def convert_gif_to_video(gif_path, output_path, upscale_factor=None):
         # FPS calculation (convert duration in ms to fps)
         fps = 1000 / frame_duration if frame_duration > 0 else 10
         
+        # Cap ffmpeg's own thread pool so parallel jobs don't oversubscribe the CPU
+        writer_kwargs = {"fps": fps}
+        if ffmpeg_threads:
+            writer_kwargs["ffmpeg_params"] = ["-threads", str(ffmpeg_threads)]
+        
         # Read frames and create video
-        with imageio.get_writer(output_path, fps=fps) as writer:
+        with imageio.get_writer(output_path, **writer_kwargs) as writer:
             for frame_path in frame_paths:
                 frame = imageio.imread(frame_path)
                 writer.append_data(frame)
@@ -54,42 +64,160 @@ def convert_gif_to_video(gif_path, output_path, upscale_factor=None):
     print(f"Converted {os.path.basename(gif_path)} to {output_path}")
 
 
-def process_gifs(input_path, upscale_factor=None, max_workers=None):
-    """Process all GIFs in the input path with multithreading"""
+def file_hash(path, chunk_size=1 << 20):
+    """Return the SHA-1 hex digest of a file"""
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_manifest(manifest_path):
+    """Load the source-hash manifest used by --skip hash"""
+    try:
+        with open(manifest_path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(manifest_path, manifest):
+    """Write the source-hash manifest atomically"""
+    temp_path = manifest_path + ".tmp"
+    with open(temp_path, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(temp_path, manifest_path)
+
+
+def is_up_to_date(gif_path, output_path, skip_mode, entry=None, upscale_factor=None, digest=None):
+    """Check whether output_path already reflects the current gif_path
+
+    In hash mode, entry is gif_path's manifest record and digest its hash if
+    already computed.
+    """
+    if not skip_mode or skip_mode == "none" or not os.path.exists(output_path):
+        return False
+
+    if skip_mode == "mtime":
+        return os.path.getmtime(output_path) >= os.path.getmtime(gif_path)
+
+    if skip_mode == "hash":
+        if not entry or entry.get("upscale") != upscale_factor:
+            return False
+        return entry.get("sha1") == (digest or file_hash(gif_path))
+
+    raise ValueError(f"Unknown skip mode: {skip_mode}")
+
+
+def plan_workers(cores=None, max_workers=None, ffmpeg_threads=None):
+    """Split a total core budget into parallel jobs and ffmpeg threads per job"""
+    cores = max(1, cores or os.cpu_count() or 1)
+
+    if max_workers and ffmpeg_threads:
+        # Both given: keep the thread count, but never oversubscribe the cores
+        ffmpeg_threads = max(1, ffmpeg_threads)
+        fitting = max(1, cores // ffmpeg_threads)
+        if max_workers > fitting:
+            print(f"Warning: {max_workers} workers x {ffmpeg_threads} ffmpeg threads exceeds "
+                  f"{cores} cores; using {fitting} workers")
+            max_workers = fitting
+        return max(1, max_workers), ffmpeg_threads
+    if max_workers:
+        return max(1, max_workers), max(1, cores // max_workers)
+    if ffmpeg_threads:
+        return max(1, cores // ffmpeg_threads), max(1, ffmpeg_threads)
+
+    # Default: one job per core, each ffmpeg encoder restricted to a single thread
+    return cores, 1
+
+
+def _convert_job(gif_path, output_path, upscale_factor, ffmpeg_threads, skip_mode, entry):
+    """Worker entry point; returns (source hash or None, skipped)
+
+    In hash mode the GIF is hashed once, here, both to decide whether to skip
+    it and to update the manifest.
+    """
+    digest = file_hash(gif_path) if skip_mode == "hash" else None
+    if digest and is_up_to_date(gif_path, output_path, skip_mode, entry, upscale_factor, digest):
+        return digest, True
+    convert_gif_to_video(gif_path, output_path, upscale_factor, ffmpeg_threads)
+    return digest, False
+
+
+def process_gifs(input_path, upscale_factor=None, max_workers=None, use_processes=False,
+                 ffmpeg_threads=None, cores=None, skip_mode=None):
+    """Process all GIFs in the input path with a thread or process pool"""
     if os.path.isfile(input_path) and input_path.lower().endswith('.gif'):
-        output_path = os.path.splitext(input_path)[0] + '.mp4'
-        convert_gif_to_video(input_path, output_path, upscale_factor)
-        return
-    
-    if not os.path.isdir(input_path):
+        # A single GIF shares its folder's manifest
+        gif_files = [input_path]
+        manifest_dir = os.path.dirname(os.path.abspath(input_path))
+    elif os.path.isdir(input_path):
+        # Find all GIF files in the directory
+        gif_files = []
+        for root, _, files in os.walk(input_path):
+            for file in files:
+                if file.lower().endswith('.gif'):
+                    gif_files.append(os.path.join(root, file))
+        manifest_dir = input_path
+    else:
         print(f"Error: {input_path} is not a valid file or directory")
         return
     
-    # Find all GIF files in the directory
-    gif_files = []
-    for root, _, files in os.walk(input_path):
-        for file in files:
-            if file.lower().endswith('.gif'):
-                gif_files.append(os.path.join(root, file))
-    
     if not gif_files:
         print(f"No GIF files found in {input_path}")
         return
-    
-    # Process all GIFs using a ThreadPoolExecutor
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = []
-        for gif_file in gif_files:
-            output_path = os.path.splitext(gif_file)[0] + '.mp4'
-            future = executor.submit(convert_gif_to_video, gif_file, output_path, upscale_factor)
-            futures.append(future)
+
+    want_hash = skip_mode == "hash"
+    manifest_path = os.path.join(manifest_dir, MANIFEST_NAME)
+    manifest = load_manifest(manifest_path) if want_hash else None
+
+    # mtime checks are cheap stats done here; hash checks happen in the workers
+    pending = []
+    skipped = 0
+    for gif_file in gif_files:
+        output_path = os.path.splitext(gif_file)[0] + '.mp4'
+        if skip_mode == "mtime" and is_up_to_date(gif_file, output_path, skip_mode):
+            skipped += 1
+            continue
+        pending.append((gif_file, output_path))
+
+    if use_processes:
+        max_workers, ffmpeg_threads = plan_workers(cores, max_workers, ffmpeg_threads)
+        print(f"Using {max_workers} processes with {ffmpeg_threads} ffmpeg thread(s) each")
+        executor_class = concurrent.futures.ProcessPoolExecutor
+    else:
+        executor_class = concurrent.futures.ThreadPoolExecutor
+
+    # Process all GIFs using the selected executor
+    with executor_class(max_workers=max_workers) as executor:
+        futures = {}
+        for gif_file, output_path in pending:
+            entry = manifest.get(os.path.abspath(gif_file)) if want_hash else None
+            future = executor.submit(
+                _convert_job, gif_file, output_path, upscale_factor, ffmpeg_threads,
+                skip_mode, entry
+            )
+            futures[future] = gif_file
         
         # Wait for all futures to complete
         for future in concurrent.futures.as_completed(futures):
             try:
-                future.result()
+                digest, up_to_date = future.result()
             except Exception as e:
                 print(f"Error during conversion: {e}")
+                continue
+            skipped += up_to_date
+            if want_hash:
+                manifest[os.path.abspath(futures[future])] = {
+                    "sha1": digest,
+                    "upscale": upscale_factor,
+                }
+
+    if skipped:
+        print(f"Skipped {skipped} GIF(s) that were already up to date")
+    if want_hash:
+        save_manifest(manifest_path, manifest)
 
 
 def main():
@@ -98,11 +226,20 @@ def main():
     parser.add_argument("--upscale", type=int, default=None, 
                         help="Upscale factor (e.g., 2 for 2x upscaling)")
     parser.add_argument("--threads", type=int, default=None,
-                        help="Number of parallel threads to use (default: auto)")
+                        help="Number of parallel threads/processes to use (default: auto)")
+    parser.add_argument("--processes", action="store_true",
+                        help="Use a process pool instead of threads (bypasses the GIL for frame work)")
+    parser.add_argument("--ffmpeg-threads", type=int, default=None,
+                        help="Threads each ffmpeg encoder may use (default: derived from --cores)")
+    parser.add_argument("--cores", type=int, default=None,
+                        help="Total core budget shared by all jobs in process mode (default: all cores)")
+    parser.add_argument("--skip", choices=["none", "mtime", "hash"], default="none",
+                        help="Skip GIFs whose MP4 is up to date by mtime or by content hash (default: none)")
     
     args = parser.parse_args()
     
-    process_gifs(args.input, args.upscale, args.threads)
+    process_gifs(args.input, args.upscale, args.threads, args.processes,
+                 args.ffmpeg_threads, args.cores, args.skip)
 
 
 if __name__ == "__main__":
@@ -1,36 +1,39 @@
-import os
 import argparse
 from tqdm import tqdm
 
+from caption_edit import list_txt_files
+from caption_store import CaptionStore, is_caption_store, iter_captions
 
-def merge_txt_files(input_folder, output_file):
-    # Get all .txt files in the input folder
-    txt_files = [f for f in os.listdir(input_folder) if f.endswith(".txt")]
+
+def merge_txt_files(input_folder, output_file, workers=None):
+    # input_folder may also be a packed caption store, read in one sequential scan
+    if is_caption_store(input_folder):
+        with CaptionStore(input_folder) as store:
+            total = len(store)
+    else:
+        total = len(list_txt_files(input_folder))
 
     # Open the output file in write mode
     with open(output_file, "w", encoding="utf-8") as outfile:
-        # Create a progress bar for file processing
-        for filename in tqdm(txt_files, desc="Processing files"):
-            file_path = os.path.join(input_folder, filename)
-
-            # Read the content of each file
-            with open(file_path, "r", encoding="utf-8") as infile:
-                content = infile.read().strip()
-
+        # Captions are read ahead in parallel but written in a stable order
+        for content in tqdm(
+            iter_captions(input_folder, workers=workers), total=total, desc="Processing files"
+        ):
             # Write the content to the output file, followed by a newline
-            outfile.write(content + "\n")
+            outfile.write(content.strip() + "\n")
 
 
 def main():
     parser = argparse.ArgumentParser(
         description="Merge multiple .txt files into a single file."
     )
-    parser.add_argument("input_folder", help="Path to the folder containing .txt files")
+    parser.add_argument("input_folder", help="Path to the folder containing .txt files, or a caption store")
     parser.add_argument("output_file", help="Path to the output file")
+    parser.add_argument("--workers", type=int, default=None, help="Number of reader threads")
 
     args = parser.parse_args()
 
-    merge_txt_files(args.input_folder, args.output_file)
+    merge_txt_files(args.input_folder, args.output_file, args.workers)
     print(f"Merged files saved to {args.output_file}")
 
 
@@ -1,27 +1,199 @@
 import argparse
+import hashlib
+import json
 import os
 import shutil
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from pathlib import Path
+from typing import Dict, Iterable, Iterator, Optional, Tuple
 from tqdm import tqdm
 
+# Kept in the output directory: which source each output name came from
+SOURCES_FILE = ".image_sources.json"
 
-def find_images(input_dir: str, extension: str) -> list[Path]:
-    """Find all images with given extension recursively"""
-    return list(Path(input_dir).rglob(f"*.{extension.lower()}"))
 
+def find_images(input_dir: str, extension: str) -> Iterator[Path]:
+    """Yield images with given extension recursively, as the tree is walked"""
+    return Path(input_dir).rglob(f"*.{extension.lower()}")
 
-def process_images(images: list[Path], output_dir: str, copy: bool = True) -> None:
-    """Copy or move images to output directory"""
-    for img in tqdm(images, desc="Processing images"):
-        dest = Path(output_dir) / img.name
+
+def is_same_file(src: Path, dest: Path) -> bool:
+    """True if dest is src itself or a previous copy of it (same size and mtime)"""
+    try:
+        src_stat, dest_stat = src.stat(), dest.stat()
+    except OSError:
+        return False
+    if (src_stat.st_dev, src_stat.st_ino) == (dest_stat.st_dev, dest_stat.st_ino):
+        return True
+    return src_stat.st_size == dest_stat.st_size and int(src_stat.st_mtime) == int(
+        dest_stat.st_mtime
+    )
+
+
+def load_sources(output_dir: Path) -> Dict[str, str]:
+    """Map each output name to the relative source path that produced it"""
+    try:
+        with open(output_dir / SOURCES_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_sources(output_dir: Path, sources: Dict[str, str]) -> None:
+    temp_path = output_dir / (SOURCES_FILE + ".tmp")
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(sources, f)
+    os.replace(temp_path, output_dir / SOURCES_FILE)
+
+
+def resolve_destination(
+    img: Path,
+    input_dir: Path,
+    output_dir: Path,
+    claimed: set,
+    sources: Dict[str, str],
+    on_collision: str,
+) -> Tuple[Optional[Path], bool]:
+    """Pick the destination for img; returns (dest or None to skip, already up to date).
+
+    A name belongs to the relative source path recorded for it, so the same
+    source always lands on (and refreshes) the same name, while a genuinely
+    different source gets a suffix derived from its relative path. Names
+    from before the record existed are adopted when they hold a copy of img.
+    """
+    relative = img.relative_to(input_dir).as_posix()
+
+    def owned(name: str) -> bool:
+        dest = output_dir / name
+        owner = sources.get(name)
+        if owner is not None:
+            return owner == relative or not dest.exists()
+        return not dest.exists() or is_same_file(img, dest)
+
+    def claim(name: str) -> Tuple[Optional[Path], bool]:
+        claimed.add(name)
+        sources[name] = relative
+        dest = output_dir / name
+        if dest.exists() and is_same_file(img, dest):
+            return None, True
+        return dest, False
+
+    if img.name not in claimed and owned(img.name):
+        return claim(img.name)
+    # Either another source in this run took the name, or a different source holds it
+
+    if on_collision == "skip":
+        return None, False
+    if on_collision == "overwrite":
+        return claim(img.name)
+
+    digest = hashlib.sha1(relative.encode("utf-8")).hexdigest()[:8]
+    name = f"{img.stem}_{digest}{img.suffix}"
+    counter = 1
+    while name in claimed or not owned(name):
+        name = f"{img.stem}_{digest}_{counter}{img.suffix}"
+        counter += 1
+    return claim(name)
+
+
+def copy_file(src: Path, dest: Path, link: bool = False) -> None:
+    """Copy src to dest using the cheapest mechanism the filesystem offers"""
+    if link:
+        try:
+            if dest.exists():
+                dest.unlink()
+            os.link(src, dest)
+            return
+        except OSError:
+            pass  # Cross-device or unsupported; fall through to a real copy
+
+    if hasattr(os, "copy_file_range"):
+        try:
+            with open(src, "rb") as fsrc, open(dest, "wb") as fdst:
+                remaining = os.fstat(fsrc.fileno()).st_size
+                while remaining > 0:
+                    copied = os.copy_file_range(fsrc.fileno(), fdst.fileno(), remaining)
+                    if copied == 0:
+                        break
+                    remaining -= copied
+            if remaining == 0:
+                shutil.copystat(src, dest)
+                return
+        except OSError:
+            pass
+
+    shutil.copy2(src, dest)
+
+
+def move_file(src: Path, dest: Path) -> None:
+    """Move src to dest, renaming in place when both are on the same filesystem"""
+    try:
+        os.replace(src, dest)
+    except OSError:
+        shutil.move(str(src), str(dest))
+
+
+def process_images(
+    images: Iterable[Path],
+    input_dir: str,
+    output_dir: str,
+    copy: bool = True,
+    link: bool = False,
+    on_collision: str = "rename",
+    workers: Optional[int] = None,
+) -> Tuple[int, int]:
+    """Copy or move images to output directory with a thread pool.
+
+    Returns (processed, already up to date).
+    """
+    input_path = Path(input_dir)
+    output_path = Path(output_dir)
+    output_abs = os.path.abspath(output_dir)
+    workers = workers or min(32, (os.cpu_count() or 1) * 4)
+    max_pending = workers * 4
+    claimed = set()
+    sources = load_sources(output_path)
+    processed = 0
+    up_to_date = 0
+
+    def transfer(img: Path, dest: Path) -> None:
         try:
             if copy:
-                shutil.copy2(img, dest)
+                copy_file(img, dest, link)
             else:
-                shutil.move(str(img), str(dest))
+                move_file(img, dest)
         except Exception as e:
             print(f"Error processing {img}: {e}")
 
+    # Destinations are resolved on this thread in walk order; only the I/O is parallel
+    with ThreadPoolExecutor(max_workers=workers) as executor, tqdm(
+        desc="Processing images", unit="file"
+    ) as pbar:
+        pending = set()
+        for img in images:
+            # Never pick up files already placed in an output dir nested under the input
+            if os.path.dirname(os.path.abspath(img)) == output_abs:
+                continue
+            dest, current = resolve_destination(
+                img, input_path, output_path, claimed, sources, on_collision
+            )
+            if dest is None:
+                up_to_date += current
+                continue
+
+            pending.add(executor.submit(transfer, img, dest))
+            processed += 1
+            if len(pending) >= max_pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                pbar.update(len(done))
+
+        for future in pending:
+            future.result()
+            pbar.update(1)
+
+    save_sources(output_path, sources)
+    return processed, up_to_date
+
 
 def main():
     parser = argparse.ArgumentParser(
@@ -33,20 +205,44 @@ def main():
         "extension", help="Image extension to search for (jpg, png, etc)", default="png"
     )
     parser.add_argument("--copy", action="store_true", help="Copy instead of move")
+    parser.add_argument(
+        "--link",
+        action="store_true",
+        help="With --copy, hardlink instead of copying when on the same filesystem",
+    )
+    parser.add_argument(
+        "--on-collision",
+        choices=["rename", "skip", "overwrite"],
+        default="rename",
+        help="What to do when two images share a basename (default: rename)",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=None, help="Number of I/O threads (default: 4x CPU count, max 32)"
+    )
 
     args = parser.parse_args()
 
     # Create output directory if it doesn't exist
     os.makedirs(args.output_dir, exist_ok=True)
 
-    # Find and process images
+    # Find and process images; copying starts while the tree is still being walked
     images = find_images(args.input_dir, args.extension)
-    if not images:
+    processed, up_to_date = process_images(
+        images,
+        args.input_dir,
+        args.output_dir,
+        args.copy,
+        args.link,
+        args.on_collision,
+        args.workers,
+    )
+    if not processed and not up_to_date:
         print(f"No images with extension .{args.extension} found")
         return
 
-    print(f"Found {len(images)} images")
-    process_images(images, args.output_dir, args.copy)
+    print(f"Processed {processed} images")
+    if up_to_date:
+        print(f"{up_to_date} already up to date")
     print("Done!")
 
 
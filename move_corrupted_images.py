@@ -1,43 +1,178 @@
 import os
 import argparse
+import json
 import shutil
+from concurrent.futures import ProcessPoolExecutor
 from tqdm import tqdm
 from PIL import Image, ImageFile
 
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".gif")
 
-def is_image_corrupted(image_path):
+# Bytes every intact file of the format ends with (trailing padding is tolerated)
+FORMAT_TRAILERS = {
+    "JPEG": b"\xff\xd9",
+    "PNG": b"IEND\xaeB`\x82",
+    "GIF": b"\x3b",
+}
+
+
+def has_valid_trailer(image_path, image_format):
+    """Cheap truncation check: look for the format's end marker near the end of the file."""
+    trailer = FORMAT_TRAILERS.get(image_format)
+    if trailer is None:
+        return True
+    with open(image_path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        f.seek(max(0, size - 64))
+        return trailer in f.read()
+
+
+def check_image(image_path, full_decode=False):
+    """Run tiered checks on one image and return a result dict.
+
+    Tier 1 parses the header and runs verify(), which checks structure (and CRCs
+    for PNG) without decoding pixels. Only files that look suspicious, or every
+    file when full_decode is set, go on to tier 2, a complete decode.
+    """
+    # Never paper over truncation while scanning
+    ImageFile.LOAD_TRUNCATED_IMAGES = False
+
+    result = {"path": image_path, "corrupted": False, "tier": 1, "error": None}
     try:
         with Image.open(image_path) as img:
-            img.load()
-    except (IOError, OSError) as e:
-        if "image file is truncated" in str(e):
-            return True
-    return False
+            image_format = img.format
+            img.verify()
+        suspicious = not has_valid_trailer(image_path, image_format)
+    except Exception as e:
+        result.update(corrupted=True, error=f"{type(e).__name__}: {e}")
+        return result
+
+    if suspicious or full_decode:
+        result["tier"] = 2
+        try:
+            # verify() leaves the image unusable, so reopen for the decode
+            with Image.open(image_path) as img:
+                img.load()
+        except Exception as e:
+            result.update(corrupted=True, error=f"{type(e).__name__}: {e}")
+        else:
+            if suspicious:
+                result["error"] = "missing end-of-file marker, but decodes fully"
+
+    return result
+
+
+def is_image_corrupted(image_path):
+    return check_image(image_path)["corrupted"]
+
+
+def load_cache(cache_path):
+    if not cache_path or not os.path.exists(cache_path):
+        return {}
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def is_cache_hit(cached, size, mtime, full_decode):
+    """A cached result counts only if the file is unchanged and it was scanned
+    at least as thoroughly as this run asks for."""
+    if not cached or cached["size"] != size or cached["mtime"] != mtime:
+        return False
+    if not full_decode:
+        return True
+    # Corrupted files and full (tier 2) decodes need no rescan under --full
+    result = cached["result"]
+    return cached.get("full_decode", False) or result["corrupted"] or result["tier"] == 2
 
 
-def move_corrupted_files(input_folder, output_folder):
+def save_cache(cache_path, cache):
+    temp_path = cache_path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(cache, f)
+    os.replace(temp_path, cache_path)
+
+
+def move_corrupted_files(
+    input_folder,
+    output_folder,
+    workers=None,
+    full_decode=False,
+    report_path=None,
+    cache_path=None,
+):
     corrupted_folder = os.path.join(output_folder, "corrupted")
     os.makedirs(corrupted_folder, exist_ok=True)
 
-    total_files = sum(1 for _ in os.listdir(input_folder))
+    # Single directory pass; size and mtime come for free from scandir
+    entries = []
+    with os.scandir(input_folder) as it:
+        for entry in it:
+            if entry.name.lower().endswith(IMAGE_EXTENSIONS) and entry.is_file():
+                stat = entry.stat()
+                entries.append((entry.path, stat.st_size, stat.st_mtime_ns))
+
+    # Reuse cached results for files whose (path, size, mtime) did not change,
+    # unless they were only scanned by a lower tier than this run's
+    cache = load_cache(cache_path)
+    results = []
+    pending = []
+    for path, size, mtime in entries:
+        cached = cache.get(path)
+        if is_cache_hit(cached, size, mtime, full_decode):
+            results.append(cached["result"])
+        else:
+            pending.append((path, size, mtime))
+
+    if len(pending) < len(entries):
+        print(f"Reusing cached results for {len(entries) - len(pending)} files")
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        scanned = executor.map(
+            check_image,
+            [path for path, _, _ in pending],
+            [full_decode] * len(pending),
+            chunksize=32,
+        )
+        for (path, size, mtime), result in tqdm(
+            zip(pending, scanned), total=len(pending), unit="file", desc="Scanning files"
+        ):
+            results.append(result)
+            cache[path] = {"size": size, "mtime": mtime, "full_decode": full_decode, "result": result}
 
-    with tqdm(total=total_files, unit="file", desc="Processing files") as progress_bar:
-        for filename in os.listdir(input_folder):
-            if filename.endswith((".jpg", ".jpeg", ".png", ".bmp", ".gif")):
-                image_path = os.path.join(input_folder, filename)
-                txt_path = os.path.splitext(image_path)[0] + ".txt"
+    corrupted = [result for result in results if result["corrupted"]]
 
-                if is_image_corrupted(image_path):
-                    print(f"Moving corrupted image: {filename}")
-                    shutil.move(image_path, corrupted_folder)
+    for result in corrupted:
+        image_path = result["path"]
+        txt_path = os.path.splitext(image_path)[0] + ".txt"
+        print(f"Moving corrupted image: {os.path.basename(image_path)} ({result['error']})")
+        shutil.move(image_path, corrupted_folder)
+        cache.pop(image_path, None)
 
-                    if os.path.exists(txt_path):
-                        print(
-                            f"Moving corresponding .txt file: {os.path.basename(txt_path)}"
-                        )
-                        shutil.move(txt_path, corrupted_folder)
+        if os.path.exists(txt_path):
+            print(f"Moving corresponding .txt file: {os.path.basename(txt_path)}")
+            shutil.move(txt_path, corrupted_folder)
 
-            progress_bar.update(1)
+    if cache_path:
+        save_cache(cache_path, cache)
+
+    if report_path is None:
+        report_path = os.path.join(output_folder, "corruption_report.json")
+    report = {
+        "input_folder": input_folder,
+        "scanned": len(results),
+        "cached": len(results) - len(pending),
+        "full_decoded": sum(1 for result in results if result["tier"] == 2),
+        "corrupted": corrupted,
+    }
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    print(f"Found {len(corrupted)} corrupted images out of {len(results)}")
+    print(f"Report written to {report_path}")
 
 
 if __name__ == "__main__":
@@ -51,8 +186,35 @@ if __name__ == "__main__":
         "output_folder",
         help="Path to the output folder where corrupted files will be moved.",
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Number of scanner processes (default: CPU count).",
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Fully decode every image instead of only suspicious ones.",
+    )
+    parser.add_argument(
+        "--report",
+        default=None,
+        help="Path of the JSON report (default: <output_folder>/corruption_report.json).",
+    )
+    parser.add_argument(
+        "--cache",
+        default=None,
+        help="JSON cache of scan results keyed by (path, size, mtime) to speed up rescans. "
+        "Entries from a run without --full are rechecked by a --full run.",
+    )
     args = parser.parse_args()
 
-    ImageFile.LOAD_TRUNCATED_IMAGES = True
-
-    move_corrupted_files(args.input_folder, args.output_folder)
+    move_corrupted_files(
+        args.input_folder,
+        args.output_folder,
+        args.workers,
+        args.full,
+        args.report,
+        args.cache,
+    )
@@ -1,11 +1,10 @@
 #!/usr/bin/env python3
 import os
 import argparse
-import threading
-from PIL import Image, ImageSequence
+import numpy as np
+from PIL import Image, ImageColor, ImageSequence
 import random
-from concurrent.futures import ThreadPoolExecutor
-from queue import Queue
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import time
 
 def parse_args():
@@ -37,47 +36,86 @@ def get_gif_files(input_folder):
     print(f"Found {len(gif_files)} GIF files")
     return gif_files
 
-def process_gif(gif_path, canvas_size, bg_color, random_position=False, queue=None):
+def make_background(canvas_size, bg_color):
+    """Build the solid RGB canvas once so frames can be blended onto a copy of it"""
+    width, height = canvas_size
+    rgb = ImageColor.getrgb(bg_color)[:3]
+    background = np.empty((height, width, 3), dtype=np.uint8)
+    background[:] = rgb
+    return background
+
+def composite_frame(background, frame_rgba, position, out):
+    """Alpha-blend an RGBA frame array onto the background into the preallocated out buffer"""
+    np.copyto(out, background)
+    canvas_h, canvas_w = background.shape[:2]
+    frame_h, frame_w = frame_rgba.shape[:2]
+    x, y = position
+
+    # Clip the frame to the canvas the same way Image.paste does
+    x0, y0 = max(x, 0), max(y, 0)
+    x1, y1 = min(x + frame_w, canvas_w), min(y + frame_h, canvas_h)
+    if x0 >= x1 or y0 >= y1:
+        return out
+
+    src = frame_rgba[y0 - y:y1 - y, x0 - x:x1 - x]
+    alpha = src[..., 3:4].astype(np.uint16)
+    dst = out[y0:y1, x0:x1]
+    blended = (src[..., :3] * alpha + dst * (255 - alpha) + 127) // 255
+    dst[:] = blended.astype(np.uint8)
+    return out
+
+def process_gif(gif_path, canvas_size, bg_color, random_position=False,
+                output_folder='output', duration=100, background=None):
+    """Composite every frame of a GIF onto the canvas and save the result right away"""
     try:
         width, height = canvas_size
         print(f"Processing: {os.path.basename(gif_path)}")
-        
-        # Open the GIF
-        gif = Image.open(gif_path)
-        
-        # Get frames from GIF
-        frames = []
-        for frame in ImageSequence.Iterator(gif):
-            frame = frame.convert('RGBA')
-            frames.append(frame.copy())
-        
-        # Determine position
-        if random_position:
-            max_x = max(0, width - frames[0].width)
-            max_y = max(0, height - frames[0].height)
-            position = (random.randint(0, max_x), random.randint(0, max_y))
-        else:
-            # Center the GIF
-            position = ((width - frames[0].width) // 2, (height - frames[0].height) // 2)
-        
-        print(f"Placing {os.path.basename(gif_path)} at position {position}")
-        
-        # Create frames with background and GIF
-        result_frames = []
-        for frame in frames:
-            # Create a new background with the specified color
-            bg = Image.new('RGBA', (width, height), bg_color)
-            # Paste the frame onto the background, using the frame's alpha channel as mask
-            bg.paste(frame, position, frame)
-            result_frames.append(bg)
-        
-        if queue:
-            queue.put((gif_path, result_frames))
-        return gif_path, result_frames
+
+        if background is None:
+            background = make_background(canvas_size, bg_color)
+
+        with Image.open(gif_path) as gif:
+            gif_width, gif_height = gif.size
+
+            # Determine position
+            if random_position:
+                max_x = max(0, width - gif_width)
+                max_y = max(0, height - gif_height)
+                position = (random.randint(0, max_x), random.randint(0, max_y))
+            else:
+                # Center the GIF
+                position = ((width - gif_width) // 2, (height - gif_height) // 2)
+
+            print(f"Placing {os.path.basename(gif_path)} at position {position}")
+
+            # Blend each frame into a single reusable buffer; only the encoded RGB frames are kept
+            buffer = np.empty_like(background)
+            result_frames = []
+            for frame in ImageSequence.Iterator(gif):
+                frame_rgba = np.asarray(frame.convert('RGBA'))
+                composite_frame(background, frame_rgba, position, buffer)
+                result_frames.append(Image.frombytes('RGB', (width, height), buffer.tobytes()))
+
+        if not result_frames:
+            print(f"No frames found in {gif_path}")
+            return gif_path, None
+
+        base_name = os.path.splitext(os.path.basename(gif_path))[0]
+        output_file = os.path.join(output_folder, f"{base_name}.gif")
+        print(f"Saving {output_file}...")
+
+        result_frames[0].save(
+            output_file,
+            save_all=True,
+            append_images=result_frames[1:],
+            optimize=False,
+            duration=duration,
+            loop=0,
+            disposal=2  # For better transparency handling
+        )
+        return gif_path, output_file
     except Exception as e:
         print(f"Error processing {gif_path}: {e}")
-        if queue:
-            queue.put((gif_path, None))
         return gif_path, None
 
 def main():
@@ -108,56 +146,33 @@ def main():
     
     start_time = time.time()
     
-    # Process GIFs in parallel
-    result_queue = Queue()
-    all_frames = {}
-    
+    # Each worker composites and saves its own GIF, so at most `threads` GIFs live in memory
+    background = make_background(canvas_size, args.color)
+    saved = 0
+
     print(f"Starting processing with {args.threads} threads")
     with ThreadPoolExecutor(max_workers=args.threads) as executor:
-        futures = []
-        for gif_path in gif_files:
-            futures.append(
-                executor.submit(
-                    process_gif, 
-                    gif_path, 
-                    canvas_size, 
-                    args.color, 
-                    args.random,
-                    result_queue
-                )
+        futures = [
+            executor.submit(
+                process_gif,
+                gif_path,
+                canvas_size,
+                args.color,
+                args.random,
+                args.output,
+                args.duration,
+                background
             )
-        
-        # Collect results as they complete
-        for _ in range(len(futures)):
-            gif_path, frames = result_queue.get()
-            if frames:
-                all_frames[gif_path] = frames
-    
-    # Save each processed GIF separately
-    if all_frames:
-        print(f"Saving {len(all_frames)} processed GIFs...")
-        # Inside the save loop, modify the code to:
-        for gif_path, frames in all_frames.items():
-            # Get the base filename without extension
-            base_name = os.path.splitext(os.path.basename(gif_path))[0]
-            # Create output filename with .gif extension
-            output_file = os.path.join(args.output, f"{base_name}.gif")
-            
-            print(f"Saving {output_file}...")
-            
-            # Convert frames to RGB mode to properly show background color
-            rgb_frames = [frame.convert('RGB') for frame in frames]
-            
-            rgb_frames[0].save(
-                output_file,
-                save_all=True,
-                append_images=rgb_frames[1:],
-                optimize=False,
-                duration=args.duration,
-                loop=0,
-                disposal=2  # For better transparency handling
-            )
-        print(f"All GIFs saved to {args.output} directory")
+            for gif_path in gif_files
+        ]
+
+        for future in as_completed(futures):
+            _, output_file = future.result()
+            if output_file:
+                saved += 1
+
+    if saved:
+        print(f"Saved {saved} GIFs to {args.output} directory")
     else:
         print("No valid frames to save.")
     
@@ -1,30 +1,31 @@
 import os
 import sys
 
+from caption_edit import edit_folder, prepend_op, print_summary
+from caption_store import edit_store, is_caption_store
 
-def prepend_string_to_txt_files(folder_path, prepend_string):
-    txt_files = [f for f in os.listdir(folder_path) if f.lower().endswith(".txt")]
 
-    for txt_file in txt_files:
-        file_path = os.path.join(folder_path, txt_file)
-
-        with open(file_path, "r") as file:
-            content = file.read()
-
-        with open(file_path, "w") as file:
-            file.write(prepend_string + content)
+def prepend_string_to_txt_files(folder_path, prepend_string, dry_run=False):
+    # folder_path may also be a packed caption store
+    if is_caption_store(folder_path):
+        results = edit_store(folder_path, [prepend_op(prepend_string)], dry_run)
+    else:
+        results = edit_folder(folder_path, [prepend_op(prepend_string)], dry_run=dry_run)
+    print_summary(results, dry_run)
+    return results
 
 
 if __name__ == "__main__":
-    if len(sys.argv) != 3:
-        print("Usage: python script.py <target_folder> <string_to_prepend>")
+    args = [arg for arg in sys.argv[1:] if arg != "--dry-run"]
+    if len(args) != 2:
+        print("Usage: python script.py <target_folder> <string_to_prepend> [--dry-run]")
         sys.exit(1)
 
-    target_folder = sys.argv[1]
-    string_to_prepend = sys.argv[2]
+    target_folder = args[0]
+    string_to_prepend = args[1]
 
-    if not os.path.isdir(target_folder):
+    if not os.path.isdir(target_folder) and not is_caption_store(target_folder):
         print(f"Error: {target_folder} is not a valid directory.")
         sys.exit(1)
 
-    prepend_string_to_txt_files(target_folder, string_to_prepend)
+    prepend_string_to_txt_files(target_folder, string_to_prepend, "--dry-run" in sys.argv[1:])
@@ -1,45 +1,55 @@
 import os
 import sys
+import argparse
 
+from rename_planner import RenameConflictError, apply_renames, default_journal_path
 
-def prepend_string_to_filenames(folder_path, prepend_string):
+
+def prepend_string_to_filenames(folder_path, prepend_string, journal_path=None, dry_run=False, workers=None):
     """
     Prepends a string to all filenames in the specified folder.
     
     Args:
         folder_path (str): Path to the folder containing files to rename
         prepend_string (str): String to prepend to each filename
+        journal_path (str): Where to log renames so the batch can be rolled back
+        dry_run (bool): Print the planned renames without renaming
+        workers (int): Number of rename threads
     """
-    files = os.listdir(folder_path)
-    
-    for filename in files:
-        # Skip directories
-        if os.path.isdir(os.path.join(folder_path, filename)):
-            continue
-            
-        # Create new filename with prepended string
-        new_filename = prepend_string + filename
-        
-        # Create full paths for old and new filenames
-        old_path = os.path.join(folder_path, filename)
-        new_path = os.path.join(folder_path, new_filename)
-        
-        # Rename the file
-        os.rename(old_path, new_path)
-        print(f"Renamed: {filename} -> {new_filename}")
+    # Skip directories
+    with os.scandir(folder_path) as it:
+        files = [entry.path for entry in it if not entry.is_dir()]
+
+    return apply_renames(
+        files,
+        lambda filename: prepend_string + filename,
+        journal_path,
+        workers,
+        dry_run,
+    )
 
 
 if __name__ == "__main__":
-    if len(sys.argv) != 3:
-        print("Usage: python prepend_filename.py <target_folder> <string_to_prepend>")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description="Prepend a string to all filenames in a folder")
+    parser.add_argument("target_folder", help="Folder containing files to rename")
+    parser.add_argument("string_to_prepend", help="String to prepend to each filename")
+    parser.add_argument("--journal", default=None, help="Rename journal path (default: a new timestamped file in ~/.rename_journals)")
+    parser.add_argument("--dry-run", action="store_true", help="Only print the planned renames")
+    parser.add_argument("--workers", type=int, default=None, help="Number of rename threads")
+    args = parser.parse_args()
 
-    target_folder = sys.argv[1]
-    string_to_prepend = sys.argv[2]
+    target_folder = args.target_folder
+    string_to_prepend = args.string_to_prepend
 
     if not os.path.isdir(target_folder):
         print(f"Error: {target_folder} is not a valid directory.")
         sys.exit(1)
 
-    prepend_string_to_filenames(target_folder, string_to_prepend)
-    print(f"Successfully prepended '{string_to_prepend}' to filenames in {target_folder}")
\ No newline at end of file
+    journal_path = args.journal or default_journal_path(target_folder)
+    try:
+        prepend_string_to_filenames(target_folder, string_to_prepend, journal_path, args.dry_run, args.workers)
+    except RenameConflictError as e:
+        for conflict in e.conflicts:
+            print(f"Conflict: {conflict}")
+        sys.exit(1)
+    print(f"Successfully prepended '{string_to_prepend}' to filenames in {target_folder}")
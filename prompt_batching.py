@@ -0,0 +1,325 @@
+import json
+import random
+import re
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from dedup_txt_lines import NearDuplicateIndex, line_hash
+
+
+def is_rate_limit_error(error):
+    """True for provider throttling errors (HTTP 429) from openai/groq style clients."""
+    if getattr(error, "status_code", None) == 429:
+        return True
+    return type(error).__name__ == "RateLimitError"
+
+
+def retry_after_seconds(error):
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    value = headers.get("retry-after") if hasattr(headers, "get") else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+PROMPTS_SCHEMA = {
+    "type": "object",
+    "properties": {"prompts": {"type": "array", "items": {"type": "string"}}},
+    "required": ["prompts"],
+    "additionalProperties": False,
+}
+
+# Strongest first; a provider that rejects one mode is retried with the next
+JSON_MODES = ["schema", "object", "off"]
+
+_FENCE = re.compile(r"```(?:json)?\s*(.*?)(?:```|$)", re.S)
+
+
+def is_unsupported_format_error(error):
+    """True when a 400 response complains about response_format rather than the prompt."""
+    if getattr(error, "status_code", None) != 400:
+        return False
+    message = str(error).lower()
+    return any(word in message for word in ("response_format", "json_schema", "json_object"))
+
+
+class StructuredOutput:
+    """Chooses the response_format sent with each request, downgrading once a provider rejects it.
+
+    The downgrade is shared by all workers, so only the first request pays for it.
+    """
+
+    def __init__(self, mode="schema"):
+        self.mode = mode
+        self.lock = threading.Lock()
+
+    def request_kwargs(self):
+        if self.mode == "schema":
+            return {
+                "response_format": {
+                    "type": "json_schema",
+                    "json_schema": {"name": "prompts", "strict": True, "schema": PROMPTS_SCHEMA},
+                }
+            }
+        if self.mode == "object":
+            return {"response_format": {"type": "json_object"}}
+        return {}
+
+    def create(self, client, **kwargs):
+        """client.chat.completions.create(), retrying with weaker modes the provider accepts."""
+        while True:
+            mode = self.mode
+            try:
+                return client.chat.completions.create(**kwargs, **self.request_kwargs())
+            except Exception as e:
+                if mode == "off" or not is_unsupported_format_error(e):
+                    raise
+                with self.lock:
+                    if self.mode == mode:
+                        self.mode = JSON_MODES[JSON_MODES.index(mode) + 1]
+                        print(f"Provider rejected JSON mode '{mode}', using '{self.mode}'")
+
+
+def extract_prompts(content, key="prompts"):
+    """Parse prompts from a response, salvaging complete items from fenced or truncated JSON.
+
+    Returns (prompts, complete) where complete is False if the array had to be
+    recovered item by item.
+    """
+    text = content or ""
+    fenced = _FENCE.search(text)
+    if fenced:
+        text = fenced.group(1)
+
+    try:
+        data = json.loads(text)
+    except ValueError:
+        data = None
+    if isinstance(data, dict):
+        data = data.get(key, next((v for v in data.values() if isinstance(v, list)), None))
+    if isinstance(data, list):
+        return [item.strip() for item in data if isinstance(item, str) and item.strip()], True
+
+    # Walk the array one value at a time and stop at the first incomplete one
+    match = re.search(r'"%s"\s*:\s*\[' % re.escape(key), text)
+    if match:
+        position = match.end()
+    elif "[" in text:
+        position = text.index("[") + 1
+    else:
+        return [], False
+    decoder = json.JSONDecoder()
+    prompts = []
+    while True:
+        while position < len(text) and text[position] in " \t\r\n,":
+            position += 1
+        if position >= len(text) or text[position] == "]":
+            break
+        try:
+            item, position = decoder.raw_decode(text, position)
+        except ValueError:
+            break
+        if isinstance(item, str) and item.strip():
+            prompts.append(item.strip())
+    return prompts, False
+
+
+class AdaptiveBackoff:
+    """Shared backoff that only slows down when the provider actually throttles.
+
+    Every worker calls wait() before a request. A rate-limit error pauses all
+    workers and doubles the delay (up to max_delay); successes shrink it back
+    toward zero, so unthrottled runs never sleep.
+    """
+
+    def __init__(self, base_delay=1.0, max_delay=60.0):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.delay = 0.0
+        self.resume_at = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            remaining = self.resume_at - time.monotonic()
+        if remaining > 0:
+            time.sleep(remaining)
+
+    def throttled(self, retry_after=None):
+        with self.lock:
+            self.delay = min(self.max_delay, max(self.base_delay, self.delay * 2))
+            pause = retry_after if retry_after is not None else self.delay
+            pause *= 1 + random.random() * 0.1
+            self.resume_at = max(self.resume_at, time.monotonic() + pause)
+
+    def succeeded(self):
+        with self.lock:
+            self.delay = self.delay / 2 if self.delay > self.base_delay / 8 else 0.0
+
+    def failed(self, attempt):
+        """Back off this worker only, for non-throttling errors."""
+        time.sleep(min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+
+class IncrementalJSONWriter:
+    """Writes {"prompts": [...]} one prompt at a time so partial runs keep their output.
+
+    The file is valid JSON once close() has run.
+    """
+
+    def __init__(self, path, key="prompts"):
+        self.file = open(path, "w", encoding="utf-8")
+        self.file.write(f'{{\n  "{key}": [')
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def write(self, items):
+        with self.lock:
+            for item in items:
+                separator = "," if self.count else ""
+                self.file.write(f"{separator}\n    {json.dumps(item, ensure_ascii=False)}")
+                self.count += 1
+            self.file.flush()
+
+    def close(self):
+        with self.lock:
+            self.file.write("\n  ]\n}\n" if self.count else "]\n}\n")
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class TokenCounter:
+    """Thread-safe tally of tokens reported in response.usage, including retries."""
+
+    def __init__(self):
+        self.total = 0
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    def add(self, response):
+        usage = getattr(response, "usage", None)
+        tokens = getattr(usage, "total_tokens", None) or 0
+        with self.lock:
+            self.total += tokens
+            self.requests += 1
+
+
+class NoveltyFilter:
+    """Drops prompts that exactly or nearly duplicate earlier prompts or the examples.
+
+    Exact duplicates are caught by hashing a normalized form (case, whitespace
+    and punctuation folded); near duplicates by MinHash/LSH on that form.
+    """
+
+    def __init__(self, near_dup_threshold=0.8, examples=None):
+        self.exact = set()
+        self.near = NearDuplicateIndex(near_dup_threshold) if near_dup_threshold else None
+        self.seen = 0
+        self.exact_duplicates = 0
+        self.near_duplicates = 0
+        self.lock = threading.Lock()
+        self.seed(examples or [])
+
+    def seed(self, examples):
+        """Index examples so prompts copying them are dropped, without counting them as generated."""
+        with self.lock:
+            for example in examples:
+                if example.strip():
+                    self._admit(example)
+
+    @staticmethod
+    def normalize(text):
+        text = re.sub(r"[^\w\s]", " ", text.lower())
+        return re.sub(r"\s+", " ", text).strip()
+
+    def _admit(self, text):
+        """Index text; return None if novel, else the kind of duplicate."""
+        normalized = self.normalize(text)
+        key = line_hash(normalized, 128)
+        if key in self.exact:
+            return "exact"
+        self.exact.add(key)
+        if self.near is not None and not self.near.add(normalized):
+            return "near"
+        return None
+
+    def filter(self, prompts, limit=None):
+        """Return the novel prompts, accepting at most `limit`.
+
+        Prompts past the limit are neither indexed nor counted, so the
+        report's kept count matches what the caller actually keeps.
+        """
+        kept = []
+        with self.lock:
+            for prompt in prompts:
+                if limit is not None and len(kept) >= limit:
+                    break
+                if not isinstance(prompt, str) or not prompt.strip():
+                    continue
+                self.seen += 1
+                duplicate = self._admit(prompt)
+                if duplicate == "exact":
+                    self.exact_duplicates += 1
+                elif duplicate == "near":
+                    self.near_duplicates += 1
+                else:
+                    kept.append(prompt)
+        return kept
+
+    @property
+    def kept(self):
+        return self.seen - self.exact_duplicates - self.near_duplicates
+
+    def report(self, tokens=None):
+        duplicate_rate = (self.seen - self.kept) / self.seen if self.seen else 0.0
+        report = {
+            "generated": self.seen,
+            "kept": self.kept,
+            "exact_duplicates": self.exact_duplicates,
+            "near_duplicates": self.near_duplicates,
+            "duplicate_rate": round(duplicate_rate, 4),
+        }
+        if tokens is not None:
+            report["tokens"] = tokens.total
+            report["requests"] = tokens.requests
+            report["tokens_per_kept_prompt"] = (
+                round(tokens.total / self.kept, 1) if self.kept else None
+            )
+        return report
+
+
+def run_until(generate_batch, should_continue, max_batches, max_in_flight, on_batch, progress=None):
+    """Keep up to max_in_flight generate_batch() calls running while should_continue() holds.
+
+    Stops submitting after max_batches calls. on_batch(prompts) runs on the
+    calling thread as each batch finishes. Returns the number of failed batches.
+    """
+    failed = 0
+    submitted = 0
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        pending = set()
+        while True:
+            while len(pending) < max_in_flight and submitted < max_batches and should_continue():
+                pending.add(executor.submit(generate_batch))
+                submitted += 1
+            if not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    on_batch(future.result())
+                except Exception as e:
+                    failed += 1
+                    print(f"Batch failed: {e}")
+                if progress is not None:
+                    progress.update(1)
+    return failed
+
@@ -1,10 +1,21 @@
 from antares import Antares
 import argparse
-import time
 import json
 from typing import List
 from tqdm import tqdm
 import logging
+from prompt_batching import (
+    AdaptiveBackoff,
+    IncrementalJSONWriter,
+    JSON_MODES,
+    NoveltyFilter,
+    StructuredOutput,
+    TokenCounter,
+    extract_prompts,
+    is_rate_limit_error,
+    retry_after_seconds,
+    run_until,
+)
 
 antares = Antares()
 client = antares.cerebras
@@ -39,39 +50,48 @@ You need to answer in the following JSON format:
 """
 
 
-def is_valid_json(json_string):
-    try:
-        json.loads(json_string)
-        return True
-    except json.JSONDecodeError:
-        return False
-
+def generate_prompts(theme, examples, model, amount, max_retries=3, backoff=None, tokens=None, structured=None):
+    """Request one batch and return its prompts.
 
-def generate_prompts(theme, examples, model, amount, max_retries=3):
+    Fenced or truncated responses are salvaged instead of retried; only a
+    response with no usable prompt costs another request.
+    """
     process_prompt = (
         BASE_PROMPT.replace("$THEME", theme)
         .replace("$EXAMPLES", examples)
         .replace("$AMOUNT", str(amount))
     )
+    backoff = backoff or AdaptiveBackoff(base_delay=1.0)
+    structured = structured or StructuredOutput()
 
     for attempt in range(max_retries):
+        # Only sleeps if the provider has recently throttled us
+        backoff.wait()
         try:
-            response = client.chat.completions.create(
+            response = structured.create(
+                client,
                 model=model,
                 messages=[{"role": "system", "content": process_prompt}],
             )
+            if tokens is not None:
+                tokens.add(response)
             content = response.choices[0].message.content
+            backoff.succeeded()
 
-            if is_valid_json(content):
-                return content
-            else:
-                print(content)
-                print(f"Attempt {attempt + 1}: Invalid JSON response. Retrying...")
+            prompts, complete = extract_prompts(content)
+            if prompts:
+                if not complete:
+                    print(f"Salvaged {len(prompts)} of {amount} prompts from a malformed response")
+                return prompts
+            print(content)
+            print(f"Attempt {attempt + 1}: No prompts in response. Retrying...")
         except Exception as e:
             print(f"Attempt {attempt + 1}: Error occurred: {str(e)}. Retrying...")
-
-        if attempt < max_retries - 1:
-            time.sleep(1)  # Wait for 1 second before retrying
+            if attempt < max_retries - 1:
+                if is_rate_limit_error(e):
+                    backoff.throttled(retry_after_seconds(e))
+                else:
+                    backoff.failed(attempt)
 
     raise Exception(f"Failed to generate valid prompts after {max_retries} attempts.")
 
@@ -83,12 +103,47 @@ def generate_multiple_prompts(
     amount: int,
     repeats: int,
     max_retries: int = 3,
+    max_in_flight: int = 4,
+    writer: IncrementalJSONWriter = None,
+    novelty: NoveltyFilter = None,
+    target: int = None,
+    tokens: TokenCounter = None,
+    structured: StructuredOutput = None,
 ) -> List[str]:
+    """Generate batches concurrently, optionally filtering duplicates until `target` unique prompts.
+
+    Without a target, exactly `repeats` batches are requested; with one,
+    `repeats` is the maximum number of batches.
+    """
     all_prompts = []
-    for _ in tqdm(range(repeats), desc="Generating prompts", unit="batch"):
-        prompts_json = generate_prompts(theme, examples, model, amount, max_retries)
-        prompts = json.loads(prompts_json)["prompts"]
+    backoff = AdaptiveBackoff(base_delay=1.0)
+    structured = structured or StructuredOutput()
+
+    def generate_batch():
+        return generate_prompts(
+            theme, examples, model, amount, max_retries, backoff, tokens, structured
+        )
+
+    def on_batch(prompts):
+        remaining = None if target is None else max(0, target - len(all_prompts))
+        if novelty is not None:
+            # Stop accepting at the target so trimmed prompts never count as kept
+            prompts = novelty.filter(prompts, remaining)
+        elif remaining is not None:
+            prompts = prompts[:remaining]
         all_prompts.extend(prompts)
+        if writer is not None:
+            writer.write(prompts)
+
+    def should_continue():
+        return target is None or len(all_prompts) < target
+
+    with tqdm(total=repeats, desc="Generating prompts", unit="batch") as progress:
+        failed = run_until(
+            generate_batch, should_continue, repeats, max_in_flight, on_batch, progress
+        )
+    if failed:
+        logging.warning(f"{failed} of {repeats} batches failed")
     return all_prompts
 
 
@@ -122,9 +177,36 @@ def main():
     parser.add_argument(
         "--amount", type=int, default=10, help="Number of prompts to generate per batch"
     )
+    parser.add_argument(
+        "--max_in_flight", type=int, default=4, help="Maximum concurrent requests to the provider"
+    )
+    parser.add_argument(
+        "--json_mode",
+        choices=JSON_MODES,
+        default="schema",
+        help="Structured output to request; falls back automatically if the provider rejects it (default: schema)",
+    )
+    parser.add_argument(
+        "--target",
+        type=int,
+        default=None,
+        help="Keep generating until this many unique prompts are kept (--repeats becomes the batch cap)",
+    )
+    parser.add_argument(
+        "--near_dup_threshold",
+        type=float,
+        default=0.8,
+        help="Drop prompts whose estimated similarity to a kept prompt or example is at least this (default: 0.8)",
+    )
+    parser.add_argument(
+        "--no_dedup", action="store_true", help="Keep duplicate and near-duplicate prompts"
+    )
 
     args = parser.parse_args()
 
+    global client
+    client = antares.limited(client, args.max_in_flight)
+
     logging.basicConfig(
         level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
     )
@@ -144,6 +226,7 @@ def main():
     logging.info(f"Output file: {output_file}")
     logging.info(f"Max retries: {args.max_retries}")
     logging.info(f"Repeats: {args.repeats}")
+    logging.info(f"Max in flight: {args.max_in_flight}")
 
     try:
         with open(examples_file, "r") as f:
@@ -151,14 +234,36 @@ def main():
 
         logging.info(f"Number of examples loaded: {len(examples.splitlines())}")
 
-        all_prompts = generate_multiple_prompts(
-            args.theme, examples, args.model, args.amount, args.repeats, args.max_retries
-        )
+        if args.target and args.repeats * args.amount < args.target:
+            logging.warning(
+                f"--repeats {args.repeats} x --amount {args.amount} cannot reach --target {args.target}"
+            )
+        novelty = None
+        if not args.no_dedup:
+            # Seed with the examples so prompts copying them are dropped too
+            novelty = NoveltyFilter(args.near_dup_threshold, examples.splitlines())
+        tokens = TokenCounter()
+        structured = StructuredOutput(args.json_mode)
 
-        output = {"prompts": all_prompts}
+        # Prompts are streamed to the output file as each batch arrives
+        with IncrementalJSONWriter(output_file) as writer:
+            all_prompts = generate_multiple_prompts(
+                args.theme,
+                examples,
+                args.model,
+                args.amount,
+                args.repeats,
+                args.max_retries,
+                args.max_in_flight,
+                writer,
+                novelty,
+                args.target,
+                tokens,
+                structured,
+            )
 
-        with open(output_file, "w", encoding="utf-8") as f:
-            json.dump(output, f, indent=2)
+        if novelty is not None:
+            logging.info(f"Novelty report: {json.dumps(novelty.report(tokens))}")
 
         logging.info(f"Prompts generated and saved to {output_file}")
         logging.info(f"Total prompts generated: {len(all_prompts)}")
@@ -1,10 +1,25 @@
 from antares import Antares
 import argparse
-import time
 import json
+import random
+import threading
+from array import array
 from typing import List
 from tqdm import tqdm
 import logging
+from prompt_batching import (
+    AdaptiveBackoff,
+    IncrementalJSONWriter,
+    JSON_MODES,
+    NoveltyFilter,
+    StructuredOutput,
+    TokenCounter,
+    extract_prompts,
+    is_rate_limit_error,
+    retry_after_seconds,
+    run_until,
+)
+from dedup_txt_lines import CompactHashSet, hash_lines
 import os
 import re
 
@@ -39,75 +54,228 @@ You need to answer in the following JSON format:
 """
 
 
-def is_valid_json(json_string):
-    try:
-        json.loads(json_string)
-        return True
-    except json.JSONDecodeError:
-        return False
-
+def generate_prompts(theme, examples, model, amount, max_retries=3, wait_time=2, backoff=None, tokens=None, structured=None):
+    """Request one batch and return its prompts.
 
-def generate_prompts(theme, examples, model, amount, max_retries=3, wait_time=2):
+    Fenced or truncated responses are salvaged instead of retried; only a
+    response with no usable prompt costs another request.
+    """
     process_prompt = (
         BASE_PROMPT.replace("$THEME", theme)
         .replace("$EXAMPLES", examples)
         .replace("$AMOUNT", str(amount))
     )
+    # wait_time is the starting delay once the provider throttles; no fixed sleeps
+    backoff = backoff or AdaptiveBackoff(base_delay=wait_time)
+    structured = structured or StructuredOutput()
 
     for attempt in range(max_retries):
+        backoff.wait()
         try:
-            response = client.chat.completions.create(
+            response = structured.create(
+                client,
                 model=model,
                 messages=[{"role": "system", "content": process_prompt}],
             )
+            if tokens is not None:
+                tokens.add(response)
             content = response.choices[0].message.content
-
-            if is_valid_json(content):
-                return content
-            else:
-                print(content)
-                print(f"Attempt {attempt + 1}: Invalid JSON response. Retrying...")
+            backoff.succeeded()
+
+            prompts, complete = extract_prompts(content)
+            if prompts:
+                if not complete:
+                    print(f"Salvaged {len(prompts)} of {amount} prompts from a malformed response")
+                return prompts
+            print(content)
+            print(f"Attempt {attempt + 1}: No prompts in response. Retrying...")
         except Exception as e:
             print(f"Attempt {attempt + 1}: Error occurred: {str(e)}. Retrying...")
-
-        if attempt < max_retries - 1:
-            time.sleep(wait_time)  # Wait for the specified time before retrying
+            if attempt < max_retries - 1:
+                if is_rate_limit_error(e):
+                    backoff.throttled(retry_after_seconds(e))
+                else:
+                    backoff.failed(attempt)
 
     raise Exception(f"Failed to generate valid prompts after {max_retries} attempts.")
 
 
-def read_text_files(input_path: str) -> str:
-    all_text = []
+def list_example_files(input_path: str) -> List[str]:
     if os.path.isfile(input_path):
-        with open(input_path, "r", encoding="utf-8") as f:
-            all_text.append(f.read())
-    elif os.path.isdir(input_path):
-        for filename in os.listdir(input_path):
-            if filename.endswith(".txt"):
-                with open(
-                    os.path.join(input_path, filename), "r", encoding="utf-8"
-                ) as f:
-                    all_text.append(f.read())
-    else:
-        raise ValueError(f"Invalid input path: {input_path}")
-    return "\n".join(all_text)
+        return [input_path]
+    if os.path.isdir(input_path):
+        return sorted(
+            os.path.join(input_path, name)
+            for name in os.listdir(input_path)
+            if name.endswith(".txt")
+        )
+    raise ValueError(f"Invalid input path: {input_path}")
+
+
+def estimate_tokens(num_bytes: int) -> int:
+    # ~4 bytes per token is close enough for budgeting English captions
+    return max(1, (num_bytes + 3) // 4)
+
+
+class ExampleSampler:
+    """Index of example lines (file, offset, length) built once; samples a budgeted subset per batch.
+
+    Only offsets are kept in memory, so the index stays small however large
+    the example folder is. Lines are read back with a seek when sampled.
+    """
+
+    def __init__(self, input_path, token_budget=2000, strategy="stratified", seed=None):
+        self.token_budget = token_budget
+        self.strategy = strategy
+        self.paths = list_example_files(input_path)
+        self.file_ids = array("I")
+        self.offsets = array("Q")
+        self.lengths = array("I")
+        # (start, end) index range of each file's lines, used for stratified sampling
+        self.ranges = []
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self._build()
+
+    def _build(self):
+        seen = CompactHashSet()
+        for file_id, path in enumerate(self.paths):
+            start = len(self.offsets)
+            offset = 0
+            candidates = []
+            with open(path, "rb") as f:
+                for raw in f:
+                    line = raw.strip()
+                    if line:
+                        candidates.append((line, offset + raw.index(line[:1])))
+                    offset += len(raw)
+            # One vectorized insert per file instead of one per line
+            novel = seen.add_many(
+                hash_lines([line.decode("utf-8", "replace") for line, _ in candidates])
+            )
+            for (line, line_offset), new in zip(candidates, novel):
+                if new:
+                    self.file_ids.append(file_id)
+                    self.offsets.append(line_offset)
+                    self.lengths.append(len(line))
+            if len(self.offsets) > start:
+                self.ranges.append((start, len(self.offsets)))
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def _candidates(self):
+        """Yield distinct random line indices; cost depends on the sample, not the corpus."""
+        total = len(self.offsets)
+        stratified = self.strategy == "stratified" and len(self.ranges) > 1
+        seen = set()
+        with self.lock:
+            rng = random.Random(self.rng.random())
+        ranges = list(self.ranges)
+        # Give up on finding unseen lines after a few collisions per line available
+        attempts = 4 * total
+        while len(seen) < total and attempts > 0:
+            if stratified:
+                # Round-robin over files in random order so no single file dominates
+                rng.shuffle(ranges)
+                picks = [rng.randrange(start, end) for start, end in ranges]
+            else:
+                picks = [rng.randrange(total)]
+            for index in picks:
+                attempts -= 1
+                if index not in seen:
+                    seen.add(index)
+                    yield index
+
+    def sample(self) -> str:
+        """Return a random set of example lines whose estimated size fits the token budget."""
+        chosen = []
+        remaining = self.token_budget
+        misses = 0
+        for index in self._candidates():
+            cost = estimate_tokens(self.lengths[index] + 1)
+            if cost <= remaining:
+                chosen.append(index)
+                remaining -= cost
+                misses = 0
+            else:
+                misses += 1
+            if remaining <= 0 or misses >= 32:
+                break
+        return "\n".join(self._read(chosen))
+
+    def _read(self, indices):
+        by_file = {}
+        for index in indices:
+            by_file.setdefault(self.file_ids[index], []).append(index)
+        lines = {}
+        for file_id, file_indices in by_file.items():
+            with open(self.paths[file_id], "rb") as f:
+                for index in sorted(file_indices, key=self.offsets.__getitem__):
+                    f.seek(self.offsets[index])
+                    lines[index] = f.read(self.lengths[index]).decode("utf-8", "replace")
+        return [lines[index] for index in indices]
 
 
 def generate_multiple_prompts(
     theme: str,
-    examples: str,
+    examples: ExampleSampler,
     model: str,
     amount: int,
     repeats: int,
     max_retries: int = 3,
     wait_time: float = 2.0,
+    max_in_flight: int = 4,
+    writer: IncrementalJSONWriter = None,
+    novelty: NoveltyFilter = None,
+    target: int = None,
+    tokens: TokenCounter = None,
+    structured: StructuredOutput = None,
 ) -> List[str]:
+    """Generate batches concurrently, optionally filtering duplicates until `target` unique prompts.
+
+    `examples` may be a fixed string or an ExampleSampler, which gives each
+    batch its own sample.
+
+    Without a target, exactly `repeats` batches are requested; with one,
+    `repeats` is the maximum number of batches.
+    """
     all_prompts = []
-    for _ in tqdm(range(repeats), desc="Generating prompts", unit="batch"):
-        prompts_json = generate_prompts(theme, examples, model, amount, max_retries, wait_time)
-        prompts = json.loads(prompts_json)["prompts"]
+    backoff = AdaptiveBackoff(base_delay=wait_time)
+    structured = structured or StructuredOutput()
+
+    def generate_batch():
+        batch_examples = (
+            examples.sample() if isinstance(examples, ExampleSampler) else examples
+        )
+        prompts = generate_prompts(
+            theme, batch_examples, model, amount, max_retries, wait_time, backoff, tokens, structured
+        )
+        return batch_examples, prompts
+
+    def on_batch(result):
+        batch_examples, prompts = result
+        remaining = None if target is None else max(0, target - len(all_prompts))
+        if novelty is not None:
+            # Seed with the examples this batch saw, so prompts copying them are dropped
+            novelty.seed(batch_examples.splitlines())
+            # Stop accepting at the target so trimmed prompts never count as kept
+            prompts = novelty.filter(prompts, remaining)
+        elif remaining is not None:
+            prompts = prompts[:remaining]
         all_prompts.extend(prompts)
-        time.sleep(wait_time)  # Wait between batches
+        if writer is not None:
+            writer.write(prompts)
+
+    def should_continue():
+        return target is None or len(all_prompts) < target
+
+    with tqdm(total=repeats, desc="Generating prompts", unit="batch") as progress:
+        failed = run_until(
+            generate_batch, should_continue, repeats, max_in_flight, on_batch, progress
+        )
+    if failed:
+        logging.warning(f"{failed} of {repeats} batches failed")
     return all_prompts
 
 
@@ -146,11 +314,51 @@ def main():
         "--wait_time",
         type=float,
         default=2.0,
-        help="Wait time in seconds between requests (default: 2.0)",
+        help="Initial backoff in seconds once the provider throttles requests (default: 2.0)",
+    )
+    parser.add_argument(
+        "--max_in_flight", type=int, default=4, help="Maximum concurrent requests to the provider"
+    )
+    parser.add_argument(
+        "--json_mode",
+        choices=JSON_MODES,
+        default="schema",
+        help="Structured output to request; falls back automatically if the provider rejects it (default: schema)",
     )
+    parser.add_argument(
+        "--target",
+        type=int,
+        default=None,
+        help="Keep generating until this many unique prompts are kept (--repeats becomes the batch cap)",
+    )
+    parser.add_argument(
+        "--near_dup_threshold",
+        type=float,
+        default=0.8,
+        help="Drop prompts whose estimated similarity to a kept prompt or example is at least this (default: 0.8)",
+    )
+    parser.add_argument(
+        "--no_dedup", action="store_true", help="Keep duplicate and near-duplicate prompts"
+    )
+    parser.add_argument(
+        "--example_tokens",
+        type=int,
+        default=2000,
+        help="Approximate token budget for the examples sampled into each request (default: 2000)",
+    )
+    parser.add_argument(
+        "--sampling",
+        choices=["stratified", "random"],
+        default="stratified",
+        help="Sample examples evenly across files (stratified) or uniformly across all lines",
+    )
+    parser.add_argument("--seed", type=int, default=None, help="Random seed for example sampling")
 
     args = parser.parse_args()
 
+    global client
+    client = antares.limited(client, args.max_in_flight)
+
     if not args.output:
         sanitized_theme = sanitize_filename(args.theme)
         args.output = f"{sanitized_theme}_prompts.json"
@@ -159,7 +367,9 @@ def main():
         level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
     )
 
-    examples = read_text_files(args.input_path)
+    examples = ExampleSampler(
+        args.input_path, args.example_tokens, args.sampling, args.seed
+    )
 
     logging.info("Initial Information:")
     logging.info(f"Theme: {args.theme}")
@@ -170,24 +380,47 @@ def main():
     )  # Changed from args.output_file to args.output
     logging.info(f"Max retries: {args.max_retries}")
     logging.info(f"Repeats: {args.repeats}")
-    logging.info(f"Number of characters in examples: {len(examples)}")
-    logging.info(f"Wait time between requests: {args.wait_time} seconds")
+    logging.info(
+        f"Example lines indexed: {len(examples)} from {len(examples.paths)} file(s)"
+    )
+    logging.info(
+        f"Example budget per request: ~{args.example_tokens} tokens ({args.sampling})"
+    )
+    logging.info(f"Initial backoff when throttled: {args.wait_time} seconds")
+    logging.info(f"Max in flight: {args.max_in_flight}")
 
     try:
-        all_prompts = generate_multiple_prompts(
-            args.theme,
-            examples,
-            args.model,
-            args.amount,
-            args.repeats,
-            args.max_retries,
-            args.wait_time,
-        )
-
-        output = {"prompts": all_prompts}
+        if args.target and args.repeats * args.amount < args.target:
+            logging.warning(
+                f"--repeats {args.repeats} x --amount {args.amount} cannot reach --target {args.target}"
+            )
+        novelty = None
+        if not args.no_dedup:
+            # Seeded per batch with the sampled examples, not the whole corpus
+            novelty = NoveltyFilter(args.near_dup_threshold)
+        tokens = TokenCounter()
+        structured = StructuredOutput(args.json_mode)
+
+        # Prompts are streamed to the output file as each batch arrives
+        with IncrementalJSONWriter(args.output) as writer:
+            all_prompts = generate_multiple_prompts(
+                args.theme,
+                examples,
+                args.model,
+                args.amount,
+                args.repeats,
+                args.max_retries,
+                args.wait_time,
+                args.max_in_flight,
+                writer,
+                novelty,
+                args.target,
+                tokens,
+                structured,
+            )
 
-        with open(args.output, "w", encoding="utf-8") as f:
-            json.dump(output, f, indent=2)
+        if novelty is not None:
+            logging.info(f"Novelty report: {json.dumps(novelty.report(tokens))}")
 
         logging.info(f"Prompts generated and saved to {args.output}")
         logging.info(f"Total prompts generated: {len(all_prompts)}")
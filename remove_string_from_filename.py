@@ -1,8 +1,8 @@
 import os
 import sys
 import argparse
-from concurrent.futures import ThreadPoolExecutor
-from tqdm import tqdm
+
+from rename_planner import RenameConflictError, apply_renames, default_journal_path
 
 
 def process_file(file_path, match_string, replacement):
@@ -11,27 +11,26 @@ def process_file(file_path, match_string, replacement):
     new_file_path = os.path.join(directory, new_filename)
 
     if filename != new_filename:
+        if os.path.lexists(new_file_path):
+            raise RenameConflictError([f"{file_path} -> {new_file_path}: target already exists"])
         os.rename(file_path, new_file_path)
     return new_file_path
 
 
-def process_directory(directory, match_string, replacement):
+def process_directory(directory, match_string, replacement, journal_path=None, dry_run=False, workers=None):
+    # Collect the whole tree first so nothing is renamed while os.walk is still running
     files_to_process = []
     for root, _, files in os.walk(directory):
         for file in files:
             files_to_process.append(os.path.join(root, file))
 
-    with ThreadPoolExecutor() as executor:
-        list(
-            tqdm(
-                executor.map(
-                    lambda f: process_file(f, match_string, replacement),
-                    files_to_process,
-                ),
-                total=len(files_to_process),
-                desc="Processing files",
-            )
-        )
+    return apply_renames(
+        files_to_process,
+        lambda filename: filename.replace(match_string, replacement),
+        journal_path,
+        workers,
+        dry_run,
+    )
 
 
 def main():
@@ -41,16 +40,36 @@ def main():
     parser.add_argument(
         "replacement", help="Replacement string (use empty quotes for removal)"
     )
+    parser.add_argument(
+        "--journal",
+        default=None,
+        help="Rename journal path for rollback (default: a new timestamped file in ~/.rename_journals)",
+    )
+    parser.add_argument("--dry-run", action="store_true", help="Only print the planned renames")
+    parser.add_argument("--workers", type=int, default=None, help="Number of rename threads")
     args = parser.parse_args()
 
-    if os.path.isfile(args.input):
-        new_file_path = process_file(args.input, args.match_string, args.replacement)
-        print(f"Processed file: {new_file_path}")
-    elif os.path.isdir(args.input):
-        process_directory(args.input, args.match_string, args.replacement)
-        print("Finished processing directory")
-    else:
-        print(f"Error: {args.input} is not a valid file or directory")
+    try:
+        if os.path.isfile(args.input):
+            new_file_path = process_file(args.input, args.match_string, args.replacement)
+            print(f"Processed file: {new_file_path}")
+        elif os.path.isdir(args.input):
+            journal_path = args.journal or default_journal_path(args.input)
+            process_directory(
+                args.input,
+                args.match_string,
+                args.replacement,
+                journal_path,
+                args.dry_run,
+                args.workers,
+            )
+            print("Finished processing directory")
+        else:
+            print(f"Error: {args.input} is not a valid file or directory")
+            sys.exit(1)
+    except RenameConflictError as e:
+        for conflict in e.conflicts:
+            print(f"Conflict: {conflict}")
         sys.exit(1)
 
 
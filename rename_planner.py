@@ -0,0 +1,222 @@
+import argparse
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from tqdm import tqdm
+
+
+# Journals live outside the data folders so they are never renamed or packed as data
+JOURNAL_DIR = os.path.join(os.path.expanduser("~"), ".rename_journals")
+
+
+def default_journal_path(folder):
+    """A new timestamped journal path for a batch rename of folder."""
+    name = os.path.basename(os.path.normpath(os.path.abspath(folder))) or "root"
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    return os.path.join(JOURNAL_DIR, f"{name}-{stamp}-{uuid.uuid4().hex[:6]}.jsonl")
+
+
+class RenameConflictError(Exception):
+    def __init__(self, conflicts):
+        self.conflicts = conflicts
+        super().__init__(f"{len(conflicts)} rename conflict(s), first: {conflicts[0]}")
+
+
+def plan_renames(paths, rename_fn):
+    """Compute the full old -> new mapping and check it before touching the disk.
+
+    rename_fn gets a filename and returns the new filename. Returns
+    (mapping, conflicts); conflicts lists human-readable problems such as two
+    files mapping to the same name or a target that already exists.
+    """
+    mapping = {}
+    for path in paths:
+        directory, filename = os.path.split(path)
+        new_filename = rename_fn(filename)
+        if new_filename != filename:
+            mapping[path] = os.path.join(directory, new_filename)
+
+    conflicts = []
+    targets = {}
+    for old, new in mapping.items():
+        if not os.path.basename(new):
+            conflicts.append(f"{old}: new name is empty")
+            continue
+        key = os.path.normcase(new)
+        if key in targets:
+            conflicts.append(f"{old} and {targets[key]} would both become {new}")
+        targets[key] = old
+
+    sources = {os.path.normcase(old) for old in mapping}
+    for old, new in mapping.items():
+        # An existing target is fine only if it is itself renamed away in this batch
+        if os.path.lexists(new) and os.path.normcase(new) not in sources:
+            conflicts.append(f"{old} -> {new}: target already exists")
+
+    return mapping, conflicts
+
+
+def needs_two_phase(mapping):
+    """True when some target is also a source (chains like a->b->c, or cycles)."""
+    sources = {os.path.normcase(old) for old in mapping}
+    return any(os.path.normcase(new) in sources for new in mapping.values())
+
+
+class Journal:
+    """Append-only JSONL log of completed renames, used for rollback.
+
+    Each run starts with a header line, so reusing a journal path appends a
+    new run instead of overwriting the previous one.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.file = None
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self.file = open(path, "a", encoding="utf-8")
+            header = {"run": uuid.uuid4().hex, "started": time.strftime("%Y-%m-%dT%H:%M:%S")}
+            self.file.write(json.dumps(header) + "\n")
+            self.file.flush()
+
+    def record(self, src, dst):
+        if self.file is None:
+            return
+        with self.lock:
+            self.file.write(json.dumps({"src": src, "dst": dst}) + "\n")
+            self.file.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+
+def _run_phase(pairs, journal, workers, desc):
+    def rename(pair):
+        src, dst = pair
+        os.rename(src, dst)
+        journal.record(src, dst)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(tqdm(executor.map(rename, pairs), total=len(pairs), desc=desc))
+
+
+def execute_plan(mapping, journal_path=None, workers=None):
+    """Run the renames in parallel, logging each one to the journal.
+
+    When targets overlap sources, every file is first moved to a unique temp
+    name in its own folder so that no rename can clobber a pending source.
+    """
+    journal = Journal(journal_path)
+    try:
+        if needs_two_phase(mapping):
+            temps = {
+                old: os.path.join(os.path.dirname(old), f".rename-{uuid.uuid4().hex}")
+                for old in mapping
+            }
+            _run_phase(list(temps.items()), journal, workers, "Staging renames")
+            _run_phase(
+                [(temps[old], new) for old, new in mapping.items()],
+                journal,
+                workers,
+                "Renaming files",
+            )
+        else:
+            _run_phase(list(mapping.items()), journal, workers, "Renaming files")
+    finally:
+        journal.close()
+
+
+def read_journal_runs(journal_path):
+    """Return the journal's runs, oldest first, each as a list of rename entries."""
+    runs = [[]]
+    with open(journal_path, "r", encoding="utf-8") as file:
+        for line in file:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if "run" in entry:
+                runs.append([])
+            else:
+                runs[-1].append(entry)
+    return [run for run in runs if run]
+
+
+def rollback(journal_path, all_runs=False):
+    """Undo the renames of the journal's last run (or every run), newest first."""
+    runs = read_journal_runs(journal_path)
+    if not runs:
+        print("Nothing to roll back")
+        return 0
+    entries = [entry for run in runs for entry in run] if all_runs else runs[-1]
+
+    restored = 0
+    for entry in reversed(entries):
+        if os.path.lexists(entry["dst"]) and not os.path.lexists(entry["src"]):
+            os.rename(entry["dst"], entry["src"])
+            restored += 1
+        else:
+            print(f"Cannot restore {entry['src']} from {entry['dst']}")
+
+    print(f"Rolled back {restored} of {len(entries)} renames")
+    return restored
+
+
+def apply_renames(paths, rename_fn, journal_path=None, workers=None, dry_run=False):
+    """Plan, check and execute a batch rename. Raises RenameConflictError on conflicts."""
+    if journal_path:
+        # Never rename the journal itself
+        journal_abs = os.path.abspath(journal_path)
+        paths = [path for path in paths if os.path.abspath(path) != journal_abs]
+
+    mapping, conflicts = plan_renames(paths, rename_fn)
+    if conflicts:
+        raise RenameConflictError(conflicts)
+
+    if dry_run:
+        for old, new in mapping.items():
+            print(f"{old} -> {new}")
+    elif mapping:
+        try:
+            execute_plan(mapping, journal_path, workers)
+        except Exception as e:
+            # Never leave the folder half renamed: undo whatever this run completed
+            print(f"Rename failed: {e}")
+            if not journal_path:
+                print("No journal was kept, so the completed renames cannot be rolled back")
+                raise
+            print("Rolling back the renames that completed")
+            try:
+                rollback(journal_path)
+            except OSError as rollback_error:
+                print(f"Rollback failed: {rollback_error}")
+                print(f"Finish it with: rename_planner.py rollback {journal_path}")
+            raise
+
+    verb = "Would rename" if dry_run else "Renamed"
+    print(f"{verb} {len(mapping)} of {len(paths)} files")
+    if journal_path and mapping and not dry_run:
+        print(f"Journal written to {journal_path} (undo with: rename_planner.py rollback {journal_path})")
+    return mapping
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Roll back a batch rename from its journal")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    rollback_parser = subparsers.add_parser("rollback", help="Undo the renames in a journal")
+    rollback_parser.add_argument("journal", help="Path to the rename journal (.jsonl)")
+    rollback_parser.add_argument(
+        "--all", action="store_true", help="Undo every run in the journal, not just the last"
+    )
+    args = parser.parse_args()
+
+    if args.command == "rollback":
+        rollback(args.journal, args.all)
+
+
+if __name__ == "__main__":
+    main()
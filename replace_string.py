@@ -1,31 +1,34 @@
 import argparse
 import os
 
+from caption_edit import edit_file, edit_folder, print_summary, replace_op
+from caption_store import edit_store, is_caption_store
+
 def replace_string_in_file(file_path, search_string, replace_string):
-    # Open and read the file
-    with open(file_path, 'r', encoding='utf-8') as file:
-        filedata = file.read()
-    
-    # Replace the target string
-    filedata = filedata.replace(search_string, replace_string)
-    
-    # Write the file out again
-    with open(file_path, 'w', encoding='utf-8') as file:
-        file.write(filedata)
+    # Single read, atomic write
+    return edit_file(file_path, [replace_op(search_string, replace_string)])
 
-def replace_in_txt_files(folder_path, search_string, replace_string):
-    for filename in os.listdir(folder_path):
-        if filename.endswith('.txt'):
-            file_path = os.path.join(folder_path, filename)
-            replace_string_in_file(file_path, search_string, replace_string)
-            print(f"Replaced in {filename}")
+def replace_in_txt_files(folder_path, search_string, replace_string, dry_run=False, workers=None):
+    operations = [replace_op(search_string, replace_string)]
+    # folder_path may also be a packed caption store
+    if is_caption_store(folder_path):
+        results = edit_store(folder_path, operations, dry_run)
+    else:
+        results = edit_folder(folder_path, operations, dry_run=dry_run, workers=workers)
+    for result in results:
+        if result["changed"] and not dry_run:
+            print(f"Replaced in {os.path.basename(result['path'])}")
+    print_summary(results, dry_run)
+    return results
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Replace a string in all .txt files within a specified directory.")
-    parser.add_argument("folder_path", type=str, help="The path to the directory containing .txt files")
+    parser.add_argument("folder_path", type=str, help="The path to the directory containing .txt files, or a caption store")
     parser.add_argument("search_string", type=str, help="The string to search for")
     parser.add_argument("replace_string", type=str, help="The string to replace the search string with")
+    parser.add_argument("--dry-run", action="store_true", help="Show a diff summary without writing")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker threads")
     
     args = parser.parse_args()
     
-    replace_in_txt_files(args.folder_path, args.search_string, args.replace_string)
+    replace_in_txt_files(args.folder_path, args.search_string, args.replace_string, args.dry_run, args.workers)